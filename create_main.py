@@ -20,6 +20,7 @@
 # - @ref dhcp_server.py "dhcp_server.py": Реализует функционал DHCP сервера.
 # - @ref dns_server.py "dns_server.py": Реализует функционал DNS сервера.
 # - @ref configuration.json "configuration.json": Содержит параметры конфигурации для DHCP и DNS серверов.
+# - @ref dhcp_subnets.example.json "dhcp_subnets.example.json": Пример подсетей за relay-агентами (DHCP_SUBNETS) для configuration.json.
 # - @ref domain_dns_name_ip.json "domain_dns_name_ip.json": Содержит список доменов и их IP для DNS сервера.
 
 ## @package mininet.net
@@ -0,0 +1,1451 @@
+##@file dhcp_benchmark.py
+##@brief Симулятор шторма DHCP-клиентов и бенчмарк пропускной способности выдачи аренд.
+#
+# Тысячи клиентов с уникальными MAC-адресами и xid проходят полный обмен
+# DISCOVER/OFFER/REQUEST/ACK с сервером dhcp_server.py, запущенным во временном
+# каталоге на loopback (без Mininet). После выдачи аренд часть клиентов
+# продлевает аренду, часть перезагружается (INIT-REBOOT REQUEST или новый
+# DORA - ожидается прежний адрес), часть запрашивает адрес, уже выданный
+# другому клиенту, часть освобождает адрес (DHCPRELEASE).
+# Отчет: аренд в секунду, процентили задержки DORA, доля NAK и количество
+# адресов, выданных двум разным клиентам.
+#
+# Все симулируемые клиенты используют один UDP-сокет на порту сервера + 1:
+# сервер отвечает на широковещательный адрес подсети (127.255.255.255 для
+# 127.0.0.1/8), ответы сопоставляются с клиентами по xid. Для проверки на паре
+# veth задайте адрес сервера (--server-address) и адрес привязки клиента (--bind),
+# а подсеть сервера - через IP_DHCP/MASK_DHCP в --config.
+#
+# Запуск: python3 dhcp_benchmark.py storm [--clients N] [--pool-size N] [--concurrency N]
+#                                         [--renew P] [--reboot P] [--rediscover P] [--conflicts P]
+#                                         [--release P] [--duplicate P] [--async] [--output results.jsonl]
+#         python3 dhcp_benchmark.py allocator [--sizes 256 4096 65534] [--utilisation P]
+#         python3 dhcp_benchmark.py journal [--leases 1000 10000 65534] [--crash-rounds N]
+#         python3 dhcp_benchmark.py expiry [--leases 1000 10000 65534]
+#         python3 dhcp_benchmark.py codec [--rounds N] [--iterations N]
+#         python3 dhcp_benchmark.py subnets [--counts 1 10 100 1000 10000] [--lookups N] [--relays N]
+#         python3 dhcp_benchmark.py dyndns [--clients N] [--batches 1 16 256] [--async]
+
+import argparse
+##@package argparse
+#Модуль для разбора аргументов командной строки.
+
+import asyncio
+##@package asyncio
+#Модуль асинхронного ввода-вывода (симулируемые клиенты).
+
+import binascii
+##@package binascii
+#Модуль для преобразования пакетов в hex (прежний кодек PakageDhcp).
+
+import datetime
+##@package datetime
+#Модуль для отметки времени в результатах.
+
+import ipaddress
+##@package ipaddress
+#Модуль для вычисления диапазона адресов пула.
+
+import json
+##@package json
+#Модуль для записи результатов в формате JSON Lines.
+
+import multiprocessing
+##@package multiprocessing
+#Модуль для процесса записи журнала аренд, завершаемого SIGKILL (проверка восстановления).
+
+import os
+##@package os
+#Модуль для работы с файловой системой.
+
+import platform
+##@package platform
+#Модуль для описания машины в результатах.
+
+import random
+##@package random
+#Модуль для генерации xid.
+
+import shutil
+##@package shutil
+#Модуль для удаления временного каталога сервера.
+
+import signal
+##@package signal
+#Модуль для остановки сервера по SIGINT (с записью лога).
+
+import socket
+##@package socket
+#Модуль для сокетов relay-агентов в проверке выдачи адресов через relay.
+
+import struct
+##@package struct
+#Модуль для сборки и разбора DHCP-пакетов.
+
+import subprocess
+##@package subprocess
+#Модуль для запуска тестируемого DHCP-сервера.
+
+import sys
+##@package sys
+#Модуль для работы с системными функциями и параметрами.
+
+import tempfile
+##@package tempfile
+#Модуль для создания временного рабочего каталога сервера.
+
+import time
+##@package time
+#Модуль для измерения времени.
+
+import server_stats
+##@package server_stats
+#Гистограммы задержек и чтение метрик сервера.
+
+import dhcp_leases
+##@package dhcp_leases
+#Пул адресов и хранилище аренд DHCP-сервера.
+
+import dhcp_server
+##@package dhcp_server
+#Прежнее сохранение аренд (write_to_json_file) для сравнения с журналом.
+
+import dns_zone
+##@package dns_zone
+#Зона имен клиентов DHCP (DynamicZone) для замера применения событий аренд.
+
+import dns_benchmark
+##@package dns_benchmark
+#Запуск dns_server.py и заглушки вышестоящего сервера для проверки регистрации имен.
+
+from dns_benchmark import latency_summary_ms, measure, process_tree_cpu_seconds, source_revision
+##@package dns_benchmark
+#Общие функции бенчмарков: сводка гистограммы, CPU дерева процессов, версия исходников.
+
+
+##@brief Каталог с исходными файлами сервера
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+##@brief Формат заголовка BOOTP (op ... file) и магическое число опций DHCP
+DHCP_HEADER = struct.Struct('!BBBBIHHIIII16s64s128s')
+DHCP_MAGIC_COOKIE = b'\x63\x82\x53\x63'
+##@brief Длина заголовка вместе с магическим числом: с нее начинаются опции
+DHCP_OPTIONS_OFFSET = DHCP_HEADER.size + len(DHCP_MAGIC_COOKIE)
+##@brief Типы сообщений DHCP (опция 53)
+DHCPDISCOVER, DHCPOFFER, DHCPREQUEST, DHCPDECLINE, DHCPACK, DHCPNAK, DHCPRELEASE = 1, 2, 3, 4, 5, 6, 7
+##@brief Порт тестируемого сервера (ответы приходят на порт + 1)
+SERVER_PORT = 16767
+##@brief Адрес точки метрик тестируемого сервера (вместо DHCP_STATS_ADDRESS, чтобы не мешать рабочему серверу)
+BENCHMARK_STATS_ADDRESS = "127.0.0.1:16780"
+##@brief Первый адрес пула на loopback
+POOL_START = ipaddress.IPv4Address("127.1.0.1")
+
+
+##@brief Локально администрируемый MAC-адрес симулируемого клиента
+#@param [in] index Номер клиента
+#@return 6 байт MAC-адреса
+def client_mac(index):
+    return b'\x02' + index.to_bytes(5, 'big')
+
+##@brief Сборка DHCP-запроса клиента
+#@param [in] message_type Тип сообщения (DHCPDISCOVER, DHCPREQUEST, ...)
+#@param [in] xid Идентификатор транзакции
+#@param [in] mac MAC-адрес клиента
+#@param [in] requested_ip Запрашиваемый адрес (опция 50) в виде bytes или None
+#@param [in] server_id Идентификатор сервера (опция 54) в виде bytes или None
+#@param [in] ciaddr Текущий адрес клиента (при продлении аренды) в виде bytes или None
+#@param [in] giaddr Адрес relay-агента в виде bytes или None
+#@param [in] hostname Имя узла (опция 12) в виде bytes или None
+#@return Пакет в виде bytes
+def build_dhcp_request(message_type, xid, mac, requested_ip=None, server_id=None, ciaddr=None, giaddr=None, hostname=None):
+    header = DHCP_HEADER.pack(1, 1, 6, 0, xid, 0, 0, int.from_bytes(ciaddr, 'big') if ciaddr else 0, 0, 0,
+                              int.from_bytes(giaddr, 'big') if giaddr else 0, mac, b'', b'')
+    options = bytearray([53, 1, message_type])
+    if requested_ip is not None:
+        options += bytes([50, 4]) + requested_ip
+    if server_id is not None:
+        options += bytes([54, 4]) + server_id
+    if hostname is not None:
+        options += bytes([12, len(hostname)]) + hostname
+    options.append(255)
+    return header + DHCP_MAGIC_COOKIE + options
+
+##@brief Разбор ответа сервера
+#@param [in] data Пакет
+#@return Кортеж (xid, тип сообщения, yiaddr в виде bytes, идентификатор сервера или None) или None для чужих пакетов
+def parse_dhcp_reply(data):
+    if len(data) < DHCP_OPTIONS_OFFSET or data[0] != 2 or data[DHCP_HEADER.size:DHCP_OPTIONS_OFFSET] != DHCP_MAGIC_COOKIE:
+        return None
+    xid = struct.unpack_from('!I', data, 4)[0]
+    message_type = None
+    server_id = None
+    offset = DHCP_OPTIONS_OFFSET
+    while offset < len(data):
+        code = data[offset]
+        if code == 255:
+            break
+        if code == 0:
+            offset += 1
+            continue
+        if offset + 1 >= len(data):
+            break
+        length = data[offset + 1]
+        value = data[offset + 2:offset + 2 + length]
+        if code == 53 and length == 1:
+            message_type = value[0]
+        elif code == 54 and length == 4:
+            server_id = bytes(value)
+        offset += 2 + length
+    if message_type is None:
+        return None
+    return xid, message_type, bytes(data[16:20]), server_id
+
+
+##@class DhcpStormProtocol
+##@brief Общий сокет симулируемых клиентов: передает ответы ожидающим транзакциям по xid
+# OFFER принимается только транзакцией, ожидающей ответа на DISCOVER: повтор
+# OFFER на повторный DISCOVER не считается ответом на следующий за ним REQUEST.
+class DhcpStormProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.transport = None
+        self.waiters = {}
+        self.unexpected = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        reply = parse_dhcp_reply(data)
+        if reply is None:
+            return
+        future, message_type = self.waiters.get(reply[0], (None, None))
+        if future is None or future.done() or (reply[1] == DHCPOFFER) != (message_type == DHCPDISCOVER):
+            self.unexpected += 1
+            return
+        del self.waiters[reply[0]]
+        future.set_result(reply)
+
+
+##@class DoraStorm
+##@brief Симуляция множества DHCP-клиентов и сбор результатов
+class DoraStorm:
+ #@param [in] server_address Адрес (host, port) сервера
+ #@param [in] bind_address Адрес (host, port), на который сервер отправляет ответы
+ #@param [in] clients Количество клиентов
+ #@param [in] concurrency Количество клиентов, одновременно выполняющих обмен
+ #@param [in] timeout Таймаут ожидания ответа в секундах
+ #@param [in] retries Количество повторных отправок сообщения без ответа
+ #@param [in] attempts Количество попыток DORA (после NAK клиент начинает заново)
+ #@param [in] seed Начальное значение генератора xid
+ #@param [in] duplicate Доля сообщений, отправляемых дважды подряд (ретрансляция клиента, опередившая ответ)
+    def __init__(self, server_address, bind_address, clients, concurrency, timeout=1.0, retries=3, attempts=5, seed=1,
+                 duplicate=0.0):
+        self.server_address = server_address
+        self.bind_address = bind_address
+        self.clients = clients
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.attempts = attempts
+        self.duplicate = duplicate
+        self.random = random.Random(seed)
+        self.used_xids = set()
+        self.protocol = None
+        self.leases = {}
+        self.owners = {}
+        self.counters = dict.fromkeys(("discover", "offer", "request", "ack", "nak", "timeout", "retransmit",
+                                       "failed", "duplicate", "renew_ack", "renew_nak", "renew_failed",
+                                       "conflict_ack", "conflict_nak", "conflict_failed", "reboot_ack", "reboot_nak",
+                                       "reboot_failed", "rediscover_same", "rediscover_moved", "release", "duplicated"), 0)
+        self.dora_time = server_stats.LatencyHistogram()
+        self.offer_time = server_stats.LatencyHistogram()
+        self.ack_time = server_stats.LatencyHistogram()
+        self.renew_time = server_stats.LatencyHistogram()
+
+ ##@brief Новый уникальный xid
+ #@return xid
+    def new_xid(self):
+        while True:
+            xid = self.random.getrandbits(32)
+            if xid not in self.used_xids:
+                self.used_xids.add(xid)
+                return xid
+
+ ##@brief Отправка сообщения с повторами до получения ответа
+ #@param [in] xid Идентификатор транзакции
+ #@param [in] packet Пакет
+ #@return Разобранный ответ (см. parse_dhcp_reply) или None, если ответа нет после всех повторов
+    async def exchange(self, xid, packet):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.counters["retransmit"] += 1
+            future = loop.create_future()
+            self.protocol.waiters[xid] = (future, packet[DHCP_OPTIONS_OFFSET + 2])
+            self.protocol.transport.sendto(packet, self.server_address)
+            if self.duplicate and self.random.random() < self.duplicate:
+                self.counters["duplicated"] += 1
+                self.protocol.transport.sendto(packet, self.server_address)
+            try:
+                return await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                self.protocol.waiters.pop(xid, None)
+        self.counters["timeout"] += 1
+        return None
+
+ ##@brief Учет выданного адреса и проверка, не выдан ли он уже другому клиенту
+ #@param [in] mac MAC-адрес клиента
+ #@param [in] address Выданный адрес
+    def bind(self, mac, address):
+        owner = self.owners.get(address)
+        if owner is not None and owner != mac:
+            self.counters["duplicate"] += 1
+        self.owners[address] = mac
+        previous = self.leases.get(mac)
+        if previous is not None and previous != address and self.owners.get(previous) == mac:
+            del self.owners[previous]
+        self.leases[mac] = address
+
+ ##@brief Полный обмен DISCOVER/OFFER/REQUEST/ACK одного клиента
+ # После NAK клиент начинает обмен заново с новым xid (RFC 2131, 3.1).
+ #@param [in] index Номер клиента
+    async def dora(self, index):
+        mac = client_mac(index)
+        started = time.perf_counter()
+        for _ in range(self.attempts):
+            xid = self.new_xid()
+            self.counters["discover"] += 1
+            sent = time.perf_counter()
+            reply = await self.exchange(xid, build_dhcp_request(DHCPDISCOVER, xid, mac))
+            if reply is None or reply[1] != DHCPOFFER:
+                continue
+            self.counters["offer"] += 1
+            offered = time.perf_counter()
+            self.offer_time.record(int((offered - sent) * 1e9))
+            self.counters["request"] += 1
+            reply = await self.exchange(xid, build_dhcp_request(DHCPREQUEST, xid, mac, reply[2], reply[3]))
+            if reply is None:
+                continue
+            if reply[1] == DHCPACK:
+                finished = time.perf_counter()
+                self.counters["ack"] += 1
+                self.ack_time.record(int((finished - offered) * 1e9))
+                self.dora_time.record(int((finished - started) * 1e9))
+                self.bind(mac, reply[2])
+                return
+            self.counters["nak"] += 1
+        self.counters["failed"] += 1
+
+ ##@brief Продление аренды: REQUEST с адресом клиента в ciaddr и опции 50
+ #@param [in] mac MAC-адрес клиента
+ #@param [in] address Текущий адрес клиента
+    async def renew(self, mac, address):
+        xid = self.new_xid()
+        sent = time.perf_counter()
+        reply = await self.exchange(xid, build_dhcp_request(DHCPREQUEST, xid, mac, address, ciaddr=address))
+        if reply is None:
+            self.counters["renew_failed"] += 1
+        elif reply[1] == DHCPACK:
+            self.counters["renew_ack"] += 1
+            self.renew_time.record(int((time.perf_counter() - sent) * 1e9))
+            self.bind(mac, reply[2])
+        else:
+            self.counters["renew_nak"] += 1
+
+ ##@brief Перезагрузка клиента в состоянии INIT-REBOOT: REQUEST с прежним адресом в опции 50, без ciaddr и опции 54
+ #@param [in] mac MAC-адрес клиента
+ #@param [in] address Прежний адрес клиента
+    async def reboot(self, mac, address):
+        xid = self.new_xid()
+        reply = await self.exchange(xid, build_dhcp_request(DHCPREQUEST, xid, mac, address))
+        if reply is None:
+            self.counters["reboot_failed"] += 1
+        elif reply[1] == DHCPACK and reply[2] == address:
+            self.counters["reboot_ack"] += 1
+            self.bind(mac, reply[2])
+        else:
+            self.counters["reboot_nak"] += 1
+
+ ##@brief Клиент, забывший аренду: новый обмен DORA (ожидается прежний адрес)
+ #@param [in] mac MAC-адрес клиента
+ #@param [in] address Прежний адрес клиента
+    async def rediscover(self, mac, address):
+        await self.dora(int.from_bytes(mac[1:], 'big'))
+        self.counters["rediscover_same" if self.leases.get(mac) == address else "rediscover_moved"] += 1
+
+ ##@brief Конфликтующий запрос: новый клиент просит адрес, уже выданный другому клиенту (ожидается NAK)
+ #@param [in] index Номер нового клиента
+ #@param [in] address Занятый адрес
+    async def conflict(self, index, address):
+        mac = client_mac(index)
+        xid = self.new_xid()
+        reply = await self.exchange(xid, build_dhcp_request(DHCPREQUEST, xid, mac, address))
+        if reply is None:
+            self.counters["conflict_failed"] += 1
+        elif reply[1] == DHCPACK:
+            self.counters["conflict_ack"] += 1
+            self.bind(mac, reply[2])
+        else:
+            self.counters["conflict_nak"] += 1
+
+ ##@brief Освобождение аренды: DHCPRELEASE с адресом клиента в ciaddr (сервер не отвечает)
+ #@param [in] mac MAC-адрес клиента
+ #@param [in] address Текущий адрес клиента
+ #@param [in] server_id Идентификатор сервера (опция 54)
+    def release(self, mac, address, server_id):
+        self.protocol.transport.sendto(build_dhcp_request(DHCPRELEASE, self.new_xid(), mac, server_id=server_id, ciaddr=address),
+                                       self.server_address)
+        self.counters["release"] += 1
+        if self.owners.get(address) == mac:
+            del self.owners[address]
+        del self.leases[mac]
+
+ ##@brief Выполнение задач с ограничением числа одновременно работающих
+ #@param [in] jobs Список функций без аргументов, возвращающих корутины
+    async def run_limited(self, jobs):
+        queue = iter(jobs)
+
+        async def worker():
+            for job in queue:
+                await job()
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(jobs)) or 1)))
+
+ ##@brief Шторм: выдача аренд всем клиентам, затем продления, перезагрузки и конфликтующие запросы, затем освобождения
+ # Продлевающие, перезагружающиеся (INIT-REBOOT и DORA) и освобождающие клиенты
+ # выбираются из разных частей перемешанного списка клиентов с арендой.
+ #@param [in] renew_share Доля клиентов с арендой, продлевающих ее
+ #@param [in] conflict_share Доля клиентов с арендой, адрес которых запрашивает другой клиент
+ #@param [in] release_share Доля клиентов с арендой, освобождающих адрес
+ #@param [in] server_id Идентификатор сервера (опция 54) для DHCPRELEASE
+ #@param [in] reboot_share Доля клиентов с арендой, перезагружающихся в состоянии INIT-REBOOT
+ #@param [in] rediscover_share Доля клиентов с арендой, начинающих DORA заново
+ #@return Словарь с длительностями этапов в секундах
+    async def run(self, renew_share, conflict_share, release_share=0.0, server_id=None, reboot_share=0.0, rediscover_share=0.0):
+        loop = asyncio.get_running_loop()
+        transport, self.protocol = await loop.create_datagram_endpoint(
+            DhcpStormProtocol, local_addr=self.bind_address, allow_broadcast=True, reuse_port=True)
+        try:
+            started = time.perf_counter()
+            await self.run_limited([lambda index=index: self.dora(index) for index in range(self.clients)])
+            dora_seconds = time.perf_counter() - started
+            leased = list(self.leases.items())
+            self.random.shuffle(leased)
+            renewals = leased[:round(len(leased) * renew_share)]
+            conflicts = leased[:round(len(leased) * conflict_share)]
+            reboots = leased[len(renewals):len(renewals) + round(len(leased) * reboot_share)]
+            rediscovers = leased[len(renewals) + len(reboots):len(renewals) + len(reboots) + round(len(leased) * rediscover_share)]
+            started = time.perf_counter()
+            await self.run_limited([lambda mac=mac, address=address: self.renew(mac, address) for mac, address in renewals] +
+                                   [lambda mac=mac, address=address: self.reboot(mac, address) for mac, address in reboots] +
+                                   [lambda mac=mac, address=address: self.rediscover(mac, address) for mac, address in rediscovers] +
+                                   [lambda number=number, address=address: self.conflict(self.clients + number, address)
+                                    for number, (_, address) in enumerate(conflicts)])
+            followup_seconds = time.perf_counter() - started
+            leased = list(self.leases.items())
+            self.random.shuffle(leased)
+            releases = leased[:round(len(leased) * release_share)]
+            for mac, address in releases:
+                self.release(mac, address, server_id)
+        finally:
+            transport.close()
+        return {"dora_seconds": dora_seconds, "followup_seconds": followup_seconds, "renewals": len(renewals),
+                "reboots": len(reboots), "rediscovers": len(rediscovers), "conflicts": len(conflicts), "releases": len(releases)}
+
+
+##@brief Подготовка временного рабочего каталога сервера с конфигурацией пула на loopback
+#@param [in] pool_size Количество адресов пула (начиная с POOL_START)
+#@param [in] overrides Словарь параметров, заменяющих значения из configuration.json
+#@return Путь к каталогу
+def prepare_workdir(pool_size, overrides=None):
+    workdir = tempfile.mkdtemp(prefix="dhcp_benchmark_")
+    with open(os.path.join(PACKAGE_DIR, "configuration.json"), 'r', encoding='utf-8') as file:
+        configuration = json.load(file)
+    configuration.update({"IP_DHCP": "127.0.0.1", "MASK_DHCP": "255.0.0.0", "IP_ROUTER": "127.0.0.1", "IP_DNS": "127.0.0.1",
+                          "START_IP_ADDRESS": str(POOL_START), "START_IP_END": str(POOL_START + pool_size - 1),
+                          "DHCP_STATS_ADDRESS": BENCHMARK_STATS_ADDRESS})
+    configuration.update(overrides or {})
+    with open(os.path.join(workdir, "configuration.json"), 'w', encoding='utf-8') as file:
+        json.dump(configuration, file, indent=4)
+    return workdir
+
+##@brief Запуск dhcp_server.py в отдельном процессе и ожидание готовности по точке метрик
+#@param [in] workdir Рабочий каталог сервера
+#@param [in] port Порт сервера
+#@param [in] use_async Запустить AsyncDHCPServer (--async)
+#@return Объект subprocess.Popen
+def start_server(workdir, port, use_async=False):
+    command = [sys.executable, os.path.join(PACKAGE_DIR, "dhcp_server.py"), "--port", str(port)] + (["--async"] if use_async else [])
+    process = subprocess.Popen(command, cwd=workdir)
+    for _ in range(50):
+        try:
+            server_stats.query_stats(BENCHMARK_STATS_ADDRESS, timeout=0.1)
+            return process
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"DHCP server did not start: {' '.join(command)}")
+
+##@brief Остановка сервера по SIGINT
+#@param [in] process Объект subprocess.Popen
+def stop_server(process):
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+##@brief Прогон шторма против dhcp_server.py с выводом сводки и записью результата в JSON Lines
+#@param [in] options Разобранные аргументы командной строки
+def benchmark_storm(options):
+    overrides = json.loads(options.config) if options.config else {}
+    if options.log_level:
+        overrides["LOG_LEVEL"] = options.log_level
+    workdir = prepare_workdir(options.pool_size, overrides)
+    server = start_server(workdir, options.port, options.use_async) if options.server_address == "127.0.0.1" else None
+    storm = DoraStorm((options.server_address, options.port), (options.bind, options.port + 1), options.clients,
+                      options.concurrency, options.timeout, options.retries, options.attempts, options.seed, options.duplicate)
+    try:
+        cpu_started = process_tree_cpu_seconds(server.pid) if server else 0.0
+        phases = asyncio.run(storm.run(options.renew, options.conflicts, options.release,
+                                       ipaddress.IPv4Address(options.server_address).packed, options.reboot, options.rediscover))
+        server_cpu = process_tree_cpu_seconds(server.pid) - cpu_started if server else None
+        if server and phases["releases"]:
+            time.sleep(0.2)
+        try:
+            snapshot = json.loads(server_stats.query_stats(BENCHMARK_STATS_ADDRESS)) if server else None
+        except (OSError, ValueError):
+            snapshot = None
+    finally:
+        if server:
+            stop_server(server)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    counters = storm.counters
+    requests = counters["request"] + phases["renewals"] + phases["reboots"] + phases["conflicts"]
+    dora_seconds = phases["dora_seconds"]
+    record = {
+        "benchmark": "dhcp_storm",
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        "revision": source_revision(),
+        "host": {"cpus": os.cpu_count(), "python": platform.python_version(), "platform": platform.platform()},
+        "server": "async" if options.use_async else "select",
+        "load": {"clients": options.clients, "pool_size": options.pool_size, "concurrency": options.concurrency,
+                 "renew": options.renew, "reboot": options.reboot, "rediscover": options.rediscover,
+                 "conflicts": options.conflicts, "release": options.release, "timeout": options.timeout,
+                 "retries": options.retries, "attempts": options.attempts, "duplicate": options.duplicate},
+        "dora_seconds": round(dora_seconds, 3),
+        "leases_per_second": round(counters["ack"] / dora_seconds, 1) if dora_seconds else None,
+        "leases": len(storm.leases),
+        "nak_rate": round((counters["nak"] + counters["renew_nak"] + counters["reboot_nak"] + counters["conflict_nak"]) / requests, 4)
+                    if requests else 0.0,
+        "duplicates": counters["duplicate"],
+        "counters": counters,
+        "unexpected_replies": storm.protocol.unexpected,
+        "latency_ms": {"dora": latency_summary_ms(storm.dora_time), "offer": latency_summary_ms(storm.offer_time),
+                       "ack": latency_summary_ms(storm.ack_time), "renew": latency_summary_ms(storm.renew_time)},
+        "server_cpu_seconds": round(server_cpu, 3) if server_cpu is not None else None,
+        "server_stats": snapshot
+    }
+    dora = record["latency_ms"]["dora"]
+    print(f"clients {options.clients}  pool {options.pool_size}  leases {record['leases']}"
+          f"  {record['leases_per_second'] or 0:.0f} leases/s in {dora_seconds:.2f} s")
+    print(f"DORA  p50 {dora['p50']:8.2f} ms  p90 {dora['p90']:8.2f} ms  p99 {dora['p99']:8.2f} ms  max {dora['max']:8.2f} ms")
+    print(f"NAK {counters['nak']} in DORA, renew ack/nak/failed {counters['renew_ack']}/{counters['renew_nak']}/{counters['renew_failed']},"
+          f" conflict ack/nak/failed {counters['conflict_ack']}/{counters['conflict_nak']}/{counters['conflict_failed']}")
+    print(f"INIT-REBOOT ack/nak/failed {counters['reboot_ack']}/{counters['reboot_nak']}/{counters['reboot_failed']},"
+          f" new DORA same/moved address {counters['rediscover_same']}/{counters['rediscover_moved']}")
+    print(f"NAK rate {record['nak_rate']:.2%}  duplicate addresses {counters['duplicate']}  failed clients {counters['failed']}"
+          f"  timeouts {counters['timeout']}  retransmits {counters['retransmit']}")
+    if snapshot:
+        gauges = snapshot.get("gauges", {})
+        server_counters = snapshot.get("counters", {})
+        print(f"released {counters['release']}, server: leases {gauges.get('leases')}  pool utilisation {gauges.get('pool_utilisation')}"
+              f"  release {server_counters.get('release', 0)}  renew {server_counters.get('renew', 0)}")
+        print(f"duplicated messages {counters['duplicated']}, server: lease records {gauges.get('lease_journal_records')}"
+              f"  retransmits answered {server_counters.get('retransmit', 0)}  dropped {server_counters.get('retransmit_dropped', 0)}")
+    if options.output:
+        with open(options.output, 'a', encoding='utf-8') as output:
+            output.write(json.dumps(record) + '\n')
+
+
+##@brief Выбор адреса прежним способом: перебор диапазона с проверкой по списку аренд
+#@param [in] leases Список занятых адресов
+#@param [in] start Первый адрес диапазона
+#@param [in] end Последний адрес диапазона
+#@return Свободный адрес или None
+def legacy_offer(leases, start, end):
+    for ip in range(start, end + 1):
+        if ip not in leases:
+            return ip
+    return None
+
+##@brief Сравнение AddressPool и перебора со списком аренд на пулах разного размера
+# Пул заполняется до заданной доли, затем замеряются выбор адреса для OFFER,
+# занятие освобожденного адреса (release + allocate) и проверка is_free.
+# Прежний способ замеряется только на пулах не больше legacy_max: на /16 один
+# его OFFER занимает секунды.
+#@param [in] sizes Список размеров пула
+#@param [in] utilisation Доля занятых адресов (0..1)
+#@param [in] operations Количество замеряемых операций
+#@param [in] legacy_max Наибольший пул, на котором замеряется прежний способ
+def benchmark_allocator(sizes, utilisation, operations, legacy_max):
+    generator = random.Random(1)
+    start = int(POOL_START)
+    for size in sizes:
+        end = start + size - 1
+        pool = dhcp_leases.AddressPool(start, end, excluded=(start, start + 1))
+        target = int(pool.capacity * utilisation)
+        started = time.perf_counter_ns()
+        for _ in range(target):
+            pool.allocate()
+        fill_ns = (time.perf_counter_ns() - started) / max(1, target)
+        leased = list(pool.leased())
+        probes = [generator.randrange(start, end + 1) for _ in range(operations)]
+        started = time.perf_counter_ns()
+        for _ in range(operations):
+            pool.next_free()
+        offer_ns = (time.perf_counter_ns() - started) / operations
+        started = time.perf_counter_ns()
+        for number in range(operations):
+            address = leased[number % len(leased)] if leased else start
+            pool.release(address)
+            leased[number % len(leased)] = pool.allocate()
+        churn_ns = (time.perf_counter_ns() - started) / operations
+        started = time.perf_counter_ns()
+        for address in probes:
+            pool.is_free(address)
+        free_ns = (time.perf_counter_ns() - started) / operations
+        print(f"pool {size:6d}  {utilisation:.0%} used  AddressPool  fill {fill_ns:9.0f} ns/addr  offer {offer_ns:9.0f} ns"
+              f"  release+allocate {churn_ns:9.0f} ns  is_free {free_ns:9.0f} ns")
+        if size > legacy_max:
+            print(f"pool {size:6d}  {utilisation:.0%} used  list scan    skipped (pool larger than --legacy-max {legacy_max})")
+            continue
+        leases = []
+        started = time.perf_counter_ns()
+        for _ in range(target):
+            leases.append(legacy_offer(leases, start, end))
+        fill_ns = (time.perf_counter_ns() - started) / max(1, target)
+        samples = max(1, min(operations, 200))
+        started = time.perf_counter_ns()
+        for _ in range(samples):
+            legacy_offer(leases, start, end)
+        offer_ns = (time.perf_counter_ns() - started) / samples
+        started = time.perf_counter_ns()
+        for address in probes[:samples]:
+            address not in leases
+        free_ns = (time.perf_counter_ns() - started) / samples
+        print(f"pool {size:6d}  {utilisation:.0%} used  list scan    fill {fill_ns:9.0f} ns/addr  offer {offer_ns:9.0f} ns"
+              f"  {'':26s}is_free {free_ns:9.0f} ns")
+
+
+##@brief Запись журнала для проверки восстановления: детерминированная операция номер sequence
+#@param [in] sequence Номер операции
+#@return Кортеж (mac, ip, start, expiry, state)
+def journal_operation(sequence):
+    start = 1700000000 + sequence
+    state = dhcp_leases.LEASE_RELEASED if sequence % 5 == 4 else dhcp_leases.LEASE_ACTIVE
+    return client_mac(sequence), int(POOL_START) + sequence * 7919 % 4096, start, start + 3600, state
+
+##@brief Тело процесса, пишущего журнал пачками до SIGKILL
+# После каждого commit номер следующей операции публикуется в committed.
+#@param [in] directory Каталог журнала и снимка
+#@param [in] sequence Номер первой операции
+#@param [in] committed multiprocessing.Value с количеством сохраненных операций
+#@param [in] seed Начальное значение генератора размеров пачек
+def journal_writer(directory, sequence, committed, seed):
+    store = dhcp_leases.LeaseStore(os.path.join(directory, "leases.journal"), os.path.join(directory, "leases.snapshot"),
+                                   compact_records=500)
+    generator = random.Random(seed)
+    while True:
+        for _ in range(generator.randint(1, 64)):
+            store.record(*journal_operation(sequence))
+            sequence += 1
+        store.commit()
+        committed.value = sequence
+
+##@brief Проверка восстановления после сбоя
+# Процесс записи журнала завершается SIGKILL в случайный момент (в том числе во
+# время сжатия), иногда к журналу дописывается неполная запись. Восстановленная
+# таблица должна совпасть с состоянием после некоторого префикса операций, не
+# короче последнего подтвержденного commit.
+#@param [in] rounds Количество сбоев
+#@return True, если все раунды прошли проверку
+def check_crash_recovery(rounds):
+    directory = tempfile.mkdtemp(prefix="dhcp_journal_")
+    generator = random.Random(7)
+    expected = {}
+    applied = 0
+    torn = 0
+    compactions = 0
+    passed = True
+    try:
+        for number in range(rounds):
+            committed = multiprocessing.Value('q', applied, lock=False)
+            writer = multiprocessing.Process(target=journal_writer, args=(directory, applied, committed, number))
+            writer.start()
+            time.sleep(generator.uniform(0.05, 0.3))
+            os.kill(writer.pid, signal.SIGKILL)
+            writer.join()
+            journal_file = os.path.join(directory, "leases.journal")
+            if generator.random() < 0.5:
+                with open(journal_file, 'ab') as journal:
+                    journal.write(os.urandom(generator.randint(1, dhcp_leases.LEASE_RECORD.size - 1)))
+            store = dhcp_leases.LeaseStore(journal_file, os.path.join(directory, "leases.snapshot"), compact_records=500)
+            recovered = store.leases
+            torn += bool(store.recovered["truncated_bytes"])
+            compactions += os.path.exists(os.path.join(directory, "leases.snapshot"))
+            while applied < committed.value:
+                operation = journal_operation(applied)
+                if operation[4] == dhcp_leases.LEASE_ACTIVE:
+                    expected[operation[1]] = operation
+                else:
+                    expected.pop(operation[1], None)
+                applied += 1
+            for _ in range(64 * 4):
+                if recovered == expected:
+                    break
+                operation = journal_operation(applied)
+                if operation[4] == dhcp_leases.LEASE_ACTIVE:
+                    expected[operation[1]] = operation
+                else:
+                    expected.pop(operation[1], None)
+                applied += 1
+            store.close()
+            if recovered != expected:
+                print(f"round {number}: recovered {len(recovered)} leases do not match any committed prefix from {committed.value}")
+                passed = False
+                break
+        print(f"crash recovery: {number + 1}/{rounds} rounds recovered a committed prefix ({applied} operations,"
+              f" {torn} torn tails truncated, snapshot present in {compactions} rounds) - {'ok' if passed else 'FAILED'}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return passed
+
+##@brief Сравнение стоимости сохранения аренды при ACK: перезапись JSON и журнал аренд
+# Для каждого числа аренд замеряется время сохранения одной аренды: прежняя
+# перезапись busy_ip_addresses_dhcp.json, журнал с fsync на каждый ACK, журнал с
+# group commit по batch ACK и журнал без fsync. Затем замеряется восстановление
+# (снимок + хвост журнала) и выполняется проверка восстановления после сбоев.
+#@param [in] lease_counts Список чисел действующих аренд
+#@param [in] acks Количество замеряемых ACK
+#@param [in] batch Размер пачки group commit
+#@param [in] crash_rounds Количество сбоев в проверке восстановления
+#@return True, если проверка восстановления прошла
+def benchmark_journal(lease_counts, acks, batch, crash_rounds):
+    directory = tempfile.mkdtemp(prefix="dhcp_journal_")
+    start = int(POOL_START)
+    try:
+        for count in lease_counts:
+            leases = list(range(start, start + count))
+            json_file = os.path.join(directory, "busy_ip_addresses_dhcp.json")
+            samples = max(1, min(acks, 200))
+            started = time.perf_counter()
+            for number in range(samples):
+                leases[number % count] = start + number
+                dhcp_server.write_to_json_file(leases, json_file)
+            json_us = (time.perf_counter() - started) / samples * 1e6
+            results = {}
+            for name, fsync, size in (("journal, fsync per ACK", True, 1), (f"journal, group commit {batch}", True, batch),
+                                      ("journal, no fsync", False, batch)):
+                for suffix in ("journal", "snapshot"):
+                    if os.path.exists(os.path.join(directory, f"leases.{suffix}")):
+                        os.remove(os.path.join(directory, f"leases.{suffix}"))
+                store = dhcp_leases.LeaseStore(os.path.join(directory, "leases.journal"), os.path.join(directory, "leases.snapshot"),
+                                               fsync=False)
+                for number, address in enumerate(leases):
+                    store.record(client_mac(number), address, 1700000000, 1700003600)
+                store.commit()
+                store.compact()
+                store.fsync = fsync
+                operations = acks if fsync is False or size > 1 else samples
+                started = time.perf_counter()
+                for number in range(operations):
+                    store.record(client_mac(number), start + number % count, 1700000000 + number, 1700003600 + number)
+                    if (number + 1) % size == 0:
+                        store.commit()
+                store.commit()
+                results[name] = (time.perf_counter() - started) / operations * 1e6
+                store.close()
+            started = time.perf_counter()
+            recovered = dhcp_leases.LeaseStore(os.path.join(directory, "leases.journal"), os.path.join(directory, "leases.snapshot"))
+            recovery_ms = (time.perf_counter() - started) * 1e3
+            print(f"leases {count:6d}  JSON rewrite {json_us:10.1f} us/ACK  ({1e6 / json_us:8.0f} ACK/s)")
+            for name, value in results.items():
+                print(f"leases {count:6d}  {name:24s} {value:10.1f} us/ACK  ({1e6 / value:8.0f} ACK/s)")
+            print(f"leases {count:6d}  recovery {recovery_ms:.1f} ms ({recovered.recovered['snapshot']} snapshot +"
+                  f" {recovered.recovered['journal']} journal records)")
+            recovered.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return check_crash_recovery(crash_rounds) if crash_rounds else True
+
+##@brief Прежний способ поиска истекших аренд: перебор всей таблицы на каждом такте
+#@param [in] leases Словарь адрес -> запись аренды (mac, ip, start, expiry, state)
+#@param [in] now Текущее время в секундах Unix
+#@return Список истекших адресов
+def legacy_expired(leases, now):
+    return [address for address, record in leases.items() if record[3] <= now]
+
+##@brief Стоимость жизненного цикла аренд: выдача, продление, освобождение и окончание
+# Для каждого числа аренд пул заполняется арендами с разными моментами окончания
+# (LeaseStore без fsync, очередь LeaseExpiry), затем замеряются продление каждой
+# аренды, освобождение половины аренд (DHCPRELEASE) и окончание оставшихся
+# по куче так же, как это делает DHCPServer.expire_leases. Для сравнения
+# замеряется один такт перебора всей таблицы аренд. В конце проверяется, что
+# пул и таблица аренд пусты, а устаревшие записи кучи пропущены.
+#@param [in] lease_counts Список чисел аренд
+#@return True, если проверки прошли
+def benchmark_expiry(lease_counts):
+    directory = tempfile.mkdtemp(prefix="dhcp_expiry_")
+    start = int(POOL_START)
+    passed = True
+    try:
+        for count in lease_counts:
+            for suffix in ("journal", "snapshot"):
+                if os.path.exists(os.path.join(directory, f"leases.{suffix}")):
+                    os.remove(os.path.join(directory, f"leases.{suffix}"))
+            store = dhcp_leases.LeaseStore(os.path.join(directory, "leases.journal"), os.path.join(directory, "leases.snapshot"),
+                                           fsync=False, compact_records=max(10000, 4 * count))
+            pool = dhcp_leases.AddressPool(start, start + count - 1)
+            expiry = dhcp_leases.LeaseExpiry()
+            now = 1700000000
+            order = list(range(count))
+            random.Random(count).shuffle(order)
+
+            started = time.perf_counter()
+            for number in order:
+                address = pool.allocate()
+                record = store.record(client_mac(number), address, now, now + 3600 + number)
+                expiry.schedule(record[3], address)
+            bind_us = (time.perf_counter() - started) / count * 1e6
+
+            started = time.perf_counter()
+            for address, record in list(store.leases.items()):
+                record = store.record(record[0], address, now + 1800, record[3] + 1800)
+                expiry.schedule(record[3], address)
+            renew_us = (time.perf_counter() - started) / count * 1e6
+
+            releases = list(store.leases.values())[:count // 2]
+            started = time.perf_counter()
+            for record in releases:
+                store.record(record[0], record[1], record[2], now + 1900, dhcp_leases.LEASE_RELEASED)
+                pool.release(record[1])
+            release_us = (time.perf_counter() - started) / max(1, len(releases)) * 1e6
+
+            started = time.perf_counter()
+            legacy_expired(store.leases, now + 10 ** 6)
+            scan_ms = (time.perf_counter() - started) * 1e3
+
+            started = time.perf_counter()
+            expired = stale = 0
+            for when, address in expiry.due(now + 10 ** 6):
+                record = store.leases.get(address)
+                if record is None or record[3] != when:
+                    stale += 1
+                    continue
+                store.record(record[0], address, record[2], when, dhcp_leases.LEASE_EXPIRED)
+                pool.release(address)
+                expired += 1
+            expire_us = (time.perf_counter() - started) / max(1, expired) * 1e6
+            store.commit()
+            store.close()
+
+            ok = pool.used == 0 and not store.leases and expired == count - len(releases) and stale == count + len(releases)
+            passed = passed and ok
+            print(f"leases {count:6d}  bind {bind_us:6.2f} us  renew {renew_us:6.2f} us  release {release_us:6.2f} us"
+                  f"  expire {expire_us:6.2f} us/lease ({stale} stale heap entries skipped)"
+                  f"  full-table scan {scan_ms:8.2f} ms/tick - {'ok' if ok else 'FAILED'}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return passed
+
+##@brief Сервер без сокета и журнала с параметрами ответов из configuration.json (для сборки ответов кодеком)
+#@return Экземпляр DHCPServer
+def codec_server():
+    server = object.__new__(dhcp_server.DHCPServer)
+    server.Configuration = dhcp_server.read_json_file(os.path.join(PACKAGE_DIR, "configuration.json"))
+    server.config = dhcp_server.DhcpConfig.from_configuration(server.Configuration)
+    server.subnet = server.config.default_subnet
+    server.reply_buffer = bytearray(dhcp_server.DHCP_BUFFER_SIZE)
+    return server
+
+##@brief Разбор запроса прежним способом: обрезка по последнему 0xFF и hex-строка PakageDhcp
+#@param [in] packet Запрос
+#@return Разобранный объект PakageDhcp
+def legacy_parse(packet):
+    packet = packet[:packet.rindex(b'\xff') + 1]
+    return dhcp_server.PakageDhcp(binascii.hexlify(packet).decode('utf-8'), os.path.join(PACKAGE_DIR, "configuration.json"))
+
+##@brief Сборка ACK прежним способом: склейка hex-строк полей и опций
+#@param [in] server Экземпляр DHCPServer из codec_server
+#@param [in] transcript Разобранный прежним способом запрос
+#@param [in] address Выдаваемый адрес в hex
+#@return Ответ в виде bytes
+def legacy_build(server, transcript, address):
+    time_ip = hex(server.config.lease_time)[2:]
+    option = ['350105', '3604', server.convert_ip_to_hex_format(server.Configuration['IP_DHCP']),
+              '3304', (8 - len(time_ip)) * '0' + time_ip,
+              '0104', server.convert_ip_to_hex_format(server.Configuration['MASK_DHCP']),
+              '0304', server.convert_ip_to_hex_format(server.Configuration['IP_ROUTER']),
+              '0608', server.convert_ip_to_hex_format(server.Configuration['IP_DNS']) + '00000000']
+    transcript.message_type = '02'
+    transcript.your_client_ip_address = address
+    result = ''
+    for name, value in vars(transcript).items():
+        if name == 'option':
+            break
+        result += value
+    return binascii.unhexlify(result + ''.join(option) + 'ff')
+
+##@brief Случайный запрос клиента со случайными опциями
+# Поля заголовка, значения опций и дополнение после End содержат любые байты,
+# в том числе 0x35 и 0xFF; между опциями вставляются Pad, часть опций разбита
+# на две части (RFC 3396).
+#@param [in] generator Экземпляр random.Random
+#@return Кортеж (пакет, словарь код -> ожидаемое значение опции, MAC-адрес, xid, flags, ciaddr)
+def random_dhcp_request(generator):
+    mac = generator.randbytes(6)
+    xid = generator.getrandbits(32)
+    flags = generator.choice((0, 0x8000))
+    ciaddr = generator.choice((0, generator.getrandbits(32)))
+    header = DHCP_HEADER.pack(1, 1, 6, generator.randrange(4), xid, generator.randrange(65536), flags, ciaddr, 0, 0,
+                              generator.choice((0, generator.getrandbits(32))), mac + generator.randbytes(10),
+                              generator.randbytes(64), generator.randbytes(128))
+    expected = {53: bytes((generator.randrange(1, 9),))}
+    if generator.random() < 0.7:
+        expected[50] = generator.randbytes(4)
+    for code in generator.sample(range(1, 255), generator.randrange(8)):
+        if code not in (50, 53):
+            expected[code] = generator.randbytes(generator.randrange(0, 40))
+    options = bytearray()
+    for code, value in expected.items():
+        options += bytes(generator.randrange(3))
+        if len(value) > 1 and generator.random() < 0.2:
+            split = generator.randrange(1, len(value))
+            options += bytes((code, split)) + value[:split] + bytes((code, len(value) - split)) + value[split:]
+        else:
+            options += bytes((code, len(value))) + value
+    options.append(255)
+    options += generator.randbytes(generator.randrange(0, 64))
+    return header + DHCP_MAGIC_COOKIE + options, expected, mac, xid, flags, ciaddr
+
+##@brief Проверка свойств кодека PakageDhcpWire и build_dhcp_reply на случайных и поврежденных пакетах
+# Свойства: поля заголовка и все опции случайного запроса разбираются точно
+# (независимо от байтов 0x35/0xFF в заголовке, Pad и мусора после End); ответ
+# содержит xid и chaddr запроса, выданный адрес, тип сообщения и End, и его
+# разбирает клиентский parse_dhcp_reply. Поврежденные пакеты (обрезанные, с
+# измененными байтами) либо разбираются с опциями в пределах пакета, либо
+# отклоняются исключением ValueError.
+#@param [in] rounds Количество случайных пакетов
+#@param [in] seed Начальное значение генератора
+#@return True, если все проверки прошли
+def check_codec(rounds, seed=1):
+    generator = random.Random(seed)
+    server = codec_server()
+    buffer = bytearray(dhcp_server.DHCP_BUFFER_SIZE)
+    failures = rejected = 0
+    for number in range(rounds):
+        packet, expected, mac, xid, flags, ciaddr = random_dhcp_request(generator)
+        buffer[:] = generator.randbytes(len(buffer))
+        buffer[:len(packet)] = packet
+        view = memoryview(buffer)
+        request = dhcp_server.PakageDhcpWire(view, len(packet))
+        parsed = {code: bytes(value) for code, value in request.options.items()}
+        requested = int.from_bytes(expected[50], 'big') if 50 in expected else None
+        ok = (parsed == expected and request.xid == xid and request.flags == flags and request.ciaddr == ciaddr
+              and request.client_mac() == mac and request.message_type() == expected[53][0]
+              and request.address_option(50) == requested)
+        address = generator.getrandbits(32)
+        server.package_dhcp_transcript = request
+        length = server.dhcp_server_pack(address)
+        reply = bytes(server.reply_buffer[:length])
+        ok = ok and parse_dhcp_reply(reply) == (xid, DHCPACK, address.to_bytes(4, 'big'), server.config.server_identifier.to_bytes(4, 'big'))
+        ok = ok and length >= dhcp_server.DHCP_MIN_PACKET and reply[28:44] == packet[28:44]
+        if not ok:
+            failures += 1
+            if failures <= 5:
+                print(f"round {number}: codec mismatch for packet {packet.hex()}")
+
+        mutated = bytearray(packet[:generator.randrange(len(packet) + 1)] if generator.random() < 0.5 else packet)
+        for _ in range(generator.randrange(1, 8)):
+            if mutated:
+                mutated[generator.randrange(len(mutated))] = generator.randrange(256)
+        try:
+            fuzzed = dhcp_server.PakageDhcpWire(memoryview(bytes(mutated)))
+            if any(len(value) > len(mutated) - dhcp_server.DHCP_OPTIONS_OFFSET for value in fuzzed.options.values()):
+                failures += 1
+                print(f"round {number}: option outside of the packet {bytes(mutated).hex()}")
+        except ValueError:
+            rejected += 1
+        except Exception as e:
+            failures += 1
+            print(f"round {number}: {type(e).__name__}: {e} for packet {bytes(mutated).hex()}")
+    print(f"codec check: {rounds} random requests, {rounds} mutated packets ({rejected} rejected with ValueError)"
+          f" - {'ok' if not failures else f'{failures} FAILED'}")
+    return not failures
+
+##@brief Проверка DhcpConfig: configuration.json принимается, недопустимые значения отклоняются, объект неизменяем
+#@return True, если все проверки прошли
+def check_config():
+    configuration = dhcp_server.read_json_file(os.path.join(PACKAGE_DIR, "configuration.json"))
+    config = dhcp_server.DhcpConfig.from_configuration(configuration)
+    failures = []
+    for name, value in (("IP_DHCP", "192.168.2"), ("MASK_DHCP", "255.0.255.0"), ("TIME_IP", "0"), ("TIME_IP", "soon"),
+                        ("START_IP_END", "192.168.2.1"), ("DHCP_EXCLUDED_ADDRESSES", ["192.168.2.300"]),
+                        ("DHCP_LEASE_COMMIT_BATCH", 0), ("IP_ROUTER", None),
+                        ("DHCP_SUBNETS", [{"MASK_DHCP": "255.255.255.0", "IP_ROUTER": "192.168.2.1",
+                                           "START_IP_ADDRESS": "192.168.2.200", "START_IP_END": "192.168.2.250"}]),
+                        ("DHCP_SUBNETS", [{"MASK_DHCP": "255.255.255.0", "IP_ROUTER": "10.0.0.1",
+                                           "START_IP_ADDRESS": "10.0.0.10", "START_IP_END": "10.0.1.10"}]),
+                        ("DHCP_SUBNETS", [{"MASK_DHCP": "255.0.0.0", "IP_ROUTER": "10.0.0.1",
+                                           "START_IP_ADDRESS": "10.0.0.10", "START_IP_END": "10.0.0.20"},
+                                          {"MASK_DHCP": "255.255.255.0", "IP_ROUTER": "10.0.0.1",
+                                           "START_IP_ADDRESS": "10.0.0.30", "START_IP_END": "10.0.0.40"}]),
+                        ("DHCP_SUBNETS", [{"MASK_DHCP": "255.255.255.0", "START_IP_ADDRESS": "10.0.0.10",
+                                           "START_IP_END": "10.0.0.20"}])):
+        broken = dict(configuration)
+        if value is None:
+            del broken[name]
+        else:
+            broken[name] = value
+        try:
+            dhcp_server.DhcpConfig.from_configuration(broken)
+            failures.append(f"{name}={value!r} accepted")
+        except ValueError as e:
+            if name not in str(e):
+                failures.append(f"{name}={value!r}: error does not name the parameter: {e}")
+    try:
+        config.lease_time = 1
+        failures.append("DhcpConfig attribute assigned")
+    except AttributeError:
+        pass
+    ack = config.ack_options
+    if ack[:3] != bytes((53, 1, DHCPACK)) or struct.unpack_from('!I', ack, 3 + 6 + 2)[0] != config.lease_time:
+        failures.append("pre-encoded ACK options do not match the configuration")
+    for failure in failures:
+        print(f"config check: {failure}")
+    print(f"config check - {'ok' if not failures else f'{len(failures)} FAILED'}")
+    return not failures
+
+##@brief Сравнение стоимости разбора запроса и сборки ACK для PakageDhcp и PakageDhcpWire
+#@param [in] iterations Количество повторений каждого замера
+def benchmark_codec(iterations):
+    server = codec_server()
+    packet = build_dhcp_request(DHCPREQUEST, 0x35ff35ff, client_mac(0xff35), bytes((127, 1, 0, 255)), bytes((127, 0, 0, 1)))
+    packet += bytes(300 - len(packet))
+    buffer = bytearray(dhcp_server.DHCP_BUFFER_SIZE)
+    buffer[:len(packet)] = packet
+    view = memoryview(buffer)
+    length = len(packet)
+    address = dhcp_leases.ip_to_int("127.1.0.255")
+    legacy_address = f"{address:08x}"
+
+    def wire_parse():
+        dhcp_server.PakageDhcpWire(view, length).message_type()
+
+    def wire_build():
+        server.dhcp_server_pack(address)
+
+    def legacy_parse_only():
+        legacy_parse(packet)
+
+    def legacy_full():
+        legacy_build(server, legacy_parse(packet), legacy_address)
+
+    server.package_dhcp_transcript = dhcp_server.PakageDhcpWire(view, length)
+    legacy_parse_ns = measure(legacy_parse_only, iterations)
+    legacy_build_ns = measure(legacy_full, iterations) - legacy_parse_ns
+    wire_parse_ns = measure(wire_parse, iterations)
+    wire_build_ns = measure(wire_build, iterations)
+    print(f"DHCPREQUEST ({length} bytes), ACK:")
+    print(f"  PakageDhcp      parse {legacy_parse_ns:8.0f} ns  build {legacy_build_ns:8.0f} ns")
+    print(f"  PakageDhcpWire  parse {wire_parse_ns:8.0f} ns  build {wire_build_ns:8.0f} ns")
+    print(f"  speedup         parse x{legacy_parse_ns / wire_parse_ns:.1f}  build x{legacy_build_ns / wire_build_ns:.1f}")
+
+
+##@brief Подсети бенчмарка выбора подсети: /24, /26 и /28 в 10.0.0.0/8 и охватывающая их 10.0.0.0/8
+#@param [in] count Количество подсетей (не больше 65537)
+#@return Список кортежей (сеть, длина префикса)
+def benchmark_subnet_list(count):
+    subnets = [(dhcp_leases.ip_to_int("10.0.0.0"), 8)]
+    for index in range(count - 1):
+        subnets.append((dhcp_leases.ip_to_int("10.0.0.0") | index << 8, (24, 26, 28)[index % 3]))
+    return subnets
+
+##@brief Конфигурация с подсетями DHCP_SUBNETS для замера загрузки DhcpConfig
+#@param [in] subnets Список кортежей (сеть, длина префикса) из benchmark_subnet_list
+#@return Словарь конфигурации
+def subnet_configuration(subnets):
+    configuration = dhcp_server.read_json_file(os.path.join(PACKAGE_DIR, "configuration.json"))
+    sections = []
+    for network, prefix_length in subnets[1:]:
+        sections.append({"MASK_DHCP": dhcp_leases.int_to_ip(0xFFFFFFFF << (32 - prefix_length) & 0xFFFFFFFF),
+                         "IP_ROUTER": dhcp_leases.int_to_ip(network + 1),
+                         "START_IP_ADDRESS": dhcp_leases.int_to_ip(network + 2),
+                         "START_IP_END": dhcp_leases.int_to_ip(network + (1 << (32 - prefix_length)) - 2)})
+    configuration["DHCP_SUBNETS"] = sections
+    return configuration
+
+##@brief Стоимость выбора подсети по giaddr: SubnetIndex против перебора списка подсетей
+# Адреса запросов: 85% - адреса из случайных подсетей, 10% - адреса 10.0.0.0/8
+# вне них (выбирается охватывающая /8), 5% - адреса вне всех подсетей.
+# Результаты индекса сверяются с перебором. Дополнительно замеряется загрузка
+# DhcpConfig с таким же количеством DHCP_SUBNETS.
+#@param [in] counts Количества подсетей
+#@param [in] lookups Количество поисков на замер (перебор - на десятой части адресов)
+#@param [in] seed Начальное значение генератора
+#@return True, если результаты индекса и перебора совпали
+def benchmark_subnets(counts, lookups, seed=1):
+    generator = random.Random(seed)
+    passed = True
+    index_results = []
+    for count in counts:
+        subnets = benchmark_subnet_list(count)
+        index = dhcp_leases.SubnetIndex()
+        for network, prefix_length in subnets:
+            index.add(network, prefix_length, (network, prefix_length))
+        linear = sorted(((0xFFFFFFFF << (32 - prefix_length) & 0xFFFFFFFF, network, (network, prefix_length))
+                         for network, prefix_length in subnets), key=lambda entry: entry[0], reverse=True)
+        addresses = []
+        for _ in range(lookups):
+            share = generator.random()
+            if share < 0.85:
+                network, prefix_length = generator.choice(subnets)
+                addresses.append(network + generator.randrange(1 << (32 - prefix_length)))
+            elif share < 0.95:
+                addresses.append(dhcp_leases.ip_to_int("10.0.0.0") | generator.getrandbits(24))
+            else:
+                addresses.append(dhcp_leases.ip_to_int("192.168.0.0") | generator.getrandbits(16))
+
+        def scan(address):
+            for mask, network, value in linear:
+                if address & mask == network:
+                    return value
+            return None
+
+        lookup = index.lookup
+        started = time.perf_counter_ns()
+        found = [lookup(address) for address in addresses]
+        index_ns = (time.perf_counter_ns() - started) / len(addresses)
+        sample = addresses[:max(1, len(addresses) // 10)]
+        started = time.perf_counter_ns()
+        scanned = [scan(address) for address in sample]
+        scan_ns = (time.perf_counter_ns() - started) / len(sample)
+        ok = found[:len(sample)] == scanned
+        passed = passed and ok
+        configuration = subnet_configuration(subnets)
+        started = time.perf_counter()
+        config = dhcp_server.DhcpConfig.from_configuration(configuration)
+        load_ms = (time.perf_counter() - started) * 1000
+        index_results.append(index_ns)
+        print(f"subnets {count:6d} ({len(index.levels)} prefix lengths)  SubnetIndex {index_ns:7.0f} ns/lookup"
+              f"  list scan {scan_ns:10.0f} ns/lookup  DhcpConfig load {load_ms:8.1f} ms ({len(config.subnets)} subnets)"
+              f" - {'ok' if ok else 'FAILED'}")
+    print(f"SubnetIndex lookup cost from {counts[0]} to {counts[-1]} subnets: x{index_results[-1] / index_results[0]:.2f}")
+    return passed
+
+##@brief Обмен одним запросом через relay-агент
+#@param [in] relay Сокет relay-агента (привязан к giaddr и порту сервера)
+#@param [in] server_address Адрес сервера (адрес, порт)
+#@param [in] packet Запрос
+#@param [in] xid Идентификатор транзакции
+#@return Разобранный ответ PakageDhcpWire или None при таймауте
+def relay_exchange(relay, server_address, packet, xid):
+    relay.sendto(packet, server_address)
+    deadline = time.monotonic() + 1.0
+    while time.monotonic() < deadline:
+        relay.settimeout(max(0.01, deadline - time.monotonic()))
+        try:
+            data = relay.recv(dhcp_server.DHCP_BUFFER_SIZE)
+        except socket.timeout:
+            return None
+        reply = dhcp_server.PakageDhcpWire(memoryview(data))
+        if reply.op == 2 and reply.xid == xid:
+            return reply
+    return None
+
+##@brief Проверка выдачи адресов через relay-агенты против dhcp_server.py на loopback
+# Каждый relay-агент 127.2.N.1 - сокет на порту сервера: запросы отправляются
+# с giaddr агента, сервер отвечает агенту. Проверяется, что адрес выдан из пула
+# подсети агента с ее маской, маршрутизатором и временем аренды, что запрос
+# адреса чужой подсети получает NAK и что запрос с неизвестным giaddr
+# отбрасывается (счетчик no_subnet).
+#@param [in] port Порт сервера
+#@param [in] relays Количество relay-агентов (подсетей)
+#@return True, если все проверки прошли
+def check_relays(port, relays):
+    sections = [{"MASK_DHCP": "255.255.255.0", "IP_ROUTER": f"127.2.{number}.1", "TIME_IP": str(600 + number),
+                 "START_IP_ADDRESS": f"127.2.{number}.10", "START_IP_END": f"127.2.{number}.20"} for number in range(relays)]
+    workdir = prepare_workdir(16, {"DHCP_SUBNETS": sections, "LOG_LEVEL": "warning"})
+    server = start_server(workdir, port)
+    failures = []
+    sockets = []
+    try:
+        leased = []
+        for number in range(relays):
+            relay = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            relay.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            relay.bind((f"127.2.{number}.1", port))
+            sockets.append(relay)
+            giaddr = bytes((127, 2, number, 1))
+            mac = client_mac(number)
+            offer = relay_exchange(relay, ("127.0.0.1", port), build_dhcp_request(DHCPDISCOVER, number, mac, giaddr=giaddr), number)
+            if offer is None or offer.message_type() != DHCPOFFER:
+                failures.append(f"relay {number}: no OFFER")
+                continue
+            expected = (offer.yiaddr >> 8 == dhcp_leases.ip_to_int(f"127.2.{number}.0") >> 8,
+                        offer.address_option(1) == 0xFFFFFF00, offer.address_option(3) == dhcp_leases.ip_to_int(f"127.2.{number}.1"),
+                        offer.option(51) == (600 + number).to_bytes(4, 'big'))
+            if not all(expected):
+                failures.append(f"relay {number}: OFFER {dhcp_leases.int_to_ip(offer.yiaddr)} does not match the subnet {expected}")
+            address = offer.yiaddr.to_bytes(4, 'big')
+            ack = relay_exchange(relay, ("127.0.0.1", port),
+                                 build_dhcp_request(DHCPREQUEST, number, mac, address, bytes((127, 0, 0, 1)), giaddr=giaddr), number)
+            if ack is None or ack.message_type() != DHCPACK or ack.yiaddr != offer.yiaddr:
+                failures.append(f"relay {number}: no ACK for {dhcp_leases.int_to_ip(offer.yiaddr)}")
+            leased.append(address)
+        if relays > 1 and leased:
+            nak = relay_exchange(sockets[1], ("127.0.0.1", port),
+                                 build_dhcp_request(DHCPREQUEST, 1000, client_mac(0), leased[0], bytes((127, 0, 0, 1)),
+                                                    giaddr=bytes((127, 2, 1, 1))), 1000)
+            if nak is None or nak.message_type() != DHCPNAK:
+                failures.append("REQUEST for an address of another subnet is not NAKed")
+        sockets[0].sendto(build_dhcp_request(DHCPDISCOVER, 2000, client_mac(2000), giaddr=bytes((10, 99, 0, 1))), ("127.0.0.1", port))
+        time.sleep(0.2)
+        snapshot = json.loads(server_stats.query_stats(BENCHMARK_STATS_ADDRESS))
+        if snapshot.get("counters", {}).get("no_subnet") != 1:
+            failures.append(f"unknown giaddr: no_subnet counter {snapshot.get('counters', {}).get('no_subnet')}")
+        if snapshot.get("gauges", {}).get("subnets") != relays + 1:
+            failures.append(f"subnets gauge {snapshot.get('gauges', {}).get('subnets')}, expected {relays + 1}")
+    finally:
+        for relay in sockets:
+            relay.close()
+        stop_server(server)
+        shutil.rmtree(workdir, ignore_errors=True)
+    for failure in failures:
+        print(f"relay check: {failure}")
+    print(f"relay check: {relays} relay agents - {'ok' if not failures else f'{len(failures)} FAILED'}")
+    return not failures
+
+##@brief Стоимость применения событий аренд к DynamicZone в зависимости от размера пачки
+# Каждая пачка регистрирует имена части клиентов и освобождает адреса других;
+# в пачке каждый адрес меняется дважды, поэтому половина событий схлопывается.
+#@param [in] clients Количество адресов клиентов
+#@param [in] batches Размеры пачек событий
+#@return True, если после применения в зоне ровно зарегистрированные имена
+def benchmark_dynamic_zone(clients, batches):
+    passed = True
+    addresses = [(POOL_START + index).packed for index in range(clients)]
+    for batch in batches:
+        zone = dns_zone.DynamicZone("lan", 60)
+        events = []
+        for index, address in enumerate(addresses):
+            events.append((address, b"stale"))
+            events.append((address, f"client-{index}".encode('ascii') if index % 4 else None))
+        started = time.perf_counter_ns()
+        for offset in range(0, len(events), batch):
+            zone.apply(events[offset:offset + batch])
+        elapsed = time.perf_counter_ns() - started
+        expected = sum(1 for index in range(clients) if index % 4)
+        answer = zone.lookup(dns_zone.encode_domain_name("client-1.lan"))
+        ok = len(zone) == expected and answer is not None and answer[1][-4:] == addresses[1]
+        passed = passed and ok
+        print(f"DynamicZone, batch {batch:5d}: {elapsed / len(events):8.0f} ns/event  {len(zone)} names - {'ok' if ok else 'FAILED'}")
+    return passed
+
+##@brief Проверка регистрации имен клиентов DHCP в DNS-сервере через DNS_UPDATE_SOCKET
+# dhcp_server.py и dns_server.py запускаются во временных каталогах с общим
+# Unix-сокетом событий. Клиенты получают адреса через relay-агент 127.2.0.1 с
+# опцией 12 Host Name; сразу после ACK клиент повторяет запрос A имени
+# client-N.lan, пока DNS-сервер не ответит выданным адресом из своей зоны (флаг
+# AA). Замеряется задержка от получения ACK до первого такого ответа. Затем
+# половина клиентов освобождает адреса, и их имена должны пропасть из зоны
+# (запрос пересылается заглушке вышестоящего сервера, ответ без AA).
+#@param [in] port Порт DHCP-сервера
+#@param [in] dns_port Порт DNS-сервера (заглушка вышестоящего сервера - на dns_port + 1)
+#@param [in] clients Количество клиентов
+#@param [in] use_async Запустить оба сервера в режиме --async
+#@return True, если все проверки прошли
+def check_dynamic_dns(port, dns_port, clients, use_async=False):
+    update_path = os.path.join(tempfile.gettempdir(), f"dhcp-dns-updates-{os.getpid()}.sock")
+    dhcp_workdir = prepare_workdir(16, {"DHCP_SUBNETS": [{"MASK_DHCP": "255.255.0.0", "IP_ROUTER": "127.2.0.1",
+                                                          "START_IP_ADDRESS": "127.2.0.10", "START_IP_END": "127.2.255.250"}],
+                                        "DNS_UPDATE_SOCKET": update_path, "LOG_LEVEL": "warning"})
+    dns_workdir = dns_benchmark.prepare_workdir({"DNS_UPDATE_SOCKET": update_path, "DNS_DYNAMIC_DOMAIN": "lan", "LOG_LEVEL": "warning",
+                                                 "DNS_STATS_ADDRESS": dns_benchmark.BENCHMARK_STATS_ADDRESS})
+    upstream = dns_benchmark.start_fake_upstream(dns_port + 1)
+    dns = dns_benchmark.start_server(dns_workdir, dns_port, dns_port + 1, ("--async",) if use_async else ())
+    dhcp = None
+    relay = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    resolver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    resolver.settimeout(0.05)
+    failures = []
+    resolved = server_stats.LatencyHistogram()
+    giaddr = bytes((127, 2, 0, 1))
+
+    def resolve(index, address, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        query = dns_benchmark.build_query(f"client-{index}.lan", index & 0xFFFF)
+        while time.monotonic() < deadline:
+            resolver.sendto(query, ("127.0.0.1", dns_port))
+            try:
+                data = resolver.recv(dns_benchmark.dns_server.DNS_BUFFER_SIZE)
+            except socket.timeout:
+                continue
+            local = bool(struct.unpack_from('!H', data, 2)[0] & dns_benchmark.dns_server.FLAG_AA)
+            if (local and data[-4:] == address) if address is not None else not local:
+                return True
+        return False
+
+    try:
+        dhcp = start_server(dhcp_workdir, port, use_async)
+        relay.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        relay.bind(("127.2.0.1", port))
+        leased = []
+        for index in range(clients):
+            mac = client_mac(index)
+            hostname = f"Client-{index}".encode('ascii')
+            offer = relay_exchange(relay, ("127.0.0.1", port), build_dhcp_request(DHCPDISCOVER, index, mac, giaddr=giaddr, hostname=hostname), index)
+            if offer is None or offer.message_type() != DHCPOFFER:
+                failures.append(f"client {index}: no OFFER")
+                continue
+            address = offer.yiaddr.to_bytes(4, 'big')
+            ack = relay_exchange(relay, ("127.0.0.1", port), build_dhcp_request(DHCPREQUEST, index, mac, address, bytes((127, 0, 0, 1)),
+                                                                                giaddr=giaddr, hostname=hostname), index)
+            acked = time.perf_counter_ns()
+            if ack is None or ack.message_type() != DHCPACK:
+                failures.append(f"client {index}: no ACK")
+                continue
+            if not resolve(index, address):
+                failures.append(f"client-{index}.lan does not resolve to {dhcp_leases.int_to_ip(offer.yiaddr)}")
+                continue
+            resolved.record(time.perf_counter_ns() - acked)
+            leased.append((index, mac, address))
+        for index, mac, address in leased[::2]:
+            relay.sendto(build_dhcp_request(DHCPRELEASE, index, mac, ciaddr=address, giaddr=giaddr), ("127.0.0.1", port))
+            if not resolve(index, None):
+                failures.append(f"client-{index}.lan still resolves after DHCPRELEASE")
+        try:
+            dns_snapshot = json.loads(server_stats.query_stats(dns_benchmark.BENCHMARK_STATS_ADDRESS))
+            dhcp_snapshot = json.loads(server_stats.query_stats(BENCHMARK_STATS_ADDRESS))
+        except (OSError, ValueError) as e:
+            failures.append(f"stats are not available: {e}")
+        else:
+            if dns_snapshot["gauges"].get("dynamic_records") != len(leased) - len(leased[::2]):
+                failures.append(f"dynamic_records {dns_snapshot['gauges'].get('dynamic_records')}, expected {len(leased) - len(leased[::2])}")
+            if dhcp_snapshot["gauges"].get("dns_updates_dropped"):
+                failures.append(f"{dhcp_snapshot['gauges']['dns_updates_dropped']} DNS updates dropped")
+            delay = {name: value if name == "count" else round(value / 1e6, 4)
+                     for name, value in dns_snapshot["latency_ns"].get("dynamic_delay", {}).items() if name != "sum"}
+            print(f"dynamic DNS: update delivery (DHCP commit to DNS apply), ms: {delay}")
+    finally:
+        relay.close()
+        resolver.close()
+        if dhcp is not None:
+            stop_server(dhcp)
+        stop_server(dns)
+        upstream.terminate()
+        shutil.rmtree(dhcp_workdir, ignore_errors=True)
+        shutil.rmtree(dns_workdir, ignore_errors=True)
+    print(f"dynamic DNS: ACK to resolvable name, ms: {latency_summary_ms(resolved)}")
+    for failure in failures[:10]:
+        print(f"dynamic DNS check: {failure}")
+    print(f"dynamic DNS check: {clients} clients{' (async)' if use_async else ''} - {'ok' if not failures else f'{len(failures)} FAILED'}")
+    return not failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DHCP server benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    storm_parser = commands.add_parser("storm", help="DORA storm simulator and lease-throughput benchmark against dhcp_server.py")
+    storm_parser.add_argument("--clients", type=int, default=1000, help="simulated clients, each with its own MAC")
+    storm_parser.add_argument("--pool-size", type=int, default=4096, help="addresses in the server pool (up to 65534 for a /16)")
+    storm_parser.add_argument("--concurrency", type=int, default=100, help="clients running an exchange at the same time")
+    storm_parser.add_argument("--renew", type=float, default=0.2, help="share of leased clients that renew their lease")
+    storm_parser.add_argument("--reboot", type=float, default=0.1,
+                              help="share of leased clients that reboot with an INIT-REBOOT REQUEST for their address")
+    storm_parser.add_argument("--rediscover", type=float, default=0.1,
+                              help="share of leased clients that forget their lease and run DORA again")
+    storm_parser.add_argument("--conflicts", type=float, default=0.05,
+                              help="share of leased addresses requested again by another client")
+    storm_parser.add_argument("--release", type=float, default=0.1, help="share of leased clients that send DHCPRELEASE at the end")
+    storm_parser.add_argument("--duplicate", type=float, default=0.0,
+                              help="share of messages a client sends twice in a row (retransmission racing the reply)")
+    storm_parser.add_argument("--async", dest="use_async", action="store_true", help="run dhcp_server.py --async (AsyncDHCPServer)")
+    storm_parser.add_argument("--timeout", type=float, default=1.0, help="reply timeout, seconds")
+    storm_parser.add_argument("--retries", type=int, default=3, help="retransmissions of a message without a reply")
+    storm_parser.add_argument("--attempts", type=int, default=5, help="DORA attempts per client (a NAK restarts DORA)")
+    storm_parser.add_argument("--port", type=int, default=SERVER_PORT, help="server port; clients listen on port + 1")
+    storm_parser.add_argument("--server-address", default="127.0.0.1",
+                              help="server address; the benchmark starts dhcp_server.py itself only for 127.0.0.1")
+    storm_parser.add_argument("--bind", default="0.0.0.0", help="client address to receive replies on (e.g. the veth peer)")
+    storm_parser.add_argument("--config", help="JSON object with configuration.json overrides, e.g. '{\"TIME_IP\": \"60\"}'")
+    storm_parser.add_argument("--log-level", choices=("debug", "info", "warning", "error"), default="info",
+                              help="LOG_LEVEL of the server")
+    storm_parser.add_argument("--seed", type=int, default=1, help="seed of the xid generator")
+    storm_parser.add_argument("--output", help="append the result as one JSON line to this file")
+    allocator_parser = commands.add_parser("allocator", help="AddressPool vs linear list scan across pool sizes")
+    allocator_parser.add_argument("--sizes", type=int, nargs="+", default=[256, 4096, 65534])
+    allocator_parser.add_argument("--utilisation", type=float, default=0.9, help="share of the pool leased before measuring")
+    allocator_parser.add_argument("--operations", type=int, default=100000)
+    allocator_parser.add_argument("--legacy-max", type=int, default=4096, help="largest pool measured with the list scan")
+    journal_parser = commands.add_parser("journal", help="ACK persistence cost of the JSON rewrite vs the lease journal, crash recovery check")
+    journal_parser.add_argument("--leases", type=int, nargs="+", default=[1000, 10000, 65534], help="active leases")
+    journal_parser.add_argument("--acks", type=int, default=20000, help="ACKs measured per variant")
+    journal_parser.add_argument("--batch", type=int, default=64, help="ACKs per group commit")
+    journal_parser.add_argument("--crash-rounds", type=int, default=20, help="SIGKILL/recover rounds (0: skip)")
+    expiry_parser = commands.add_parser("expiry", help="lease bind/renew/release/expiry cost with the expiry heap")
+    expiry_parser.add_argument("--leases", type=int, nargs="+", default=[1000, 10000, 65534], help="leases in the pool")
+    codec_parser = commands.add_parser("codec", help="DHCP config and codec property/fuzz checks, per-packet parse/build timing")
+    codec_parser.add_argument("--rounds", type=int, default=20000, help="random and mutated packets checked")
+    codec_parser.add_argument("--iterations", type=int, default=20000, help="repetitions of each timing")
+    codec_parser.add_argument("--seed", type=int, default=1)
+    subnets_parser = commands.add_parser("subnets", help="subnet selection cost by giaddr as the number of subnets grows, relay check")
+    subnets_parser.add_argument("--counts", type=int, nargs="+", default=[1, 10, 100, 1000, 10000], help="subnets (up to 65537)")
+    subnets_parser.add_argument("--lookups", type=int, default=100000, help="subnet lookups per measurement")
+    subnets_parser.add_argument("--relays", type=int, default=4, help="relay agents in the check against dhcp_server.py (0: skip)")
+    subnets_parser.add_argument("--port", type=int, default=SERVER_PORT, help="server port of the relay check")
+    subnets_parser.add_argument("--seed", type=int, default=1)
+    dyndns_parser = commands.add_parser("dyndns", help="DynamicZone update cost, ACK-to-resolvable latency of client names in dns_server.py")
+    dyndns_parser.add_argument("--clients", type=int, default=200, help="clients leasing an address with a host name")
+    dyndns_parser.add_argument("--batches", type=int, nargs="+", default=[1, 16, 256], help="events per DynamicZone.apply")
+    dyndns_parser.add_argument("--zone-clients", type=int, default=65534, help="addresses in the DynamicZone measurement")
+    dyndns_parser.add_argument("--async", dest="use_async", action="store_true", help="run both servers with --async")
+    dyndns_parser.add_argument("--port", type=int, default=SERVER_PORT, help="DHCP server port")
+    dyndns_parser.add_argument("--dns-port", type=int, default=SERVER_PORT + 100, help="DNS server port (stand-in upstream on port + 1)")
+    args = parser.parse_args()
+    if args.command == "storm":
+        if not 0 < args.pool_size <= 65534:
+            parser.error("--pool-size must be between 1 and 65534")
+        benchmark_storm(args)
+    elif args.command == "allocator":
+        benchmark_allocator(args.sizes, args.utilisation, args.operations, args.legacy_max)
+    elif args.command == "journal":
+        if not benchmark_journal(args.leases, args.acks, args.batch, args.crash_rounds):
+            sys.exit(1)
+    elif args.command == "expiry":
+        if not benchmark_expiry(args.leases):
+            sys.exit(1)
+    elif args.command == "codec":
+        passed = check_config() and check_codec(args.rounds, args.seed)
+        benchmark_codec(args.iterations)
+        if not passed:
+            sys.exit(1)
+    elif args.command == "subnets":
+        if not 0 < min(args.counts) <= max(args.counts) <= 65537 or not 0 <= args.relays <= 256:
+            parser.error("--counts must be between 1 and 65537, --relays between 0 and 256")
+        passed = benchmark_subnets(args.counts, args.lookups, args.seed)
+        if args.relays and not check_relays(args.port, args.relays):
+            passed = False
+        if not passed:
+            sys.exit(1)
+    elif args.command == "dyndns":
+        if not 0 < args.clients <= 65000 or not 0 < args.zone_clients <= 65534:
+            parser.error("--clients must be between 1 and 65000, --zone-clients between 1 and 65534")
+        passed = benchmark_dynamic_zone(args.zone_clients, args.batches)
+        if not check_dynamic_dns(args.port, args.dns_port, args.clients, args.use_async):
+            passed = False
+        if not passed:
+            sys.exit(1)
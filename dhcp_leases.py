@@ -0,0 +1,669 @@
+##@file dhcp_leases.py
+##@brief Учет адресов пула и хранение аренд DHCP-сервера.
+#
+# AddressPool хранит занятость адресов диапазона START_IP_ADDRESS-START_IP_END
+# в битовой карте (один бит на адрес). Свободный адрес ищется по очереди
+# освобожденных адресов, а если она пуста - курсором, который идет только
+# вперед по адресам, ни разу не выданным с момента создания пула, и
+# перескакивает полностью занятые байты карты. Поэтому выбор, занятие,
+# освобождение и проверка адреса выполняются за амортизированное O(1)
+# вместо просмотра списка аренд на каждый DISCOVER и REQUEST.
+#
+# LeaseStore хранит аренды (MAC, IP, начало, окончание, состояние) в журнале
+# из записей фиксированного размера, который только дописывается, и в снимке,
+# в который журнал периодически сжимается. Запись аренды - дописывание
+# 23 байт вместо перезаписи всего списка аренд; fsync выполняется один раз на
+# пачку подтверждений (group commit).
+#
+# LeaseExpiry - min-heap моментов окончания аренд и карантина отклоненных
+# (DHCPDECLINE) адресов: ближайшее окончание находится за O(1), добавление и
+# извлечение стоят O(log n).
+#
+# OfferReservations - адреса, предложенные в DHCPOFFER и ожидающие DHCPREQUEST:
+# адрес занят в пуле, пока клиент не подтвердит его или не истечет срок
+# резервирования, поэтому одновременные клиенты получают разные адреса.
+#
+# BindingIndex - последний адрес каждого клиента по MAC-адресу и идентификатору
+# клиента (опция 61): продление и перезагрузка клиента обрабатываются по
+# привязке за O(1), а вернувшийся клиент получает прежний адрес, если он свободен.
+#
+# SubnetIndex - подсети, обслуживаемые сервером (своя и за relay-агентами),
+# с поиском по самому длинному префиксу: подсеть запроса выбирается по giaddr
+# за время, не зависящее от количества подсетей.
+
+import heapq
+##@package heapq
+#Модуль для min-heap моментов окончания аренд.
+
+import os
+##@package os
+#Модуль для работы с файлами журнала и снимка (write, fsync, replace).
+
+import struct
+##@package struct
+#Модуль для кодирования записей аренд.
+
+import time
+##@package time
+#Модуль для получения текущего времени.
+
+import zlib
+##@package zlib
+#Модуль для контрольной суммы crc32 записей аренд.
+
+from collections import deque
+##@package collections
+#Модуль с очередью deque (очередь освобожденных адресов).
+
+
+##@brief Состояния аренды в записях журнала
+LEASE_ACTIVE = 1
+LEASE_RELEASED = 2
+LEASE_EXPIRED = 3
+LEASE_DECLINED = 4
+##@brief Запись аренды: crc32 остальных полей, MAC, IP, начало и окончание аренды (секунды Unix), состояние
+LEASE_RECORD = struct.Struct('!I6sIIIB')
+##@brief Поля записи без контрольной суммы
+LEASE_FIELDS = struct.Struct('!6sIIIB')
+##@brief Заголовок снимка: магическое число, версия, флаги, количество записей
+LEASE_SNAPSHOT_HEADER = struct.Struct('!4sHHI')
+LEASE_SNAPSHOT_MAGIC = b'DHLS'
+LEASE_SNAPSHOT_VERSION = 1
+
+
+##@brief Разбор списка исключенных адресов из конфигурации
+#@param [in] values Список строк "a.b.c.d" или диапазонов "a.b.c.d-e.f.g.h"
+#@return Список адресов в виде целых чисел
+def parse_address_ranges(values):
+    addresses = []
+    for value in values or ():
+        first, _, last = value.partition('-')
+        first = ip_to_int(first.strip())
+        last = ip_to_int(last.strip()) if last else first
+        addresses.extend(range(first, last + 1))
+    return addresses
+
+##@brief Преобразование IPv4-адреса из строки в целое число
+#@param [in] ip_address Адрес вида "192.168.2.5"
+#@return Целое число
+def ip_to_int(ip_address):
+    octets = [int(octet) for octet in ip_address.split('.')]
+    if len(octets) != 4 or not all(0 <= octet <= 255 for octet in octets):
+        raise ValueError(f"invalid IPv4 address '{ip_address}'")
+    return octets[0] << 24 | octets[1] << 16 | octets[2] << 8 | octets[3]
+
+##@brief Преобразование IPv4-адреса из целого числа в строку
+#@param [in] address Целое число
+#@return Адрес вида "192.168.2.5"
+def int_to_ip(address):
+    return f"{address >> 24}.{address >> 16 & 0xFF}.{address >> 8 & 0xFF}.{address & 0xFF}"
+
+
+##@class AddressPool
+##@brief Битовая карта занятости адресов диапазона с очередью освобожденных адресов
+#
+# Инвариант: каждый свободный адрес либо не меньше курсора, либо стоит в
+# очереди released. Адреса в очереди могут оказаться занятыми (take выдал
+# конкретный адрес, запрошенный клиентом) - такие записи отбрасываются при
+# поиске. Бит queued не дает поставить адрес в очередь дважды, поэтому очередь
+# не длиннее пула. Освобожденные адреса выдаются в порядке освобождения:
+# адрес ушедшего клиента переиспользуется как можно позже.
+class AddressPool:
+ #@param [in] start Первый адрес диапазона (целое число)
+ #@param [in] end Последний адрес диапазона (целое число)
+ #@param [in] excluded Адреса, которые никогда не выдаются (роутер, DHCP- и DNS-серверы); адреса вне диапазона игнорируются
+    def __init__(self, start, end, excluded=()):
+        if end < start:
+            raise ValueError("address pool end is before its start")
+        self.start = start
+        self.end = end
+        self.size = end - start + 1
+        self.busy = bytearray((self.size + 7) // 8)
+        self.queued = bytearray((self.size + 7) // 8)
+        self.excluded = set()
+        for address in excluded:
+            if start <= address <= end and address - start not in self.excluded:
+                offset = address - start
+                self.excluded.add(offset)
+                self.busy[offset >> 3] |= 1 << (offset & 7)
+        if self.size & 7:
+            self.busy[-1] |= 0xFF << (self.size & 7) & 0xFF
+        self.capacity = self.size - len(self.excluded)
+        self.used = 0
+        self.cursor = 0
+        self.released = deque()
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, address):
+        return self.start <= address <= self.end
+
+ ##@brief Свободен ли адрес
+ #@param [in] address Адрес (целое число)
+ #@return True, если адрес в диапазоне, не исключен и не занят
+    def is_free(self, address):
+        offset = address - self.start
+        if not 0 <= offset < self.size:
+            return False
+        return not self.busy[offset >> 3] & (1 << (offset & 7))
+
+ ##@brief Свободный адрес без его занятия (для OFFER)
+ #@return Адрес (целое число) или None, если свободных адресов нет
+    def next_free(self):
+        busy = self.busy
+        released = self.released
+        while released:
+            offset = released[0]
+            if not busy[offset >> 3] & (1 << (offset & 7)):
+                return self.start + offset
+            released.popleft()
+            self.queued[offset >> 3] &= ~(1 << (offset & 7))
+        cursor = self.cursor
+        size = self.size
+        while cursor < size:
+            byte = busy[cursor >> 3]
+            if byte == 0xFF:
+                cursor = (cursor | 7) + 1
+            elif byte & (1 << (cursor & 7)):
+                cursor += 1
+            else:
+                self.cursor = cursor
+                return self.start + cursor
+        self.cursor = size
+        return None
+
+ ##@brief Занятие конкретного адреса (REQUEST с опцией 50, восстановление аренд)
+ #@param [in] address Адрес (целое число)
+ #@return True, если адрес был свободен и теперь занят
+    def take(self, address):
+        if not self.is_free(address):
+            return False
+        offset = address - self.start
+        self.busy[offset >> 3] |= 1 << (offset & 7)
+        self.used += 1
+        return True
+
+ ##@brief Выбор и занятие свободного адреса
+ #@return Адрес (целое число) или None, если свободных адресов нет
+    def allocate(self):
+        address = self.next_free()
+        if address is not None:
+            self.take(address)
+        return address
+
+ ##@brief Освобождение адреса
+ #@param [in] address Адрес (целое число)
+ #@return True, если адрес был занят арендой и освобожден
+    def release(self, address):
+        offset = address - self.start
+        if not 0 <= offset < self.size or offset in self.excluded or not self.busy[offset >> 3] & (1 << (offset & 7)):
+            return False
+        self.busy[offset >> 3] &= ~(1 << (offset & 7))
+        self.used -= 1
+        if offset < self.cursor and not self.queued[offset >> 3] & (1 << (offset & 7)):
+            self.queued[offset >> 3] |= 1 << (offset & 7)
+            self.released.append(offset)
+        return True
+
+ ##@brief Занятые арендами адреса по возрастанию (без исключенных)
+ #@return Генератор адресов (целых чисел)
+    def leased(self):
+        excluded = self.excluded
+        for index, byte in enumerate(self.busy):
+            if not byte:
+                continue
+            for bit in range(8):
+                offset = (index << 3) + bit
+                if byte & (1 << bit) and offset < self.size and offset not in excluded:
+                    yield self.start + offset
+
+ ##@brief Метрики пула
+ #@return Словарь с размером, числом исключенных и занятых адресов и длиной очереди освобожденных
+    def stats(self):
+        return {
+            "size": self.size,
+            "excluded": len(self.excluded),
+            "used": self.used,
+            "free": self.capacity - self.used,
+            "released_queue": len(self.released)
+        }
+
+
+##@brief Кодирование записи аренды
+#@param [in] mac MAC-адрес клиента (6 байт)
+#@param [in] ip Адрес (целое число)
+#@param [in] start Начало аренды в секундах Unix
+#@param [in] expiry Окончание аренды в секундах Unix
+#@param [in] state Состояние (LEASE_ACTIVE ... LEASE_DECLINED)
+#@return bytes длиной LEASE_RECORD.size
+def encode_lease(mac, ip, start, expiry, state):
+    fields = LEASE_FIELDS.pack(mac, ip, start, expiry, state)
+    return struct.pack('!I', zlib.crc32(fields)) + fields
+
+##@brief Декодирование записей аренд до первой поврежденной или неполной
+#@param [in] data Байты журнала или тела снимка
+#@return Кортеж (список записей (mac, ip, start, expiry, state), длина корректной части в байтах)
+def decode_leases(data):
+    records = []
+    offset = 0
+    size = LEASE_RECORD.size
+    view = memoryview(data)
+    while offset + size <= len(data):
+        crc = struct.unpack_from('!I', view, offset)[0]
+        if zlib.crc32(view[offset + 4:offset + size]) != crc:
+            break
+        records.append(LEASE_FIELDS.unpack_from(view, offset + 4))
+        offset += size
+    return records, offset
+
+
+##@class LeaseStore
+##@brief Таблица действующих аренд с журналом только для дописывания, group commit и сжатием в снимок
+#
+# record() меняет таблицу в памяти и добавляет запись в буфер; commit()
+# дописывает буфер в журнал одним write и выполняет один fsync, после чего
+# аренды из буфера считаются сохраненными (ACK можно отправлять). Когда в
+# журнале накапливается больше compact_records записей и больше удвоенного
+# числа действующих аренд, таблица записывается в новый снимок (временный файл,
+# fsync, os.replace), а журнал обрезается. Каждая запись хранит полное
+# состояние аренды, поэтому повторное применение записей журнала, уже
+# попавших в снимок (сбой между заменой снимка и обрезкой журнала), безвредно.
+#
+# При восстановлении загружается снимок и применяется журнал до первой
+# поврежденной записи; недописанный при сбое хвост журнала отрезается.
+#
+# commit() можно разделить на две части: detach() забирает буфер (и копию
+# таблиц, если пора сжимать) в потоке, меняющем аренды, а write() выполняет
+# запись, fsync и сжатие в другом потоке. Одновременно выполняется не больше
+# одного write(): записи, добавленные после detach(), попадут в журнал после
+# сжатия и не будут отрезаны вместе с ним.
+class LeaseStore:
+ #@param [in] journal_file Файл журнала
+ #@param [in] snapshot_file Файл снимка
+ #@param [in] fsync Выполнять ли fsync при commit (False - только write, для тестов и бенчмарков)
+ #@param [in] compact_records Минимальное количество записей журнала для сжатия
+    def __init__(self, journal_file, snapshot_file, fsync=True, compact_records=10000):
+        self.journal_file = journal_file
+        self.snapshot_file = snapshot_file
+        self.fsync = fsync
+        self.compact_records = compact_records
+        self.leases = {}
+        self.quarantine = {}
+        self.buffer = bytearray()
+        self.buffered = 0
+        self.journal_records = 0
+        self.commits = 0
+        self.compactions = 0
+        self.recovered = {"snapshot": 0, "journal": 0, "truncated_bytes": 0, "seconds": 0.0}
+        self.recover()
+        self.journal = os.open(journal_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+ ##@brief Применение записи к таблицам действующих аренд и адресов в карантине
+ # Отклоненный адрес (LEASE_DECLINED) хранится до окончания карантина в поле expiry.
+ #@param [in] record Кортеж (mac, ip, start, expiry, state)
+    def apply(self, record):
+        if record[4] == LEASE_ACTIVE:
+            self.leases[record[1]] = record
+            self.quarantine.pop(record[1], None)
+        elif record[4] == LEASE_DECLINED:
+            self.quarantine[record[1]] = record
+            self.leases.pop(record[1], None)
+        else:
+            self.leases.pop(record[1], None)
+            self.quarantine.pop(record[1], None)
+
+ ##@brief Восстановление таблицы: снимок, затем журнал до первой поврежденной записи
+    def recover(self):
+        started = time.perf_counter()
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, 'rb') as file:
+                data = file.read()
+            if len(data) < LEASE_SNAPSHOT_HEADER.size:
+                raise ValueError(f"lease snapshot '{self.snapshot_file}' is truncated")
+            magic, version, _, count = LEASE_SNAPSHOT_HEADER.unpack_from(data, 0)
+            if magic != LEASE_SNAPSHOT_MAGIC or version != LEASE_SNAPSHOT_VERSION:
+                raise ValueError(f"'{self.snapshot_file}' is not a lease snapshot of version {LEASE_SNAPSHOT_VERSION}")
+            records, _ = decode_leases(data[LEASE_SNAPSHOT_HEADER.size:])
+            if len(records) != count:
+                raise ValueError(f"lease snapshot '{self.snapshot_file}' is damaged: {len(records)} of {count} records")
+            for record in records:
+                self.apply(record)
+            self.recovered["snapshot"] = count
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'rb') as file:
+                data = file.read()
+            records, valid = decode_leases(data)
+            for record in records:
+                self.apply(record)
+            self.journal_records = len(records)
+            self.recovered["journal"] = len(records)
+            if valid < len(data):
+                self.recovered["truncated_bytes"] = len(data) - valid
+                with open(self.journal_file, 'r+b') as file:
+                    file.truncate(valid)
+                    file.flush()
+                    os.fsync(file.fileno())
+        self.recovered["seconds"] = round(time.perf_counter() - started, 6)
+
+ ##@brief Изменение аренды (сохраняется при следующем commit)
+ #@param [in] mac MAC-адрес клиента (6 байт)
+ #@param [in] ip Адрес (целое число)
+ #@param [in] start Начало аренды в секундах Unix
+ #@param [in] expiry Окончание аренды в секундах Unix
+ #@param [in] state Состояние (LEASE_ACTIVE ... LEASE_DECLINED)
+ #@return Кортеж (mac, ip, start, expiry, state) с округленными до секунд моментами
+    def record(self, mac, ip, start, expiry, state=LEASE_ACTIVE):
+        record = (mac, ip, int(start), int(expiry), state)
+        self.apply(record)
+        self.buffer += encode_lease(*record)
+        self.buffered += 1
+        return record
+
+ ##@brief Сохранение накопленных записей: один write и один fsync на пачку
+ #@return Количество сохраненных записей
+    def commit(self):
+        return self.write(*self.detach())
+
+ ##@brief Передача накопленных записей на сохранение (см. write)
+ # Если после их записи журнал нужно сжать, вместе с буфером возвращается копия
+ # действующих аренд и карантина на момент вызова.
+ #@return Кортеж (буфер, количество записей, список записей для снимка или None)
+    def detach(self):
+        buffer, count = self.buffer, self.buffered
+        self.buffer = bytearray()
+        self.buffered = 0
+        live = len(self.leases) + len(self.quarantine)
+        records = None
+        if count and self.journal_records + count >= self.compact_records and self.journal_records + count > 2 * live:
+            records = list(self.leases.values()) + list(self.quarantine.values())
+        return buffer, count, records
+
+ ##@brief Запись буфера в журнал одним write и одним fsync и сжатие, если передана копия таблиц
+ #@param [in] buffer Закодированные записи (результат detach)
+ #@param [in] count Количество записей в буфере
+ #@param [in] records Записи для снимка или None
+ #@return Количество сохраненных записей
+    def write(self, buffer, count, records=None):
+        if not count:
+            return 0
+        os.write(self.journal, buffer)
+        if self.fsync:
+            os.fsync(self.journal)
+        self.journal_records += count
+        self.commits += 1
+        if records is not None:
+            self.compact(records)
+        return count
+
+ ##@brief Сжатие: запись действующих аренд и карантина в новый снимок и обрезка журнала
+ #@param [in] records Записи для снимка (по умолчанию текущие таблицы аренд и карантина)
+    def compact(self, records=None):
+        if records is None:
+            records = list(self.leases.values()) + list(self.quarantine.values())
+        temporary_file = f"{self.snapshot_file}.tmp{os.getpid()}"
+        with open(temporary_file, 'wb') as file:
+            file.write(LEASE_SNAPSHOT_HEADER.pack(LEASE_SNAPSHOT_MAGIC, LEASE_SNAPSHOT_VERSION, 0, len(records)))
+            file.write(b''.join(encode_lease(*record) for record in records))
+            file.flush()
+            if self.fsync:
+                os.fsync(file.fileno())
+        os.replace(temporary_file, self.snapshot_file)
+        if self.fsync:
+            directory = os.open(os.path.dirname(os.path.abspath(self.snapshot_file)), os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        os.ftruncate(self.journal, 0)
+        if self.fsync:
+            os.fsync(self.journal)
+        self.journal_records = 0
+        self.compactions += 1
+
+ ##@brief Сохранение оставшихся записей и закрытие журнала
+    def close(self):
+        if self.journal is None:
+            return
+        self.commit()
+        os.close(self.journal)
+        self.journal = None
+
+ ##@brief Метрики хранилища аренд
+ #@return Словарь с числом аренд, адресов в карантине, записей журнала, commit, сжатий и результатами восстановления
+    def stats(self):
+        return {
+            "leases": len(self.leases),
+            "quarantined": len(self.quarantine),
+            "journal_records": self.journal_records,
+            "buffered": self.buffered,
+            "commits": self.commits,
+            "compactions": self.compactions,
+            "recovered": self.recovered
+        }
+
+
+##@class LeaseExpiry
+##@brief Min-heap моментов окончания аренд и карантина с ленивым удалением
+#
+# При продлении аренды старая запись в куче не ищется: добавляется новая, а
+# устаревшая отбрасывается вызывающим кодом, когда подходит ее время (момент в
+# куче не совпадает с окончанием аренды в таблице). Если устаревших записей
+# становится больше, чем действующих, куча перестраивается за O(n).
+class LeaseExpiry:
+    def __init__(self):
+        self.heap = []
+
+    def __len__(self):
+        return len(self.heap)
+
+ ##@brief Добавление момента окончания
+ #@param [in] when Момент окончания в секундах Unix
+ #@param [in] address Адрес (целое число)
+    def schedule(self, when, address):
+        heapq.heappush(self.heap, (when, address))
+
+ ##@brief Ближайший момент окончания
+ #@return Момент в секундах Unix или None, если куча пуста
+    def next_deadline(self):
+        return self.heap[0][0] if self.heap else None
+
+ ##@brief Извлечение наступивших моментов окончания
+ #@param [in] now Текущее время в секундах Unix
+ #@return Генератор кортежей (момент, адрес) по возрастанию момента
+    def due(self, now):
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            yield heapq.heappop(heap)
+
+ ##@brief Перестроение кучи по действующим записям, если устаревших записей слишком много
+ #@param [in] records Итерируемое записей аренд (mac, ip, start, expiry, state)
+ #@param [in] live Количество действующих записей
+    def compact(self, records, live):
+        if len(self.heap) > 2 * live + 1024:
+            self.heap = [(record[3], record[1]) for record in records]
+            heapq.heapify(self.heap)
+
+
+##@class OfferReservations
+##@brief Таблица адресов, предложенных клиентам, со сроком резервирования
+#
+# Резервирование хранится по MAC-адресу клиента: повторный DISCOVER того же
+# клиента (в том числе с новым xid) получает тот же адрес. Сроки хранятся в
+# min-heap с ленивым удалением, как в LeaseExpiry.
+class OfferReservations:
+    def __init__(self):
+        self.by_mac = {}
+        self.by_address = {}
+        self.heap = []
+
+    def __len__(self):
+        return len(self.by_mac)
+
+ ##@brief Резервирование клиента
+ #@param [in] mac MAC-адрес клиента (6 байт)
+ #@return Кортеж (адрес, xid, окончание) или None
+    def get(self, mac):
+        return self.by_mac.get(mac)
+
+ ##@brief Клиент, за которым зарезервирован адрес
+ #@param [in] address Адрес (целое число)
+ #@return MAC-адрес или None
+    def owner(self, address):
+        return self.by_address.get(address)
+
+ ##@brief Резервирование адреса за клиентом или продление существующего
+ # Адрес должен быть уже занят в пуле вызывающим кодом.
+ #@param [in] mac MAC-адрес клиента (6 байт)
+ #@param [in] xid Идентификатор транзакции DISCOVER
+ #@param [in] address Адрес (целое число)
+ #@param [in] expiry Окончание резервирования в секундах
+    def reserve(self, mac, xid, address, expiry):
+        self.by_mac[mac] = (address, xid, expiry)
+        self.by_address[address] = mac
+        heapq.heappush(self.heap, (expiry, mac))
+
+ ##@brief Снятие резервирования клиента (адрес в пуле не освобождается)
+ #@param [in] mac MAC-адрес клиента (6 байт)
+ #@return Кортеж (адрес, xid, окончание) или None, если резервирования нет
+    def pop(self, mac):
+        reservation = self.by_mac.pop(mac, None)
+        if reservation is not None:
+            del self.by_address[reservation[0]]
+        return reservation
+
+ ##@brief Ближайшее окончание резервирования
+ #@return Момент в секундах или None
+    def next_deadline(self):
+        return self.heap[0][0] if self.heap else None
+
+ ##@brief Снятие резервирований с истекшим сроком
+ #@param [in] now Текущее время в секундах
+ #@return Генератор адресов, резервирование которых истекло
+    def expire(self, now):
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            expiry, mac = heapq.heappop(heap)
+            reservation = self.by_mac.get(mac)
+            if reservation is not None and reservation[2] == expiry:
+                self.pop(mac)
+                yield reservation[0]
+        if len(heap) > 2 * len(self.by_mac) + 1024:
+            self.heap = [(reservation[2], mac) for mac, reservation in self.by_mac.items()]
+            heapq.heapify(self.heap)
+
+
+##@class BindingIndex
+##@brief Привязка клиента (MAC-адрес, идентификатор клиента) к последнему выданному ему адресу
+#
+# Привязка сохраняется и после освобождения или окончания аренды, поэтому
+# значение - только подсказка: вызывающий код проверяет по таблице аренд и
+# пулу, что адрес все еще принадлежит клиенту или свободен. Привязки по MAC
+# восстанавливаются из действующих аренд при запуске, привязки по
+# идентификатору клиента хранятся только в памяти (в записи аренды есть место
+# только для MAC-адреса).
+class BindingIndex:
+    def __init__(self):
+        self.by_mac = {}
+        self.by_client_id = {}
+
+    def __len__(self):
+        return len(self.by_mac) + len(self.by_client_id)
+
+ ##@brief Восстановление привязок по MAC-адресу из записей аренд
+ #@param [in] records Итерируемое записей (mac, ip, start, expiry, state)
+    def rebuild(self, records):
+        for record in records:
+            if any(record[0]):
+                self.by_mac[record[0]] = record[1]
+
+ ##@brief Привязка клиента к адресу
+ #@param [in] mac MAC-адрес клиента (6 байт)
+ #@param [in] client_id Значение опции 61 или None
+ #@param [in] address Адрес (целое число)
+    def bind(self, mac, client_id, address):
+        self.by_mac[mac] = address
+        if client_id is not None:
+            self.by_client_id[client_id] = address
+
+ ##@brief Последний адрес клиента: сначала по идентификатору клиента, затем по MAC-адресу
+ #@param [in] mac MAC-адрес клиента (6 байт)
+ #@param [in] client_id Значение опции 61 или None
+ #@return Адрес (целое число) или None
+    def lookup(self, mac, client_id):
+        if client_id is not None:
+            address = self.by_client_id.get(client_id)
+            if address is not None:
+                return address
+        return self.by_mac.get(mac)
+
+ ##@brief Удаление привязки клиента к адресу (например, после DHCPDECLINE)
+ #@param [in] mac MAC-адрес клиента (6 байт)
+ #@param [in] client_id Значение опции 61 или None
+ #@param [in] address Адрес (целое число)
+    def forget(self, mac, client_id, address):
+        if self.by_mac.get(mac) == address:
+            del self.by_mac[mac]
+        if client_id is not None and self.by_client_id.get(client_id) == address:
+            del self.by_client_id[client_id]
+
+
+##@class SubnetIndex
+##@brief Поиск подсети по адресу с выбором самого длинного префикса (longest-prefix match)
+#
+# Подсети хранятся в словарях сеть -> значение, по одному на каждую длину
+# префикса; словари просматриваются от длинных префиксов к коротким. Поиск
+# стоит не больше одного обращения к словарю на каждую различную длину
+# префикса (не больше 33) и не зависит от количества подсетей.
+class SubnetIndex:
+    def __init__(self):
+        self.levels = []
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+ ##@brief Добавление подсети
+ #@param [in] network Адрес сети (целое число, биты узла равны нулю)
+ #@param [in] prefix_length Длина префикса (0-32)
+ #@param [in] value Значение, возвращаемое lookup для адресов подсети
+ #@exception ValueError Подсеть уже добавлена или в адресе сети есть биты узла
+    def add(self, network, prefix_length, value):
+        mask = (0xFFFFFFFF << (32 - prefix_length)) & 0xFFFFFFFF
+        if network & ~mask & 0xFFFFFFFF:
+            raise ValueError(f"{int_to_ip(network)}/{prefix_length} has host bits set")
+        for length, _, table in self.levels:
+            if length == prefix_length:
+                break
+        else:
+            table = {}
+            self.levels.append((prefix_length, mask, table))
+            self.levels.sort(key=lambda level: level[0], reverse=True)
+        if network in table:
+            raise ValueError(f"subnet {int_to_ip(network)}/{prefix_length} is defined twice")
+        table[network] = value
+        self.values.append(value)
+
+ ##@brief Подсеть с самым длинным префиксом, содержащая адрес
+ #@param [in] address Адрес (целое число)
+ #@return Значение подсети или None, если адрес не входит ни в одну подсеть
+    def lookup(self, address):
+        for _, mask, table in self.levels:
+            value = table.get(address & mask)
+            if value is not None:
+                return value
+        return None
+
+ ##@brief Подсети с более коротким префиксом, содержащие заданную подсеть
+ #@param [in] network Адрес сети (целое число)
+ #@param [in] prefix_length Длина префикса
+ #@return Генератор значений охватывающих подсетей (от длинных префиксов к коротким)
+    def covering(self, network, prefix_length):
+        for length, mask, table in self.levels:
+            if length < prefix_length:
+                value = table.get(network & mask)
+                if value is not None:
+                    yield value
@@ -1,15 +1,15 @@
 ##@file dhcp_server.py
 ##@brief Этот файл содержит реализацию простого DHCP-сервера на Python.
 
+import argparse
+##@package argparse
+#Модуль для разбора аргументов командной строки.
+
 import socket
 ##@package socket
 #Модуль для работы с сетевыми сокетами.
 #Предоставляет классы и методы для создания и управления сетевыми соединениями.
 
-import datetime
-##@package datetime
-#Модуль для работы с датой и временем.
-
 import sys
 ##@package sys
 #Модуль для работы с системными функциями и параметрами.
@@ -18,9 +18,9 @@ import json
 ##@package json
 #Модуль для работы с JSON-файлами.
 
-import binascii
-##@package binascii
-#Модуль для преобразования бинарных данных в текстовые и обратно.
+import struct
+##@package struct
+#Модуль для разбора и сборки бинарных структур (заголовок BOOTP и опции DHCP).
 
 import signal
 ##@package signal
@@ -30,6 +30,91 @@ import os
 ##@package os
 #Модуль для работы с операционной системой, включая доступ к файловой системе.
 
+import select
+##@package select
+#Модуль для проверки наличия следующего пакета без блокировки (group commit аренд).
+
+import itertools
+##@package itertools
+#Модуль для обхода аренд и карантина одним итератором без копирования.
+
+import time
+##@package time
+#Модуль для замеров времени этапов обработки пакета.
+
+import asyncio
+##@package asyncio
+#Модуль для асинхронного режима сервера (AsyncDHCPServer).
+
+from collections import deque
+##@package collections
+#Модуль с очередью deque (сроки транзакций клиентов).
+
+from concurrent.futures import ThreadPoolExecutor
+##@package concurrent.futures
+#Модуль для записи журнала аренд в отдельном потоке в асинхронном режиме.
+
+from server_log import BatchLogger, LOG_DEBUG, LOG_INFO, LOG_WARNING, LOG_ERROR
+##@package server_log
+#Асинхронное пакетное логирование.
+
+from server_stats import ServerStats, start_stats_endpoint
+##@package server_stats
+#Счетчики, гистограммы задержек и точка чтения метрик.
+
+from dhcp_leases import AddressPool, BindingIndex, LeaseExpiry, LeaseStore, OfferReservations, SubnetIndex, LEASE_RELEASED, LEASE_EXPIRED, LEASE_DECLINED, int_to_ip, ip_to_int, parse_address_ranges
+##@package dhcp_leases
+#Битовая карта занятости адресов пула, журнал аренд, очередь их окончания, резервирование предложенных адресов, привязки клиентов и индекс подсетей.
+
+from dns_updates import DnsUpdatePublisher
+##@package dns_updates
+#Публикация событий аренд DNS-серверу (регистрация имен клиентов).
+
+##Наибольшее время ожидания пакета в секундах, после которого проверяются окончания аренд
+EXPIRY_POLL_INTERVAL = 1.0
+
+##@brief Состояния транзакции клиента (xid, MAC) в AsyncDHCPServer
+TRANSACTION_SELECTING = 1
+TRANSACTION_REQUESTING = 2
+TRANSACTION_BOUND = 3
+
+##@brief Формат заголовка BOOTP до chaddr: op, htype, hlen, hops, xid, secs, flags, ciaddr, yiaddr, siaddr, giaddr
+DHCP_HEADER = struct.Struct('!BBBBIHHIIII')
+##@brief Смещение поля chaddr (аппаратный адрес клиента)
+DHCP_CHADDR_OFFSET = 28
+##@brief Смещение поля yiaddr (адрес, выданный клиенту)
+DHCP_YIADDR_OFFSET = 16
+##@brief Магическое число DHCP перед опциями и его смещение
+DHCP_MAGIC_COOKIE = b'\x63\x82\x53\x63'
+DHCP_COOKIE_OFFSET = 236
+##@brief Смещение первой опции (заголовок BOOTP и магическое число)
+DHCP_OPTIONS_OFFSET = 240
+##@brief Размер буфера приема и сборки DHCP-пакетов (MTU Ethernet)
+DHCP_BUFFER_SIZE = 1500
+##@brief Наименьший размер ответа: BOOTP relay отбрасывают пакеты короче 300 байт (RFC 1542)
+DHCP_MIN_PACKET = 300
+##@brief Значения поля op
+BOOTREQUEST, BOOTREPLY = 1, 2
+##@brief Типы сообщений DHCP (опция 53)
+DHCPDISCOVER, DHCPOFFER, DHCPREQUEST, DHCPDECLINE, DHCPACK, DHCPNAK, DHCPRELEASE, DHCPINFORM = range(1, 9)
+##@brief Коды опций DHCP
+OPTION_PAD = 0
+OPTION_SUBNET_MASK = 1
+OPTION_ROUTER = 3
+OPTION_DNS = 6
+OPTION_HOSTNAME = 12
+OPTION_REQUESTED_ADDRESS = 50
+OPTION_LEASE_TIME = 51
+OPTION_MESSAGE_TYPE = 53
+OPTION_SERVER_ID = 54
+OPTION_MESSAGE = 56
+OPTION_RENEWAL_TIME = 58
+OPTION_REBINDING_TIME = 59
+OPTION_CLIENT_ID = 61
+OPTION_END = 255
+##@brief Нули для дополнения ответа до DHCP_MIN_PACKET
+DHCP_PADDING = memoryview(bytes(DHCP_MIN_PACKET))
+
 
 ##@class DHCPServer
 ##@brief Класс для реализации простого DHCP-сервера.
@@ -46,15 +131,61 @@ class DHCPServer:
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.should_stop = False 
         self.package_dhcp_transcript = None
+        self.receive_buffer = bytearray(DHCP_BUFFER_SIZE)
+        self.receive_view = memoryview(self.receive_buffer)
+        self.reply_buffer = bytearray(DHCP_BUFFER_SIZE)
+        self.name_configuration = name_configuration
         self.Configuration=read_json_file(name_configuration)
+        self.logger = BatchLogger.from_configuration(output_file, self.Configuration)
+        if self.Configuration is None:
+            self.log_dhcp_server("Cannot read configuration file %s", name_configuration, level=LOG_ERROR)
+        try:
+            self.config = DhcpConfig.from_configuration(self.Configuration)
+        except ValueError:
+            self.logger.close()
+            raise
+        self.reload_requested = False
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        if os.path.exists('busy_ip_addresses_dhcp.json'):
-            self.available_ips=read_json_file('busy_ip_addresses_dhcp.json')
-        else:
-            self.available_ips=[]
+        self.lease_store = self.open_lease_store()
+        self.pools = self.create_address_pools()
+        self.subnet = self.config.default_subnet
+        self.lease_expiry = LeaseExpiry()
+        self.offers = OfferReservations()
+        self.bindings = BindingIndex()
+        self.bindings.rebuild(self.lease_store.leases.values())
+        for record in self.lease_store.leases.values():
+            self.lease_expiry.schedule(record[3], record[1])
+        for record in self.lease_store.quarantine.values():
+            self.lease_expiry.schedule(record[3], record[1])
+        self.deferred_replies = []
+        self.dns_updates = DnsUpdatePublisher(self.config.dns_update_socket)
+        self.stats = ServerStats("dhcp")
+        self.stats_endpoint = None
+        self.parse_time = self.stats.histogram("parse")
+        self.allocation_time = self.stats.histogram("allocation")
+        self.persist_time = self.stats.histogram("persist")
+        self.build_time = self.stats.histogram("build")
+        self.send_time = self.stats.histogram("send")
+        self.stats.gauge("subnets", lambda: len(self.pools))
+        self.stats.gauge("pool_size", lambda: sum(pool.capacity for pool in self.pools.values()))
+        self.stats.gauge("leases", lambda: len(self.lease_store.leases))
+        self.stats.gauge("quarantined", lambda: len(self.lease_store.quarantine))
+        self.stats.gauge("pool_free", lambda: sum(pool.capacity - pool.used for pool in self.pools.values()))
+        self.stats.gauge("pool_utilisation", lambda: round(sum(pool.used for pool in self.pools.values())
+                                                           / max(1, sum(pool.capacity for pool in self.pools.values())), 4))
+        self.stats.gauge("expiry_queue", lambda: len(self.lease_expiry))
+        self.stats.gauge("offers_reserved", lambda: len(self.offers))
+        self.stats.gauge("bindings", lambda: len(self.bindings))
+        self.stats.gauge("log_dropped", lambda: self.logger.dropped)
+        self.stats.gauge("lease_journal_records", lambda: self.lease_store.journal_records)
+        self.stats.gauge("lease_commits", lambda: self.lease_store.commits)
+        self.stats.gauge("lease_compactions", lambda: self.lease_store.compactions)
+        self.stats.gauge("dns_updates_sent", lambda: self.dns_updates.sent)
+        self.stats.gauge("dns_updates_dropped", lambda: self.dns_updates.dropped)
 
         signal.signal(signal.SIGINT, self.signal_handler)
+        signal.signal(signal.SIGHUP, self.reload_handler)
     
  ###@brief Метод для обработки сигнала остановки сервера.
  #@param [in] sig Сигнал операционной системы.
@@ -65,57 +196,411 @@ class DHCPServer:
         self.should_stop = True 
         sys.exit(0)
 
+ ##@brief Обработчик SIGHUP: перечитывание конфигурации в основном цикле после текущей пачки пакетов
+ #@param [in] sig Сигнал операционной системы.
+ #@param [in] frame Контекст выполнения программы.
+    def reload_handler(self, sig, frame):
+        self.reload_requested = True
+
+ ##@brief Перечитывание configuration.json и замена конфигурации
+ # Если файл не читается, не является JSON или содержит ошибку, сервер
+ # продолжает работу с прежней конфигурацией (счетчик config_reload_failed). Пулы
+ # пересоздаются по действующим арендам, если изменились подсети, границы пулов
+ # или исключения (резервирования предложенных адресов при этом сбрасываются).
+ # Журнал, снимок, точка метрик и логирование применяются только при перезапуске.
+    def reload_configuration(self):
+        self.reload_requested = False
+        try:
+            with open(self.name_configuration, 'r', encoding='utf-8') as file:
+                config = DhcpConfig.from_configuration(json.load(file))
+        except (OSError, ValueError) as e:
+            self.stats.increment("config_reload_failed")
+            self.log_dhcp_server("Configuration reload failed, keeping the current configuration: %s", str(e), level=LOG_ERROR)
+            return
+        previous, self.config = self.config, config
+        if pool_layout(previous) != pool_layout(config):
+            self.pools = self.create_address_pools()
+            self.offers = OfferReservations()
+        changed = [name for name in DhcpConfig.RESTART_FIELDS if getattr(previous, name) != getattr(config, name)]
+        if changed:
+            self.log_dhcp_server("Configuration reloaded; %s change only after a restart", ', '.join(changed), level=LOG_WARNING)
+        else:
+            self.log_dhcp_server("Configuration reloaded")
+        self.subnet = config.default_subnet
+        self.stats.increment("config_reloads")
+
  ###@brief Метод для записи логов DHCP-сервера.
+ # Запись передается фоновому потоку BatchLogger и не блокирует обработку пакетов.
  #@param [in, out] log Строка с сообщением для записи в лог.
-    def log_dhcp_server(self, log):
-        now = datetime.datetime.now()
-        formatted_time = now.strftime('%Y-%m-%d %H:%M:%S')
-        with open(self.output_file, 'a+') as f:
-            f.write(f"{formatted_time}: {log}\n")
+ #@param [in] args Аргументы для отложенного форматирования log % args.
+ #@param [in] level Уровень сообщения (LOG_DEBUG ... LOG_ERROR).
+    def log_dhcp_server(self, log, *args, level=LOG_INFO):
+        self.logger.log(level, log, *args)
+
+ ##@brief Открытие хранилища аренд (журнал DHCP_LEASE_JOURNAL и снимок DHCP_LEASE_SNAPSHOT)
+ # Если журнала и снимка еще нет, адреса переносятся из busy_ip_addresses_dhcp.json
+ # прежних версий сервера. MAC-адрес таких аренд неизвестен (нулевой), поэтому
+ # они не принадлежат ни одному клиенту: запрос их адреса получает NAK, пока
+ # аренда не истечет.
+ #@return Экземпляр LeaseStore
+    def open_lease_store(self):
+        journal_file = self.config.lease_journal
+        snapshot_file = self.config.lease_snapshot
+        migrate = not os.path.exists(journal_file) and not os.path.exists(snapshot_file) and os.path.exists('busy_ip_addresses_dhcp.json')
+        store = LeaseStore(journal_file, snapshot_file, fsync=self.config.lease_fsync, compact_records=self.config.compact_records)
+        if migrate:
+            now = time.time()
+            busy = read_json_file('busy_ip_addresses_dhcp.json')
+            if busy is None:
+                self.log_dhcp_server("Cannot read busy_ip_addresses_dhcp.json, no leases moved", level=LOG_WARNING)
+            for address in busy or []:
+                store.record(bytes(6), address, now, now + self.config.lease_time)
+            store.commit()
+            self.log_dhcp_server("Moved %d leases from busy_ip_addresses_dhcp.json to %s", len(store.leases), journal_file)
+        self.log_dhcp_server("Lease store: %r", store.recovered)
+        return store
+
+ ##@brief Создание пулов адресов подсетей (START_IP_ADDRESS-START_IP_END) и восстановление занятых адресов
+ # Из выдачи исключаются адреса DHCP_EXCLUDED_ADDRESSES подсети, а также IP_DHCP,
+ # IP_DNS и IP_ROUTER, если они попадают в диапазон (см. DhcpSubnet.excluded).
+ # Аренда попадает в пул подсети, выбранной по ее адресу. Адреса в карантине тоже заняты.
+ #@return Словарь имя подсети -> AddressPool
+    def create_address_pools(self):
+        pools = {subnet.name: AddressPool(subnet.pool_start, subnet.pool_end, subnet.excluded) for subnet in self.config.subnets}
+        for address in itertools.chain(self.lease_store.leases, self.lease_store.quarantine):
+            subnet = self.config.subnets.lookup(address)
+            if subnet is None or not pools[subnet.name].take(address):
+                self.log_dhcp_server("Stored lease %s is outside the pools or excluded, dropped", int_to_ip(address), level=LOG_WARNING)
+        return pools
+
+ ##@brief Пул, в диапазон которого входит адрес
+ #@param [in] address Адрес (целое число)
+ #@return Экземпляр AddressPool или None, если адрес не входит ни в один пул
+    def pool_for(self, address):
+        subnet = self.config.subnets.lookup(address)
+        if subnet is None:
+            return None
+        pool = self.pools[subnet.name]
+        return pool if address in pool else None
+
+ ##@brief Освобождение адреса в его пуле (адреса вне пулов, например после SIGHUP, пропускаются)
+ #@param [in] address Адрес (целое число)
+    def release_address(self, address):
+        pool = self.pool_for(address)
+        if pool is not None:
+            pool.release(address)
+
+ ##@brief Подсеть запроса
+ # Запрос через relay-агент обслуживается подсетью giaddr, запрос клиента с
+ # адресом (RENEWING, REBINDING) - подсетью ciaddr. Остальные запросы пришли
+ # с интерфейса сервера (IP_DHCP/MASK_DHCP): сервер слушает один сокет, поэтому
+ # интерфейс приема определяется конфигурацией, а не IP_PKTINFO.
+ #@param [in] request Разобранный запрос PakageDhcpWire
+ #@return Экземпляр DhcpSubnet или None, если сервер не обслуживает подсеть
+    def select_subnet(self, request):
+        if request.giaddr:
+            return self.config.subnets.lookup(request.giaddr)
+        if request.ciaddr:
+            return self.config.subnets.lookup(request.ciaddr)
+        return self.config.default_subnet
     
  ##@brief Метод для запуска DHCP-сервера.
+ # Пакеты, уже ожидающие в сокете, обрабатываются пачкой (до DHCP_LEASE_COMMIT_BATCH),
+ # после чего истекшие аренды освобождаются, аренды пачки сохраняются одним fsync
+ # и отправляются отложенные ACK. Ожидание пакета ограничено ближайшим окончанием аренды.
+ # Конфигурация перечитывается между пачками по сигналу SIGHUP.
     def start(self):
         try:
             self.socket.bind((self.ip_address, self.port))
+            self.stats_endpoint = start_stats_endpoint(self.stats, self.config.stats_address,
+                                                       self.log_dhcp_server)
             self.log_dhcp_server(f"The DHCP server is running on {self.ip_address}:{self.port}")
-            received_data = b''
             while not self.should_stop: 
-                data, addr = self.socket.recvfrom(1024)
-                received_data += data
-                self.log_dhcp_server(f"Do ff")
-             #Check if the 0xFF byte is contained in the received data
-                if b'\xff' in data:
-                 #Find the index of the first occurrence of the 0xFF byte
-                    index = received_data.index(b'\xff')
-                    
-                 #Trim the data up to and including the first occurrence of 0xFF
-                    package_dhcp = received_data[:index + 1]
-                self.package_dhcp_transcript = PakageDhcp(binascii.hexlify(package_dhcp).decode('utf-8'))
-                
-                if b'\x35' in package_dhcp:
-                    index = package_dhcp.index(b'\x35') + 2
-
-                    if package_dhcp[index] == 1:
-                        self.socket.sendto(binascii.unhexlify(self.dhcp_server_offer()), (self.package_dhcp_transcript.process_dhcp_message(message_type='02'),self.port+1)) #offer
-                    if package_dhcp[index] == 3:
-                        Num_Request = self.package_dhcp_transcript.option
-                        Request_IP_addres = Num_Request[Num_Request.find("32")+4:Num_Request.find("32")+12]
-                        if self.check_dhcp_packet_range_nack_or_pack(int(self.convert_ip_to_hex_format(self.Configuration['START_IP_ADDRESS']),16), int(self.convert_ip_to_hex_format(self.Configuration['START_IP_END']),16), int(Request_IP_addres,16)):
-                            self.available_ips.append(int(Request_IP_addres,16))
-                            write_to_json_file(self.available_ips, 'busy_ip_addresses_dhcp.json')
-                            self.socket.sendto(binascii.unhexlify(self.dhcp_server_pack(Request_IP_addres)), (self.package_dhcp_transcript.process_dhcp_message(message_type='05'),self.port+1)) #pack
-                        else:
-                            self.socket.sendto(binascii.unhexlify(self.dhcp_server_nack()), (self.package_dhcp_transcript.process_dhcp_message(message_type='06'),self.port+1)) #nack
-                            self.socket.sendto(binascii.unhexlify(self.dhcp_server_offer()), (self.package_dhcp_transcript.process_dhcp_message(message_type='02'),self.port+1)) #offer
-                received_data = b''
+                if select.select([self.socket], [], [], self.expiry_timeout())[0]:
+                    length, addr = self.socket.recvfrom_into(self.receive_buffer)
+                    self.handle_dhcp_packet(self.receive_view, length, addr)
+                    handled = 1
+                    while handled < self.config.commit_batch and select.select([self.socket], [], [], 0)[0]:
+                        length, addr = self.socket.recvfrom_into(self.receive_buffer)
+                        self.handle_dhcp_packet(self.receive_view, length, addr)
+                        handled += 1
+                self.expire_leases(time.time())
+                self.commit_leases()
+                if self.reload_requested:
+                    self.reload_configuration()
                 
         except OSError as e:
-            self.log_dhcp_server(f'Error when starting the server: {e}')
+            self.log_dhcp_server(f'Error when starting the server: {e}', level=LOG_ERROR)
 
         finally:
-            self.socket.close()
-            self.log_dhcp_server('DHCP server stopped')  
-    
+            self.finish()
+
+ ##@brief Закрытие сокета, сохранение аренд, остановка точки метрик и запись итоговой статистики в лог
+    def finish(self):
+        self.socket.close()
+        self.lease_store.close()
+        self.dns_updates.close()
+        if self.stats_endpoint is not None:
+            self.stats_endpoint.stop()
+        self.log_dhcp_server(f'Leases: {self.lease_store.stats()}')
+        self.log_dhcp_server('DNS updates: sent %d, dropped %d', self.dns_updates.sent, self.dns_updates.dropped)
+        self.log_dhcp_server('Pools: %s', ', '.join(f'{name} {pool.used}/{pool.capacity}' for name, pool in self.pools.items()))
+        self.log_dhcp_server(f'Log: {self.logger.stats()}')
+        self.log_dhcp_server('DHCP server stopped')
+        self.logger.close()
+
+ ##@brief Обработка одного DHCP-пакета
+ # Пакет разбирается прямо в буфере приема; поврежденные пакеты и ответы
+ # других серверов (op != BOOTREQUEST) отбрасываются.
+ #@param [in] view memoryview буфера приема
+ #@param [in] length Длина пакета в буфере
+ #@param [in] addr Адрес отправителя
+    def handle_dhcp_packet(self, view, length, addr):
+        if self.logger.sample_packet():
+            self.log_dhcp_server("Addr:%s\n Data %r", addr, bytes(view[:length]), level=LOG_DEBUG)
+        started = time.perf_counter_ns()
+        try:
+            request = PakageDhcpWire(view, length)
+        except ValueError as e:
+            self.stats.increment("malformed")
+            self.log_dhcp_server("Malformed DHCP packet from %s: %s", addr, e, level=LOG_DEBUG)
+            return
+        self.parse_time.record(time.perf_counter_ns() - started)
+        if request.op != BOOTREQUEST:
+            return
+        self.handle_request(request, addr)
+
+ ##@brief Обработка разобранного запроса клиента (BOOTREQUEST)
+ # Запросы из необслуживаемых подсетей отбрасываются. Адрес выдается из пула
+ # подсети запроса (см. select_subnet); запрос адреса из другой подсети (клиент
+ # переехал) получает NAK.
+ #@param [in] request Разобранный запрос PakageDhcpWire
+ #@param [in] addr Адрес отправителя
+    def handle_request(self, request, addr):
+        subnet = self.select_subnet(request)
+        if subnet is None:
+            self.stats.increment("no_subnet")
+            self.log_dhcp_server("No subnet for giaddr %s ciaddr %s, packet from %s dropped",
+                                 int_to_ip(request.giaddr), int_to_ip(request.ciaddr), addr, level=LOG_DEBUG)
+            return
+        self.package_dhcp_transcript = request
+        self.subnet = subnet
+        message_type = request.message_type()
+
+        if message_type == DHCPDISCOVER:
+            self.stats.increment("discover")
+            self.send_dhcp_reply(self.dhcp_server_offer, DHCPOFFER, "offer") #offer
+        elif message_type == DHCPREQUEST:
+            self.stats.increment("request")
+         #Option (50) Requested IP Address in SELECTING/INIT-REBOOT, ciaddr in RENEWING/REBINDING
+            address = request.address_option(OPTION_REQUESTED_ADDRESS)
+            if address is None:
+                address = request.ciaddr
+            mac = request.client_mac()
+            client_id = request.option(OPTION_CLIENT_ID)
+            started = time.perf_counter_ns()
+            pool = self.pools[subnet.name]
+            lease = self.lease_store.leases.get(address)
+            renewal = self.holds_lease(lease, mac, client_id)
+            available = address in pool and (renewal or self.offers.owner(address) == mac
+                                             or self.check_dhcp_packet_range_nack_or_pack(pool.start, pool.end, address))
+            self.allocation_time.record(time.perf_counter_ns() - started)
+            if available:
+                if renewal:
+                    self.stats.increment("renew")
+                self.bind_lease(mac, address, client_id, subnet.lease_time, request.option(OPTION_HOSTNAME))
+                self.send_dhcp_reply(self.dhcp_server_pack, DHCPACK, "ack", address, deferred=True) #pack
+            else:
+                self.send_dhcp_reply(self.dhcp_server_nack, DHCPNAK, "nak") #nack
+                self.send_dhcp_reply(self.dhcp_server_offer, DHCPOFFER, "offer") #offer
+        elif message_type == DHCPDECLINE:
+            self.stats.increment("decline")
+            address = request.address_option(OPTION_REQUESTED_ADDRESS)
+            if address is not None:
+                self.decline_lease(request.client_mac(), address, request.option(OPTION_CLIENT_ID))
+        elif message_type == DHCPRELEASE:
+            self.stats.increment("release")
+            self.release_lease(request.client_mac(), request.ciaddr, request.option(OPTION_CLIENT_ID))
+
+ ##@brief Проверка, что аренда принадлежит клиенту (по MAC-адресу или привязке идентификатора клиента)
+ #@param [in] lease Запись аренды (mac, ip, start, expiry, state) или None
+ #@param [in] mac MAC-адрес клиента (6 байт)
+ #@param [in] client_id Значение опции 61 или None
+ #@return True, если аренда принадлежит клиенту (перенесенная аренда с нулевым MAC-адресом - никому)
+    def holds_lease(self, lease, mac, client_id):
+        if lease is None or lease[0] == bytes(6):
+            return False
+        if lease[0] == mac:
+            return True
+        return client_id is not None and self.bindings.by_client_id.get(client_id) == lease[1]
+
+ ##@brief Выдача или продление аренды адреса клиенту
+ # Резервирование клиента снимается; если был зарезервирован другой адрес, он
+ # освобождается. Действующая аренда клиента на другой адрес (перезагрузка с
+ # запросом нового адреса) освобождается: у клиента одна аренда. Имя клиента
+ # публикуется DNS-серверу вместе с сохранением аренды (см. commit_leases).
+ #@param [in] mac MAC-адрес клиента (6 байт)
+ #@param [in] address Адрес (целое число)
+ #@param [in] client_id Значение опции 61 или None
+ #@param [in] lease_time Время аренды подсети адреса в секундах (по умолчанию TIME_IP подсети сервера)
+ #@param [in] hostname Значение опции 12 Host Name или None
+    def bind_lease(self, mac, address, client_id=None, lease_time=None, hostname=None):
+        leases = self.lease_store.leases
+        reservation = self.offers.pop(mac)
+        if reservation is not None and reservation[0] != address and reservation[0] not in leases:
+            self.release_address(reservation[0])
+        previous = self.bindings.lookup(mac, client_id)
+        if previous is not None and previous != address and self.holds_lease(leases.get(previous), mac, client_id):
+            self.lease_store.record(mac, previous, leases[previous][2], time.time(), LEASE_RELEASED)
+            self.release_address(previous)
+            self.dns_updates.remove(previous)
+        self.pool_for(address).take(address)
+        now = time.time()
+        record = self.lease_store.record(mac, address, now, now + (self.config.lease_time if lease_time is None else lease_time))
+        self.lease_expiry.schedule(record[3], address)
+        self.bindings.bind(mac, client_id, address)
+        self.dns_updates.add(address, hostname)
+
+ ##@brief Обработка DHCPRELEASE: адрес освобождается, если он арендован этим клиентом
+ # Привязка клиента сохраняется: при следующем DISCOVER ему предлагается тот же адрес, если он свободен.
+ #@param [in] mac MAC-адрес клиента (6 байт)
+ #@param [in] address Адрес из ciaddr (целое число)
+ #@param [in] client_id Значение опции 61 или None
+    def release_lease(self, mac, address, client_id=None):
+        lease = self.lease_store.leases.get(address)
+        if not self.holds_lease(lease, mac, client_id):
+            self.log_dhcp_server("DHCPRELEASE of %08x from %s ignored: not leased to this client", address, mac.hex(), level=LOG_DEBUG)
+            return
+        self.lease_store.record(mac, address, lease[2], time.time(), LEASE_RELEASED)
+        self.release_address(address)
+        self.dns_updates.remove(address)
+
+ ##@brief Обработка DHCPDECLINE: адрес занят другим узлом и не выдается до конца карантина
+ # Карантин длится DHCP_DECLINE_QUARANTINE секунд и переживает перезапуск сервера.
+ # Отклонить можно только адрес, арендованный или предложенный этому клиенту:
+ # иначе любой узел мог бы вывести из пула адрес из чужого предложения.
+ # Привязка клиента к адресу удаляется, чтобы адрес не был предложен ему снова.
+ #@param [in] mac MAC-адрес клиента (6 байт)
+ #@param [in] address Отклоненный адрес из опции 50 (целое число)
+ #@param [in] client_id Значение опции 61 или None
+    def decline_lease(self, mac, address, client_id=None):
+        pool = self.pool_for(address)
+        if pool is None:
+            return
+        lease = self.lease_store.leases.get(address)
+        if not self.holds_lease(lease, mac, client_id) and self.offers.owner(address) != mac:
+            self.log_dhcp_server("DHCPDECLINE of %08x from %s ignored: neither leased nor offered to this client", address, mac.hex(), level=LOG_DEBUG)
+            return
+        if lease is None:
+            self.offers.pop(mac)
+        self.bindings.forget(mac, client_id, address)
+        pool.take(address)
+        self.dns_updates.remove(address)
+        now = time.time()
+        record = self.lease_store.record(mac, address, now, now + self.config.decline_quarantine, LEASE_DECLINED)
+        self.lease_expiry.schedule(record[3], address)
+        self.log_dhcp_server("Address %08x declined by %s, quarantined for %d s", address, mac.hex(), self.config.decline_quarantine, level=LOG_WARNING)
+
+ ##@brief Время ожидания пакета до ближайшего окончания аренды или резервирования
+ #@return Секунды, не больше EXPIRY_POLL_INTERVAL
+    def expiry_timeout(self):
+        deadlines = [deadline for deadline in (self.lease_expiry.next_deadline(), self.offers.next_deadline()) if deadline is not None]
+        if not deadlines:
+            return EXPIRY_POLL_INTERVAL
+        return min(EXPIRY_POLL_INTERVAL, max(0.0, min(deadlines) - time.time()))
+
+ ##@brief Освобождение адресов с истекшей арендой, карантином или резервированием
+ # Записи кучи, не совпадающие с окончанием в таблице аренд (аренда продлена,
+ # освобождена или выдана заново), пропускаются.
+ #@param [in] now Текущее время в секундах Unix
+ #@return Количество освобожденных адресов
+    def expire_leases(self, now):
+        expired = 0
+        leases, quarantine = self.lease_store.leases, self.lease_store.quarantine
+        for when, address in self.lease_expiry.due(now):
+            record = leases.get(address) or quarantine.get(address)
+            if record is None or record[3] != when:
+                continue
+            self.lease_store.record(record[0], address, record[2], when, LEASE_EXPIRED)
+            self.release_address(address)
+            self.dns_updates.remove(address)
+            expired += 1
+        if expired:
+            self.stats.increment("expired", expired)
+            self.log_dhcp_server("%d leases expired", expired, level=LOG_DEBUG)
+        self.lease_expiry.compact(itertools.chain(leases.values(), quarantine.values()), len(leases) + len(quarantine))
+        offers = 0
+        for address in self.offers.expire(now):
+            if address not in leases and address not in quarantine:
+                self.release_address(address)
+            offers += 1
+        if offers:
+            self.stats.increment("offer_expired", offers)
+        return expired
+
+ ##@brief Сохранение аренд пачки (group commit), публикация событий аренд DNS-серверу и отправка отложенных до него ACK
+    def commit_leases(self):
+        if self.lease_store.buffered:
+            started = time.perf_counter_ns()
+            self.lease_store.commit()
+            self.persist_time.record(time.perf_counter_ns() - started)
+        self.dns_updates.flush()
+        for packet, target, event in self.deferred_replies:
+            started = time.perf_counter_ns()
+            self.send_packet(packet, target)
+            self.send_time.record(time.perf_counter_ns() - started)
+            self.stats.increment(event)
+        self.deferred_replies.clear()
+
+ ##@brief Сборка и отправка ответа клиенту с замером этапов build и send
+ # Ответ собирается в reply_buffer; отложенный ответ копируется из буфера.
+ # Для OFFER время build включает выбор адреса (он же отдельно учитывается в allocation).
+ #@param [in] build Метод сборки пакета (dhcp_server_offer, dhcp_server_pack, dhcp_server_nack)
+ #@param [in] message_type Тип сообщения для выбора адреса назначения (DHCPOFFER, DHCPACK, DHCPNAK)
+ #@param [in] event Имя счетчика отправленных сообщений
+ #@param [in] args Аргументы метода сборки
+ #@param [in] deferred Отправить после сохранения аренд пачки (commit_leases), а не сразу
+    def send_dhcp_reply(self, build, message_type, event, *args, deferred=False):
+        started = time.perf_counter_ns()
+        length = build(*args)
+        if length is None:
+            return
+        target = self.reply_address(message_type)
+        built = time.perf_counter_ns()
+        self.build_time.record(built - started)
+        if deferred:
+            self.deferred_replies.append((bytes(self.reply_buffer[:length]), target, event))
+            return
+        self.send_packet(memoryview(self.reply_buffer)[:length], target)
+        self.send_time.record(time.perf_counter_ns() - built)
+        self.stats.increment(event)
+
+ ##@brief Отправка собранного ответа
+ #@param [in] packet Ответ (bytes или memoryview буфера ответа)
+ #@param [in] target Кортеж (адрес, порт)
+    def send_packet(self, packet, target):
+        self.socket.sendto(packet, target)
+
+ ##@brief Адрес назначения ответа на текущий запрос
+ # Ответы на запросы через relay-агент отправляются агенту (giaddr) на порт
+ # сервера (RFC 2131, 4.1). OFFER отправляется на ciaddr клиента, если он задан;
+ # при нулевом поле flags - на широковещательный адрес подсети, иначе на
+ # выданный адрес yiaddr. ACK и NAK всегда отправляются на широковещательный
+ # адрес подсети. Клиентам ответ отправляется на порт сервера + 1.
+ #@param [in] message_type Тип ответа (DHCPOFFER, DHCPACK, DHCPNAK)
+ #@return Кортеж (адрес в виде строки IPv4, порт)
+    def reply_address(self, message_type):
+        request = self.package_dhcp_transcript
+        if request.giaddr:
+            return int_to_ip(request.giaddr), self.port
+        if message_type == DHCPACK or message_type == DHCPNAK:
+            return self.subnet.broadcast_address, self.port+1
+        if request.ciaddr:
+            return int_to_ip(request.ciaddr), self.port+1
+        if not request.flags:
+            return self.subnet.broadcast_address, self.port+1
+        return socket.inet_ntoa(bytes(self.reply_buffer[DHCP_YIADDR_OFFSET:DHCP_YIADDR_OFFSET + 4])), self.port+1
+
  ##@brief Метод для проверки, находится ли IP-адрес в заданном диапазоне и доступен ли он.
  #@param [in] ip_start Начальный IP-адрес.
  #@param [in] ip_end Конечный IP-адрес.
@@ -124,96 +609,80 @@ class DHCPServer:
     def check_dhcp_packet_range_nack_or_pack(self, ip_start, ip_end, num):
      #Check if num is within the range [ip_start, ip_end]
         if ip_start <= num <= ip_end:
-         #If num is within the range, check its presence in the array
-            if not num in self.available_ips:
-                return True  #Return True if num is found in the array
-        return False  #Return False if num is out of range or not found in the array
+         #If num is within the range, check the address bitmap of its pool (excluded addresses are never free)
+            pool = self.pool_for(num)
+            return pool is not None and pool.is_free(num)
+        return False  #Return False if num is out of range
     
  ##@brief Метод для формирования DHCP-пакета с предложением IP-адреса (OFFER).
- #@return Сформированный DHCP-пакет в формате hex.
+ #@return Длина пакета в reply_buffer или None, если в пуле нет свободных адресов.
     def dhcp_server_offer(self):
-        time_ip= hex(int(self.Configuration['TIME_IP']))[2:]
-        temp_dhcp_pacet = self.package_dhcp_transcript
-        option = [
-        '350102',  #Option (53) DHCP Message Type
-        '3604', self.convert_ip_to_hex_format(self.Configuration['IP_DHCP']),  #Option (54) DHCP Server Identifier
-        '3304',(8-len(time_ip))*'0'+time_ip,  #Option (51) IP Address Lease Time
-        '0104', self.convert_ip_to_hex_format(self.Configuration['MASK_DHCP']),  #Option (1) Subnet Mask
-        '0304', self.convert_ip_to_hex_format(self.Configuration['IP_ROUTER']),  #Option (3) Router
-        '0608', self.convert_ip_to_hex_format(self.Configuration['IP_DNS']) + '00000000'  #Option (6) Domain Name Server
-        ]
-        end = 'ff'
-
-        temp_dhcp_pacet.message_type = '02'
-        temp_dhcp_pacet.your_client_ip_address=self.find_available_ip_offer(int(self.convert_ip_to_hex_format(self.Configuration['START_IP_ADDRESS']),16), int(self.convert_ip_to_hex_format(self.Configuration['START_IP_END']),16))
-        
-        result = ''
-        for name, value in vars(temp_dhcp_pacet).items():
-            if name != 'option':
-                result+=value
-            else:
-                break
-        
-        return result + ''.join(option) + end
+        started = time.perf_counter_ns()
+        request = self.package_dhcp_transcript
+        your_client_ip_address = self.reserve_offer(request.client_mac(), request.xid, request.option(OPTION_CLIENT_ID))
+        self.allocation_time.record(time.perf_counter_ns() - started)
+        if your_client_ip_address is None:
+            self.stats.increment("pool_exhausted")
+            self.log_dhcp_server("No free addresses in the pool of %s, DISCOVER is not answered", self.subnet.name, level=LOG_WARNING)
+            return None
+        return build_dhcp_reply(self.reply_buffer, self.package_dhcp_transcript, your_client_ip_address,
+                                self.subnet.offer_options)
 
  ##@brief Метод для формирования DHCP-пакета с подтверждением (ACK).
- #@param [in] Request_IP_addres Запрашиваемый IP-адрес.
- #@return Сформированный DHCP-пакет в формате hex.
+ #@param [in] Request_IP_addres Запрашиваемый IP-адрес (целое число).
+ #@return Длина пакета в reply_buffer.
     def dhcp_server_pack(self,Request_IP_addres):
-        time_ip= hex(int(self.Configuration['TIME_IP']))[2:]
-        temp_dhcp_pacet = self.package_dhcp_transcript
-        option = [
-        '350105',  #Option (53) DHCP Message Type
-        '3604', self.convert_ip_to_hex_format(self.Configuration['IP_DHCP']),  #Option (54) DHCP Server Identifier
-        '3304',(8-len(time_ip))*'0'+time_ip,  #Option (51) IP Address Lease Time
-        '0104', self.convert_ip_to_hex_format(self.Configuration['MASK_DHCP']),  #Option (1) Subnet Mask
-        '0304', self.convert_ip_to_hex_format(self.Configuration['IP_ROUTER']),  #Option (3) Router
-        '0608', self.convert_ip_to_hex_format(self.Configuration['IP_DNS']) + '00000000'  #Option (6) Domain Name Server
-        ]
-        end = 'ff'
-
-        temp_dhcp_pacet.message_type = '02'
-        temp_dhcp_pacet.your_client_ip_address=Request_IP_addres
-        
-        result = ''
-        for name, value in vars(temp_dhcp_pacet).items():
-            if name != 'option':
-                result+=value
-            else:
-                break
-        
-        return result + ''.join(option) + end
+        return build_dhcp_reply(self.reply_buffer, self.package_dhcp_transcript, Request_IP_addres,
+                                self.subnet.ack_options)
 
  ##@brief Метод для формирования DHCP-пакета с отказом (NACK).
- #@return Сформированный DHCP-пакет в формате hex.
+ #@return Длина пакета в reply_buffer.
     def dhcp_server_nack(self):
-        temp_dhcp_pacet = self.package_dhcp_transcript
-        option = [
-        '350106',  #Option (53) DHCP Message Type
-        '3604', self.convert_ip_to_hex_format(self.Configuration['IP_DHCP']),  #Option (54) DHCP Server Identifier
-        '381561646472657373206e6f7420617661696c61626c65'  #Option (56) Message
-        ]
-        end = 'ff'
-
-        temp_dhcp_pacet.message_type = '02'
-        
-        result = ''
-        for name, value in vars(temp_dhcp_pacet).items():
-            if name != 'option':
-                result+=value
-            else:
-                break
-        
-        return result + ''.join(option) + end
+        return build_dhcp_reply(self.reply_buffer, self.package_dhcp_transcript, 0, self.config.nak_options)
         
  ##@brief Поиск доступного IP-адреса для предложения
- #@param [in] start_ip Начальный IP-адрес диапазона
- #@param [in] end_ip Конечный IP-адрес диапазона
- #@return Доступный IP-адрес в шестнадцатеричном формате
-    def find_available_ip_offer(self,start_ip, end_ip):
-        for ip in range(start_ip, end_ip + 1):
-            if ip not in self.available_ips:
-                return (8 - len(hex(ip)[2:])) * '0' + hex(ip)[2:]
+ # Адрес не занимается: см. reserve_offer.
+ #@return Доступный IP-адрес (целое число) или None, если пул исчерпан
+    def find_available_ip_offer(self):
+        return self.pools[self.subnet.name].next_free()
+
+ ##@brief Выбор и резервирование адреса для DHCPOFFER
+ # Клиенту с резервированием (повторный DISCOVER) предлагается тот же адрес со
+ # сроком, продленным на DHCP_OFFER_TIMEOUT. Клиенту с привязкой предлагается
+ # его действующая аренда или прежний адрес, если он свободен. Иначе свободный
+ # адрес занимается в пуле до REQUEST клиента или окончания срока (см. expire_leases).
+ # Адреса берутся только из пула подсети запроса (self.subnet): резервирование
+ # в другой подсети (клиент переехал за другой relay-агент) снимается.
+ #@param [in] mac MAC-адрес клиента (6 байт)
+ #@param [in] xid Идентификатор транзакции
+ #@param [in] client_id Значение опции 61 или None
+ #@return Адрес (целое число) или None, если пул исчерпан
+    def reserve_offer(self, mac, xid, client_id=None):
+        pool = self.pools[self.subnet.name]
+        reservation = self.offers.get(mac)
+        if reservation is not None and reservation[0] not in pool:
+            self.offers.pop(mac)
+            if reservation[0] not in self.lease_store.leases:
+                self.release_address(reservation[0])
+            reservation = None
+        previous = self.bindings.lookup(mac, client_id)
+        if previous is not None and previous not in pool:
+            previous = None
+        if reservation is not None:
+            address = reservation[0]
+            self.stats.increment("offer_repeated")
+        elif previous is not None and self.holds_lease(self.lease_store.leases.get(previous), mac, client_id):
+            address = previous
+            self.stats.increment("offer_bound")
+        elif previous is not None and pool.take(previous):
+            address = previous
+            self.stats.increment("offer_previous")
+        else:
+            address = pool.allocate()
+            if address is None:
+                return None
+        self.offers.reserve(mac, xid, address, time.time() + self.config.offer_timeout)
+        return address
     
  ##@brief Закрытие сокета и завершение работы сервера
  #@return None
@@ -232,6 +701,510 @@ class DHCPServer:
         arr_with_zero = ['0' + item if len(item) < 2 else item for item in array_item_hex]
         return ''.join(arr_with_zero)
 
+##@class AsyncDHCPServer
+##@brief DHCP-сервер на asyncio с транзакциями клиентов и сохранением аренд вне обработки пакетов
+#
+# Пакеты обрабатываются в обработчике датаграммы тем же кодом, что и в
+# DHCPServer. Запись журнала аренд (write, fsync, сжатие) выполняется в
+# отдельном потоке: пока идет fsync одной пачки, цикл событий продолжает
+# отвечать OFFER и NAK и принимать REQUEST, аренды которых войдут в следующую
+# пачку (group commit без DHCP_LEASE_COMMIT_BATCH). ACK отправляется только
+# после сохранения своей аренды.
+#
+# Транзакции клиентов (xid, MAC) хранятся в DhcpTransactions: повторно
+# отправленные клиентом DISCOVER и REQUEST получают сохраненный ответ без
+# повторного выбора адреса и записи в журнал.
+class AsyncDHCPServer(DHCPServer):
+ #Параметры совпадают с DHCPServer
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.transport = None
+        self.persist_task = None
+        self.lease_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dhcp-lease-writer")
+        self.transactions = DhcpTransactions(self.config.offer_timeout)
+        self.stats.gauge("transactions", lambda: len(self.transactions))
+
+ ##@brief Запуск DHCP-сервера и обработка запросов в цикле событий asyncio
+    def start(self):
+        try:
+            asyncio.run(self.serve())
+        except OSError as e:
+            self.log_dhcp_server(f'Error when starting the server: {e}', level=LOG_ERROR)
+        finally:
+            self.lease_writer.shutdown(wait=True)
+            self.finish()
+
+ ##@brief Корутина сервера: открытие транспорта, окончания аренд и транзакций, перечитывание конфигурации
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self.socket.bind((self.ip_address, self.port))
+        self.socket.setblocking(False)
+        self.stats_endpoint = start_stats_endpoint(self.stats, self.config.stats_address, self.log_dhcp_server)
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: DhcpServerProtocol(self), sock=self.socket)
+        loop.add_signal_handler(signal.SIGINT, self.request_stop)
+        loop.add_signal_handler(signal.SIGHUP, self.reload_handler, signal.SIGHUP, None)
+        self.log_dhcp_server(f"The async DHCP server is running on {self.ip_address}:{self.port}")
+        try:
+            while not self.should_stop:
+                await asyncio.sleep(self.expiry_timeout())
+                self.expire_leases(time.time())
+                self.transactions.expire(time.monotonic())
+                self.schedule_persist()
+                if self.reload_requested:
+                    self.reload_configuration()
+        finally:
+            if self.persist_task is not None:
+                await self.persist_task
+            self.transport.close()
+
+ ##@brief Обработчик SIGINT в цикле событий: цикл serve завершается на ближайшей проверке сроков
+    def request_stop(self):
+        self.log_dhcp_server("Received SIGINT, stopping DHCP server gracefully.")
+        self.should_stop = True
+
+ ##@brief Обработка датаграммы клиента и запуск сохранения аренд, если они изменились
+ #@param [in] data Данные пакета
+ #@param [in] addr Адрес отправителя
+    def datagram_received(self, data, addr):
+        self.handle_dhcp_packet(memoryview(data), len(data), addr)
+        self.schedule_persist()
+
+ ##@brief Обработка запроса с учетом транзакции клиента (xid, MAC)
+ # Повтор DISCOVER в состоянии SELECTING получает сохраненный OFFER, повтор
+ # REQUEST в состоянии REQUESTING отбрасывается (ACK уйдет после сохранения
+ # аренды), повтор REQUEST того же адреса в состоянии BOUND получает
+ # сохраненный ACK. Остальные запросы обрабатываются DHCPServer.handle_request.
+ #@param [in] request Разобранный запрос PakageDhcpWire
+ #@param [in] addr Адрес отправителя
+    def handle_request(self, request, addr):
+        message_type = request.message_type()
+        key = (request.xid, request.client_mac())
+        transaction = self.transactions.get(key)
+        if transaction is not None:
+            state, reply, target = transaction[0], transaction[1], transaction[2]
+            if message_type == DHCPDISCOVER and state == TRANSACTION_SELECTING:
+                self.stats.increment("retransmit")
+                self.transport.sendto(reply, target)
+                return
+            if message_type == DHCPREQUEST and state == TRANSACTION_REQUESTING:
+                self.stats.increment("retransmit_dropped")
+                return
+            if message_type == DHCPREQUEST and state == TRANSACTION_BOUND:
+                address = request.address_option(OPTION_REQUESTED_ADDRESS)
+                if (request.ciaddr if address is None else address) == int.from_bytes(reply[DHCP_YIADDR_OFFSET:DHCP_YIADDR_OFFSET + 4], 'big'):
+                    self.stats.increment("retransmit")
+                    self.transport.sendto(reply, target)
+                    return
+        deferred = len(self.deferred_replies)
+        super().handle_request(request, addr)
+        if len(self.deferred_replies) > deferred:
+            self.transactions.update(key, TRANSACTION_REQUESTING, None, None, time.monotonic())
+
+ ##@brief Отправка ответа через транспорт asyncio с обновлением транзакции клиента
+ #@param [in] packet Ответ (bytes или memoryview буфера ответа)
+ #@param [in] target Кортеж (адрес, порт)
+    def send_packet(self, packet, target):
+        self.transport.sendto(packet, target)
+        self.transactions.replied(packet, target, time.monotonic())
+
+ ##@brief Запуск сохранения аренд, если есть несохраненные записи или ожидающие ACK и сохранение еще не идет
+    def schedule_persist(self):
+        if self.persist_task is None and (self.lease_store.buffered or self.deferred_replies):
+            self.persist_task = asyncio.get_running_loop().create_task(self.persist())
+
+ ##@brief Сохранение аренд пачками в потоке lease_writer и отправка ACK сохраненных аренд
+ # Пачка - все записи, накопленные к началу предыдущего fsync. События аренд
+ # пачки публикуются DNS-серверу после ее сохранения, до отправки ACK. При
+ # ошибке записи ACK пачки не отправляются, а сервер останавливается, как и DHCPServer.
+    async def persist(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self.lease_store.buffered or self.deferred_replies:
+                replies, self.deferred_replies = self.deferred_replies, []
+                batch = self.lease_store.detach()
+                updates = self.dns_updates.detach()
+                if batch[1]:
+                    started = time.perf_counter_ns()
+                    await loop.run_in_executor(self.lease_writer, self.lease_store.write, *batch)
+                    self.persist_time.record(time.perf_counter_ns() - started)
+                self.dns_updates.send(updates)
+                for packet, target, event in replies:
+                    started = time.perf_counter_ns()
+                    self.send_packet(packet, target)
+                    self.send_time.record(time.perf_counter_ns() - started)
+                    self.stats.increment(event)
+        except OSError as e:
+            self.log_dhcp_server(f'Lease journal write failed, stopping the server: {e}', level=LOG_ERROR)
+            self.should_stop = True
+        finally:
+            self.persist_task = None
+
+##@class DhcpServerProtocol
+##@brief Протокол asyncio для сокета, принимающего запросы клиентов
+class DhcpServerProtocol(asyncio.DatagramProtocol):
+ #@param [in] server Экземпляр AsyncDHCPServer
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        self.server.datagram_received(data, addr)
+
+    def error_received(self, exc):
+        self.server.log_dhcp_server(f"Socket error: {exc}", level=LOG_WARNING)
+
+##@class DhcpTransactions
+##@brief Транзакции клиентов (xid, MAC) с последним ответом для повтора на ретрансляции
+#
+# SELECTING - клиенту отправлен OFFER. REQUESTING - REQUEST принят, ACK ждет
+# сохранения аренды. BOUND - ACK отправлен. NAK завершает транзакцию. Запись
+# живет timeout секунд с последнего изменения; срок у всех записей одинаковый,
+# поэтому очередь сроков упорядочена и истечение стоит O(1) на запись.
+class DhcpTransactions:
+ #@param [in] timeout Время жизни транзакции в секундах (DHCP_OFFER_TIMEOUT)
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.entries = {}
+        self.deadlines = deque()
+
+    def __len__(self):
+        return len(self.entries)
+
+ ##@brief Транзакция клиента
+ #@param [in] key Кортеж (xid, MAC-адрес)
+ #@return Кортеж (состояние, ответ, адрес назначения, срок) или None
+    def get(self, key):
+        return self.entries.get(key)
+
+ ##@brief Переход транзакции в состояние
+ #@param [in] key Кортеж (xid, MAC-адрес)
+ #@param [in] state Состояние (TRANSACTION_SELECTING ... TRANSACTION_BOUND)
+ #@param [in] reply Последний ответ клиенту (bytes) или None
+ #@param [in] target Адрес назначения ответа или None
+ #@param [in] now Текущее монотонное время
+    def update(self, key, state, reply, target, now):
+        expiry = now + self.timeout
+        self.entries[key] = (state, reply, target, expiry)
+        self.deadlines.append((expiry, key))
+
+ ##@brief Учет отправленного ответа: OFFER - SELECTING, ACK - BOUND, NAK завершает транзакцию
+ # Тип ответа читается из первой опции: блоки опций DhcpConfig начинаются с опции 53.
+ #@param [in] packet Ответ
+ #@param [in] target Адрес назначения
+ #@param [in] now Текущее монотонное время
+    def replied(self, packet, target, now):
+        key = (int.from_bytes(packet[4:8], 'big'), bytes(packet[DHCP_CHADDR_OFFSET:DHCP_CHADDR_OFFSET + 6]))
+        message_type = packet[DHCP_OPTIONS_OFFSET + 2]
+        if message_type == DHCPOFFER:
+            self.update(key, TRANSACTION_SELECTING, bytes(packet), target, now)
+        elif message_type == DHCPACK:
+            self.update(key, TRANSACTION_BOUND, bytes(packet), target, now)
+        else:
+            self.entries.pop(key, None)
+
+ ##@brief Удаление транзакций с истекшим сроком
+ #@param [in] now Текущее монотонное время
+    def expire(self, now):
+        deadlines = self.deadlines
+        while deadlines and deadlines[0][0] <= now:
+            expiry, key = deadlines.popleft()
+            transaction = self.entries.get(key)
+            if transaction is not None and transaction[3] == expiry:
+                del self.entries[key]
+
+##@brief Подсети и границы их пулов (для проверки, нужно ли пересоздавать пулы после SIGHUP)
+#@param [in] config Экземпляр DhcpConfig
+#@return Кортеж (имя подсети, начало и конец пула, исключенные адреса) по всем подсетям
+def pool_layout(config):
+    return tuple((subnet.name, subnet.pool_start, subnet.pool_end, subnet.excluded) for subnet in config.subnets)
+
+##@class PakageDhcpWire
+##@brief Разбор DHCP-пакета напрямую из буфера приема без промежуточных строк
+#
+# Заголовок BOOTP читается через struct из memoryview над буфером приема,
+# опции обходятся как TLV (код, длина, значение) с учетом Pad и End и
+# сохраняются в словаре код -> memoryview значения. Сам пакет не копируется.
+class PakageDhcpWire:
+    __slots__ = ('view', 'length', 'op', 'htype', 'hlen', 'hops', 'xid', 'secs', 'flags',
+                 'ciaddr', 'yiaddr', 'siaddr', 'giaddr', 'options')
+
+ ##@brief Инициализация разбора DHCP-пакета
+ # Повторяющиеся опции объединяются в одно значение (RFC 3396); данные после
+ # опции End (дополнение) не разбираются.
+ #@param [in] view memoryview (или bytes) с данными пакета
+ #@param [in] length Длина пакета в буфере (по умолчанию весь буфер)
+ #@exception ValueError Пакет короче заголовка, нет магического числа или опция выходит за конец пакета
+    def __init__(self, view, length=None):
+        if length is None:
+            length = len(view)
+        if length < DHCP_OPTIONS_OFFSET:
+            raise ValueError("DHCP packet is shorter than the BOOTP header")
+        if view[DHCP_COOKIE_OFFSET:DHCP_OPTIONS_OFFSET] != DHCP_MAGIC_COOKIE:
+            raise ValueError("DHCP magic cookie is missing")
+        self.view = view
+        self.length = length
+        (self.op, self.htype, self.hlen, self.hops, self.xid, self.secs, self.flags,
+         self.ciaddr, self.yiaddr, self.siaddr, self.giaddr) = DHCP_HEADER.unpack_from(view, 0)
+        options = {}
+        offset = DHCP_OPTIONS_OFFSET
+        while offset < length:
+            code = view[offset]
+            if code == OPTION_PAD:
+                offset += 1
+                continue
+            if code == OPTION_END:
+                break
+            if offset + 1 >= length:
+                raise ValueError(f"option {code} has no length byte")
+            end = offset + 2 + view[offset + 1]
+            if end > length:
+                raise ValueError(f"option {code} runs past the end of the packet")
+            previous = options.get(code)
+            options[code] = view[offset + 2:end] if previous is None else bytes(previous) + bytes(view[offset + 2:end])
+            offset = end
+        self.options = options
+
+ ##@brief MAC-адрес клиента (первые 6 байт chaddr)
+ #@return bytes длиной 6
+    def client_mac(self):
+        return bytes(self.view[DHCP_CHADDR_OFFSET:DHCP_CHADDR_OFFSET + 6])
+
+ ##@brief Значение опции
+ #@param [in] code Код опции
+ #@return bytes или None, если опции нет
+    def option(self, code):
+        value = self.options.get(code)
+        return None if value is None else bytes(value)
+
+ ##@brief Тип сообщения (опция 53)
+ #@return DHCPDISCOVER ... DHCPINFORM или None, если опции нет или она повреждена
+    def message_type(self):
+        value = self.options.get(OPTION_MESSAGE_TYPE)
+        return value[0] if value is not None and len(value) == 1 else None
+
+ ##@brief Значение опции с одним адресом IPv4 (например, 50 или 54)
+ #@param [in] code Код опции
+ #@return Адрес (целое число) или None, если опции нет или ее длина не 4
+    def address_option(self, code):
+        value = self.options.get(code)
+        if value is None or len(value) != 4:
+            return None
+        return int.from_bytes(value, 'big')
+
+##@brief Сборка ответа на запрос в буфере
+# Заголовок BOOTP копируется из запроса (xid, flags, giaddr, chaddr), op
+# заменяется на BOOTREPLY, yiaddr - на выданный адрес. После опций ставится
+# End, ответ дополняется нулями до DHCP_MIN_PACKET.
+#@param [in, out] out bytearray размером не меньше DHCP_BUFFER_SIZE
+#@param [in] request Разобранный запрос PakageDhcpWire
+#@param [in] yiaddr Адрес клиента (целое число, 0 для NAK)
+#@param [in] options Опции ответа в виде bytes без опции End
+#@return Длина ответа в буфере
+def build_dhcp_reply(out, request, yiaddr, options):
+    out[:DHCP_OPTIONS_OFFSET] = request.view[:DHCP_OPTIONS_OFFSET]
+    out[0] = BOOTREPLY
+    struct.pack_into('!I', out, DHCP_YIADDR_OFFSET, yiaddr)
+    end = DHCP_OPTIONS_OFFSET + len(options)
+    out[DHCP_OPTIONS_OFFSET:end] = options
+    out[end] = OPTION_END
+    end += 1
+    if end < DHCP_MIN_PACKET:
+        out[end:DHCP_MIN_PACKET] = DHCP_PADDING[:DHCP_MIN_PACKET - end]
+        end = DHCP_MIN_PACKET
+    return end
+
+##@brief Кодирование опции со списком адресов IPv4
+#@param [in] code Код опции
+#@param [in] addresses Адреса (целые числа)
+#@return bytes с кодом, длиной и значением опции
+def encode_address_option(code, *addresses):
+    return struct.pack(f'!BB{len(addresses)}I', code, 4 * len(addresses), *addresses)
+
+##@brief Кодирование опции с интервалом в секундах (51, 58, 59)
+#@param [in] code Код опции
+#@param [in] seconds Интервал в секундах
+#@return bytes с кодом, длиной и значением опции
+def encode_seconds_option(code, seconds):
+    return struct.pack('!BBI', code, 4, seconds)
+
+##@brief Кодирование опции с текстом (например, 56 Message)
+#@param [in] code Код опции
+#@param [in] text Текст (ASCII, не длиннее 255 байт)
+#@return bytes с кодом, длиной и значением опции
+def encode_text_option(code, text):
+    value = text.encode('ascii')
+    return bytes((code, len(value))) + value
+
+##@class DhcpSubnet
+##@brief Неизменяемые параметры одной подсети: пул адресов и заранее закодированные опции OFFER и ACK
+#
+# Подсеть сервера задается параметрами верхнего уровня configuration.json,
+# подсети за relay-агентами - элементами DHCP_SUBNETS. У каждой подсети свои
+# маска, маршрутизатор, DNS, время аренды и пул, поэтому опции OFFER и ACK
+# (тип сообщения, сервер, время аренды, T1, T2, маска, маршрутизатор, DNS)
+# кодируются для каждой подсети отдельно.
+class DhcpSubnet:
+    __slots__ = ('name', 'network', 'prefix_length', 'subnet_mask', 'router', 'dns_server', 'broadcast_address',
+                 'lease_time', 'renewal_time', 'rebinding_time', 'pool_start', 'pool_end', 'excluded',
+                 'offer_options', 'ack_options')
+
+ ##@brief Инициализация подсети (значения должны быть проверены, см. DhcpConfig.from_configuration)
+ #@param [in] server_identifier Адрес сервера для опции 54 (целое число)
+ #@param [in] values Словарь имя поля -> значение для всех полей __slots__, кроме опций ответов и T1, T2
+    def __init__(self, server_identifier, **values):
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, 'renewal_time', self.lease_time // 2)
+        object.__setattr__(self, 'rebinding_time', self.lease_time * 7 // 8)
+        lease_options = (encode_address_option(OPTION_SERVER_ID, server_identifier)
+                         + encode_seconds_option(OPTION_LEASE_TIME, self.lease_time)
+                         + encode_seconds_option(OPTION_RENEWAL_TIME, self.renewal_time)
+                         + encode_seconds_option(OPTION_REBINDING_TIME, self.rebinding_time)
+                         + encode_address_option(OPTION_SUBNET_MASK, self.subnet_mask)
+                         + encode_address_option(OPTION_ROUTER, self.router)
+                         + encode_address_option(OPTION_DNS, self.dns_server, 0))
+        object.__setattr__(self, 'offer_options', bytes((OPTION_MESSAGE_TYPE, 1, DHCPOFFER)) + lease_options)
+        object.__setattr__(self, 'ack_options', bytes((OPTION_MESSAGE_TYPE, 1, DHCPACK)) + lease_options)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"DhcpSubnet is read-only, cannot set '{name}'")
+
+    def __repr__(self):
+        return f"DhcpSubnet({self.name}, pool {int_to_ip(self.pool_start)}-{int_to_ip(self.pool_end)})"
+
+##@class DhcpConfig
+##@brief Проверенная неизменяемая конфигурация DHCP-сервера с заранее закодированными опциями ответов
+#
+# Создается один раз при запуске (и заново по SIGHUP) из словаря
+# configuration.json. Адреса хранятся целыми числами, широковещательный адрес
+# подсети - готовой строкой для sendto, а общие для всех клиентов подсети опции
+# OFFER, ACK и NAK - готовыми байтами (см. DhcpSubnet), так что сборка ответа
+# только копирует заголовок запроса и дописывает yiaddr. Подсети (своя и из
+# DHCP_SUBNETS) собраны в SubnetIndex для выбора подсети по giaddr запроса.
+# Поля subnet_mask ... excluded, offer_options и ack_options относятся к
+# подсети сервера (default_subnet).
+class DhcpConfig:
+    __slots__ = ('server_identifier', 'subnet_mask', 'router', 'dns_server', 'broadcast_address',
+                 'lease_time', 'renewal_time', 'rebinding_time', 'decline_quarantine', 'offer_timeout',
+                 'pool_start', 'pool_end', 'excluded', 'commit_batch', 'lease_journal', 'lease_snapshot',
+                 'lease_fsync', 'compact_records', 'stats_address', 'dns_update_socket', 'default_subnet', 'subnets',
+                 'offer_options', 'ack_options', 'nak_options')
+
+    ##Поля, изменение которых по SIGHUP не применяется до перезапуска сервера
+    RESTART_FIELDS = ('lease_journal', 'lease_snapshot', 'lease_fsync', 'compact_records', 'stats_address', 'dns_update_socket')
+
+ ##@brief Инициализация конфигурации (значения должны быть проверены, см. from_configuration)
+ #@param [in] values Словарь имя поля -> значение для полей __slots__, кроме полей подсети сервера и опций ответов
+    def __init__(self, **values):
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+        for name in DhcpSubnet.__slots__:
+            if name in DhcpConfig.__slots__:
+                object.__setattr__(self, name, getattr(self.default_subnet, name))
+        object.__setattr__(self, 'nak_options', bytes((OPTION_MESSAGE_TYPE, 1, DHCPNAK))
+                           + encode_address_option(OPTION_SERVER_ID, self.server_identifier)
+                           + encode_text_option(OPTION_MESSAGE, 'address not available'))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"DhcpConfig is read-only, cannot set '{name}'")
+
+ ##@brief Проверка и преобразование словаря configuration.json
+ # Элемент DHCP_SUBNETS - объект с параметрами MASK_DHCP, IP_ROUTER,
+ # START_IP_ADDRESS, START_IP_END и необязательными IP_DNS, TIME_IP (по
+ # умолчанию значения верхнего уровня) и DHCP_EXCLUDED_ADDRESSES. Сеть подсети
+ # определяется по START_IP_ADDRESS и маске, сеть сервера - по IP_DHCP и
+ # MASK_DHCP. Пул должен лежать в своей сети и не пересекаться с вложенными в
+ # нее подсетями. Пример подсетей - в dhcp_subnets.example.json.
+ #@param [in] configuration Словарь конфигурации (результат read_json_file)
+ #@return Экземпляр DhcpConfig
+ #@exception ValueError Конфигурации нет или параметр отсутствует или недопустим (в тексте указано имя параметра)
+    @classmethod
+    def from_configuration(cls, configuration):
+        if not isinstance(configuration, dict):
+            raise ValueError("configuration is missing or is not a JSON object")
+
+        def address(section, label, name):
+            if name not in section:
+                raise ValueError(f"{label}{name} is missing")
+            try:
+                return ip_to_int(str(section[name]))
+            except ValueError as e:
+                raise ValueError(f"{label}{name}: {e}") from None
+
+        def number(section, label, name, default, minimum, maximum):
+            try:
+                value = int(section.get(name, default))
+            except (TypeError, ValueError):
+                raise ValueError(f"{label}{name}: '{section.get(name)}' is not an integer") from None
+            if not minimum <= value <= maximum:
+                raise ValueError(f"{label}{name}: {value} is outside [{minimum}, {maximum}]")
+            return value
+
+        def subnet(section, label, interface):
+            subnet_mask = address(section, label, 'MASK_DHCP')
+            host_bits = ~subnet_mask & 0xFFFFFFFF
+            if host_bits & (host_bits + 1):
+                raise ValueError(f"{label}MASK_DHCP: '{section['MASK_DHCP']}' is not a contiguous subnet mask")
+            router = address(section, label, 'IP_ROUTER')
+            dns_server = address(section, label, 'IP_DNS')
+            if 'TIME_IP' not in section:
+                raise ValueError(f"{label}TIME_IP is missing")
+            lease_time = number(section, label, 'TIME_IP', None, 1, 0x7FFFFFFF)
+            pool_start = address(section, label, 'START_IP_ADDRESS')
+            pool_end = address(section, label, 'START_IP_END')
+            if pool_start > pool_end:
+                raise ValueError(f"{label}START_IP_ADDRESS is greater than START_IP_END")
+            network = (pool_start if interface is None else interface) & subnet_mask
+            if pool_start & subnet_mask != network or pool_end & subnet_mask != network:
+                raise ValueError(f"{label}START_IP_ADDRESS-START_IP_END is outside the subnet "
+                                 f"{int_to_ip(network)}/{32 - host_bits.bit_length()}")
+            try:
+                excluded = parse_address_ranges(section.get('DHCP_EXCLUDED_ADDRESSES', []))
+            except ValueError as e:
+                raise ValueError(f"{label}DHCP_EXCLUDED_ADDRESSES: {e}") from None
+            excluded.extend((server_identifier, router, dns_server))
+            prefix_length = 32 - host_bits.bit_length()
+            return DhcpSubnet(server_identifier, name=f"{int_to_ip(network)}/{prefix_length}", network=network,
+                              prefix_length=prefix_length, subnet_mask=subnet_mask, router=router, dns_server=dns_server,
+                              broadcast_address=int_to_ip(network | host_bits), lease_time=lease_time,
+                              pool_start=pool_start, pool_end=pool_end,
+                              excluded=tuple(sorted(set(value for value in excluded if pool_start <= value <= pool_end))))
+
+        server_identifier = address(configuration, '', 'IP_DHCP')
+        default_subnet = subnet(configuration, '', server_identifier)
+        sections = configuration.get('DHCP_SUBNETS', [])
+        if not isinstance(sections, list):
+            raise ValueError("DHCP_SUBNETS is not a list")
+        labelled = [('', default_subnet)]
+        for index, section in enumerate(sections):
+            label = f"DHCP_SUBNETS[{index}]."
+            if not isinstance(section, dict):
+                raise ValueError(f"DHCP_SUBNETS[{index}] is not a JSON object")
+            inherited = {name: configuration[name] for name in ('IP_DNS', 'TIME_IP') if name in configuration}
+            inherited.update(section)
+            labelled.append((label, subnet(inherited, label, None)))
+        subnets = SubnetIndex()
+        for label, value in labelled:
+            try:
+                subnets.add(value.network, value.prefix_length, value)
+            except ValueError as e:
+                raise ValueError(f"{label.rstrip('.')}: {e}") from None
+        labels = {value.name: label for label, value in labelled}
+        for _, inner in labelled:
+            inner_last = inner.network | ~inner.subnet_mask & 0xFFFFFFFF
+            for outer in subnets.covering(inner.network, inner.prefix_length):
+                if outer.pool_start <= inner_last and inner.network <= outer.pool_end:
+                    raise ValueError(f"{labels[outer.name]}START_IP_ADDRESS-START_IP_END overlaps the nested subnet {inner.name}")
+        return cls(server_identifier=server_identifier, default_subnet=default_subnet, subnets=subnets,
+                   decline_quarantine=number(configuration, '', 'DHCP_DECLINE_QUARANTINE', 600, 0, 0x7FFFFFFF),
+                   offer_timeout=number(configuration, '', 'DHCP_OFFER_TIMEOUT', 10, 1, 3600),
+                   commit_batch=number(configuration, '', 'DHCP_LEASE_COMMIT_BATCH', 64, 1, 1 << 20),
+                   lease_journal=str(configuration.get('DHCP_LEASE_JOURNAL', 'dhcp_leases.journal')),
+                   lease_snapshot=str(configuration.get('DHCP_LEASE_SNAPSHOT', 'dhcp_leases.snapshot')),
+                   lease_fsync=bool(configuration.get('DHCP_LEASE_FSYNC', True)),
+                   compact_records=number(configuration, '', 'DHCP_LEASE_COMPACT_RECORDS', 10000, 1, 1 << 30),
+                   stats_address=str(configuration.get('DHCP_STATS_ADDRESS', '')),
+                   dns_update_socket=str(configuration.get('DNS_UPDATE_SOCKET', '')))
+
 ##@class PakageDhcp
 ##@brief Инициализация объекта DHCP пакета и чтение конфигурационного файла 
 #@param [in] package Байтовая строка, представляющая содержимое пакета DHCP
@@ -308,16 +1281,13 @@ class PakageDhcp:
 ##@brief Чтение данных из JSON файла
 #@param [in] file_name Имя файла JSON для чтения
 #@return Словарь с данными JSON файла, если файл существует и правильный, иначе None
+# (ошибку записывает в лог вызывающий: у функции нет экземпляра сервера)
 def read_json_file(file_name):
     try:
         with open(file_name, 'r', encoding='utf-8') as file:
             data = json.load(file)
         return data
-    except FileNotFoundError:
-        DHCPServer.log_dhcp_server(f"File '{file_name}' no")
-        return None
-    except json.JSONDecodeError:
-        DHCPServer.log_dhcp_server(f"Error JSON file'{file_name}'.")
+    except (OSError, ValueError):
         return None
 
 
@@ -336,5 +1306,10 @@ def write_to_json_file(data, file_path):
 
 
 if __name__ == "__main__":
-    server_default = DHCPServer(output_file="DHCPoutput.txt", name_configuration="configuration.json")
+    parser = argparse.ArgumentParser(description="DHCP server")
+    parser.add_argument("--port", type=int, default=67, help="server port; replies go to port + 1")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run the asyncio server (AsyncDHCPServer)")
+    args = parser.parse_args()
+    server_class = AsyncDHCPServer if args.use_async else DHCPServer
+    server_default = server_class(port=args.port, output_file="DHCPoutput.txt", name_configuration="configuration.json")
     server_default.start()
\ No newline at end of file
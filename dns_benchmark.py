@@ -0,0 +1,949 @@
+##@file dns_benchmark.py
+##@brief Бенчмарки DNS-сервера: стоимость разбора и сборки пакетов.
+#
+# Запуск: python3 dns_benchmark.py codec [--iterations N]
+#         python3 dns_benchmark.py zone [--iterations N]
+#         python3 dns_benchmark.py serve [--queries N] [--concurrency N] [--upstream-delay S]
+#         python3 dns_benchmark.py scaling [--workers 1 2 4 8] [--clients N]
+#         python3 dns_benchmark.py failover [--queries N] [--loss P] [--slow-delay S]
+#         python3 dns_benchmark.py zone-index [--records N] [--lookups N]
+#         python3 dns_benchmark.py load [--loop closed|open] [--rate QPS] [--mix local=0.6,forward=0.3,nxdomain=0.1]
+#                                       [--servers blocking async] [--output results.jsonl]
+
+import argparse
+##@package argparse
+#Модуль для разбора аргументов командной строки.
+
+import datetime
+##@package datetime
+#Модуль для отметки времени в результатах нагрузочного теста.
+
+import json
+##@package json
+#Модуль для чтения зоны и записи результатов в формате JSON Lines.
+
+import platform
+##@package platform
+#Модуль для описания машины в результатах нагрузочного теста.
+
+import asyncio
+##@package asyncio
+#Модуль асинхронного ввода-вывода (нагрузочный клиент и заглушка вышестоящего сервера).
+
+import multiprocessing
+##@package multiprocessing
+#Модуль для запуска заглушки вышестоящего сервера в отдельном процессе.
+
+import os
+##@package os
+#Модуль для работы с файловой системой.
+
+import random
+##@package random
+#Модуль для генерации идентификаторов запросов и потерь пакетов.
+
+import socket
+##@package socket
+#Модуль для работы с сетевыми сокетами.
+
+import signal
+##@package signal
+#Модуль для остановки тестируемого сервера по SIGINT (с записью метрик в лог).
+
+import shutil
+##@package shutil
+#Модуль для копирования файлов конфигурации во временный каталог.
+
+import subprocess
+##@package subprocess
+#Модуль для запуска тестируемого DNS-сервера.
+
+import sys
+##@package sys
+#Модуль для работы с системными функциями и параметрами.
+
+import tempfile
+##@package tempfile
+#Модуль для создания временного рабочего каталога сервера.
+
+import binascii
+##@package binascii
+#Модуль для преобразования бинарных данных в текстовые и обратно.
+
+import struct
+##@package struct
+#Модуль для сборки бинарных структур (тестовые DNS-запросы).
+
+import time
+##@package time
+#Модуль для измерения времени выполнения.
+
+import dns_server
+##@package dns_server
+#Тестируемый DNS-сервер.
+
+import dns_zone
+##@package dns_zone
+#Скомпилированная зона DNS-сервера.
+
+import server_stats
+##@package server_stats
+#Гистограммы задержек и чтение метрик тестируемого сервера.
+
+
+##@brief Тестовая запись зоны, на которую отвечает сервер
+SAMPLE_RECORD = {"TTL": 7200, "IP": ["192.168.2.7", "192.168.2.8"]}
+##@brief Каталог с исходными файлами сервера
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+##@brief Ресурсная запись, которую возвращает заглушка вышестоящего сервера
+FAKE_UPSTREAM_ANSWER = struct.pack('!HHHIH', 0xC00C, 1, 1, 300, 4) + bytes([10, 0, 0, 1])
+##@brief Зона, на имена в которой заглушка вышестоящего сервера отвечает NXDOMAIN
+NXDOMAIN_ZONE = "nxdomain.test"
+##@brief Окончание ключа имени (wire-формат) для имен в NXDOMAIN_ZONE
+NXDOMAIN_SUFFIX = dns_zone.encode_domain_name(NXDOMAIN_ZONE)
+##@brief Режимы тестируемого сервера: имя -> аргументы командной строки dns_server.py
+SERVER_MODES = {"blocking": (), "async": ("--async",)}
+##@brief Виды запросов нагрузочного теста: ответ из локальной зоны, пересылка, NXDOMAIN от вышестоящего сервера
+LOAD_KINDS = ("local", "forward", "nxdomain")
+##@brief Имена кодов ответа в результатах нагрузочного теста
+RCODE_NAMES = {0: "NOERROR", 1: "FORMERR", 2: "SERVFAIL", 3: "NXDOMAIN", 4: "NOTIMP", 5: "REFUSED"}
+##@brief Адрес точки метрик тестируемого сервера (вместо DNS_STATS_ADDRESS, чтобы не мешать рабочему серверу)
+BENCHMARK_STATS_ADDRESS = "127.0.0.1:15380"
+
+
+##@brief Сборка DNS-запроса типа A
+#@param [in] domain Доменное имя
+#@param [in] packet_id Идентификатор запроса
+#@param [in] edns Добавить ли OPT-запись в дополнительную секцию
+#@return DNS-запрос в виде bytes
+def build_query(domain, packet_id=0x1234, edns=False):
+    qname = b''.join(bytes([len(label)]) + label.encode('ascii') for label in domain.split('.')) + b'\x00'
+    header = struct.pack('!6H', packet_id, 0x0100, 1, 0, 0, 1 if edns else 0)
+    packet = header + qname + struct.pack('!HH', 1, 1)
+    if edns:
+        packet += b'\x00' + struct.pack('!HHIH', 41, 4096, 0, 0)
+    return packet
+
+
+##@brief Разбор запроса через устаревший hex-кодек PakageDns
+#@param [in] packet DNS-запрос
+#@return Разобранный объект PakageDns
+def legacy_parse(packet):
+    transcript = dns_server.PakageDns(binascii.hexlify(packet).decode('utf-8'))
+    transcript.transcript_QUERIES(transcript.QUERIES)
+    return transcript
+
+
+##@brief Сборка ответа через устаревший hex-кодек PakageDns
+#@param [in] server Экземпляр DNSServer без сокета (нужны только методы кодирования)
+#@param [in] transcript Разобранный устаревшим кодеком запрос
+#@return Ответ в виде bytes
+def legacy_build(server, transcript):
+    transcript.flag['QR'] = '1'
+    transcript.flag['AA'] = '1'
+    transcript.flag['RA'] = '1'
+    transcript.ANCOUNT = (4-len(hex(len(SAMPLE_RECORD['IP']))[2:]))*'0'+hex(len(SAMPLE_RECORD['IP']))[2:]
+    return binascii.unhexlify(transcript.reassemble()+server.reassemble_ANCOUNT(SAMPLE_RECORD))
+
+
+##@brief Измерение среднего времени вызова функции
+#@param [in] function Функция без аргументов
+#@param [in] iterations Количество повторений
+#@return Среднее время одного вызова в наносекундах
+def measure(function, iterations):
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter_ns() - start) / iterations
+
+
+##@brief Сравнение стоимости разбора и сборки пакета для PakageDns и PakageDnsWire
+#@param [in] iterations Количество повторений каждого замера
+def benchmark_codec(iterations):
+    server = object.__new__(dns_server.DNSServer)
+    out = bytearray(dns_server.DNS_BUFFER_SIZE)
+    for edns in (False, True):
+        packet = build_query("my_site_diplom.com", edns=edns)
+        buffer = bytearray(dns_server.DNS_BUFFER_SIZE)
+        buffer[:len(packet)] = packet
+        view = memoryview(buffer)
+        length = len(packet)
+
+        wire = dns_server.PakageDnsWire(view, length)
+        answers = dns_zone.encode_a_records(SAMPLE_RECORD)
+        flags = wire.flags | dns_server.FLAG_QR | dns_server.FLAG_AA | dns_server.FLAG_RA
+
+        def wire_parse():
+            dns_server.PakageDnsWire(view, length).qname_text()
+
+        def wire_build():
+            dns_server.build_dns_response(out, wire, flags, answers, len(SAMPLE_RECORD['IP']))
+
+        def legacy_parse_only():
+            legacy_parse(packet)
+
+        def legacy_full():
+            legacy_build(server, legacy_parse(packet))
+
+        legacy_parse_ns = measure(legacy_parse_only, iterations)
+        legacy_build_ns = measure(legacy_full, iterations) - legacy_parse_ns
+        wire_parse_ns = measure(wire_parse, iterations)
+        wire_build_ns = measure(wire_build, iterations)
+        print(f"query {'with' if edns else 'without'} EDNS0 ({length} bytes):")
+        print(f"  PakageDns      parse {legacy_parse_ns:8.0f} ns  build {legacy_build_ns:8.0f} ns")
+        print(f"  PakageDnsWire  parse {wire_parse_ns:8.0f} ns  build {wire_build_ns:8.0f} ns")
+        print(f"  speedup        parse x{legacy_parse_ns / wire_parse_ns:.1f}  build x{legacy_build_ns / wire_build_ns:.1f}")
+
+
+##@brief Сравнение стоимости ответа на локальное имя: словарь domain_ip и скомпилированная зона DnsZone
+#@param [in] iterations Количество повторений каждого замера
+def benchmark_zone(iterations):
+    server = object.__new__(dns_server.DNSServer)
+    domain_ip = {"my_site_diplom.com": SAMPLE_RECORD}
+    zone = dns_zone.DnsZone.from_domain_ip(domain_ip)
+    out = bytearray(dns_server.DNS_BUFFER_SIZE)
+    packet = build_query("my_site_diplom.com")
+    view = memoryview(packet)
+    length = len(packet)
+
+    def legacy_hit():
+        transcript = legacy_parse(packet)
+        if transcript.transcript_QUERIES(transcript.QUERIES) in domain_ip:
+            legacy_build(server, transcript)
+
+    def compiled_hit():
+        request = dns_server.PakageDnsWire(view, length)
+        answer = zone.lookup(request.qname_key(), request.qtype)
+        dns_server.build_dns_response(out, request, request.flags | dns_server.FLAG_QR | dns_server.FLAG_AA | dns_server.FLAG_RA,
+                                      answer[1], answer[0])
+
+    legacy_ns = measure(legacy_hit, iterations)
+    compiled_ns = measure(compiled_hit, iterations)
+    print(f"local hit, domain_ip dict + PakageDns: {legacy_ns:8.0f} ns")
+    print(f"local hit, compiled DnsZone:          {compiled_ns:8.0f} ns")
+    print(f"speedup x{legacy_ns / compiled_ns:.1f}")
+
+
+##@class FakeUpstreamProtocol
+##@brief Заглушка вышестоящего DNS-сервера с задержкой и потерей пакетов
+#
+# На имена в зоне NXDOMAIN_ZONE отвечает NXDOMAIN, на остальные - одной A-записью.
+class FakeUpstreamProtocol(asyncio.DatagramProtocol):
+ #@param [in] delay Задержка ответа в секундах
+ #@param [in] loss Доля запросов, оставляемых без ответа (0..1)
+    def __init__(self, delay, loss):
+        self.delay = delay
+        self.loss = loss
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if self.loss and random.random() < self.loss:
+            return
+        request = dns_server.PakageDnsWire(memoryview(data))
+        if request.qname_key().endswith(NXDOMAIN_SUFFIX):
+            answer = bytearray(data[:request.question_end])
+            struct.pack_into('!HHHHH', answer, 2, request.flags | dns_server.FLAG_QR | dns_server.FLAG_RA | dns_server.RCODE_NXDOMAIN,
+                             1, 0, 0, 0)
+        else:
+            answer = bytearray(data[:request.question_end]) + FAKE_UPSTREAM_ANSWER
+            struct.pack_into('!HHHHH', answer, 2, request.flags | dns_server.FLAG_QR | dns_server.FLAG_RA, 1, 1, 0, 0)
+        if self.delay:
+            asyncio.get_running_loop().call_later(self.delay, self.transport.sendto, bytes(answer), addr)
+        else:
+            self.transport.sendto(answer, addr)
+
+##@brief Тело процесса заглушки вышестоящего сервера
+#@param [in] port Порт заглушки на 127.0.0.1
+#@param [in] delay Задержка ответа в секундах
+#@param [in] loss Доля потерянных запросов
+def run_fake_upstream(port, delay, loss):
+    async def serve():
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: FakeUpstreamProtocol(delay, loss), local_addr=('127.0.0.1', port))
+        await asyncio.Event().wait()
+    asyncio.run(serve())
+
+##@brief Запуск заглушки вышестоящего сервера в отдельном процессе
+#@param [in] port Порт заглушки на 127.0.0.1
+#@param [in] delay Задержка ответа в секундах
+#@param [in] loss Доля потерянных запросов
+#@return Объект multiprocessing.Process
+def start_fake_upstream(port, delay=0.0, loss=0.0):
+    process = multiprocessing.Process(target=run_fake_upstream, args=(port, delay, loss), daemon=True)
+    process.start()
+    return process
+
+##@brief Подготовка временного рабочего каталога сервера с конфигурацией и зоной
+#@param [in] overrides Словарь параметров, заменяющих значения из configuration.json
+#@return Путь к каталогу
+def prepare_workdir(overrides=None):
+    workdir = tempfile.mkdtemp(prefix="dns_benchmark_")
+    for name in ("configuration.json", "domain_dns_name_ip.json"):
+        shutil.copy(os.path.join(PACKAGE_DIR, name), workdir)
+    if overrides:
+        configuration = dns_server.read_json_file(os.path.join(workdir, "configuration.json"))
+        configuration.update(overrides)
+        dns_server.write_to_json_file(configuration, os.path.join(workdir, "configuration.json"))
+    return workdir
+
+##@brief Запуск dns_server.py в отдельном процессе
+#@param [in] workdir Рабочий каталог сервера
+#@param [in] port Порт сервера
+#@param [in] upstream_port Порт заглушки вышестоящего сервера или список портов
+#@param [in] extra_args Дополнительные аргументы командной строки сервера
+#@return Объект subprocess.Popen
+def start_server(workdir, port, upstream_port, extra_args=()):
+    upstream_ports = upstream_port if isinstance(upstream_port, (list, tuple)) else [upstream_port]
+    command = [sys.executable, os.path.join(PACKAGE_DIR, "dns_server.py"), "--port", str(port), *extra_args]
+    for number in upstream_ports:
+        command += ["--upstream", f"127.0.0.1:{number}"]
+    process = subprocess.Popen(command, cwd=workdir)
+    probe = socket_probe(port)
+    if not probe:
+        process.kill()
+        raise RuntimeError(f"DNS server did not start: {' '.join(command)}")
+    return process
+
+##@brief Ожидание готовности сервера: повторная отправка запроса локального имени
+#@param [in] port Порт сервера
+#@param [in] attempts Количество попыток
+#@return True, если сервер ответил
+def socket_probe(port, attempts=50):
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probe.settimeout(0.1)
+    try:
+        for _ in range(attempts):
+            probe.sendto(build_query("my_site_diplom.com"), ('127.0.0.1', port))
+            try:
+                probe.recvfrom(dns_server.DNS_BUFFER_SIZE)
+                return True
+            except OSError:
+                pass
+        return False
+    finally:
+        probe.close()
+
+##@class LoadClientProtocol
+##@brief Клиент нагрузочного теста: сопоставляет ответы с запросами по ID
+class LoadClientProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.pending = {}
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        future = self.pending.pop(struct.unpack_from('!H', data, 0)[0], None)
+        if future is not None and not future.done():
+            future.set_result(time.perf_counter())
+
+##@brief Нагрузка с фиксированным числом одновременных запросов (closed loop)
+# Запросы распределяются по нескольким клиентским сокетам, чтобы ядро могло
+# раскидать их по рабочим процессам сервера с SO_REUSEPORT.
+#@param [in] port Порт сервера
+#@param [in] queries Список готовых запросов (без ID), выбираемых по кругу
+#@param [in] total Общее количество запросов
+#@param [in] concurrency Количество одновременно ожидающих запросов
+#@param [in] timeout Таймаут ожидания ответа в секундах
+#@param [in] sockets Количество клиентских сокетов
+#@return Кортеж (длительность теста в секундах, список задержек в секундах, число потерь)
+async def run_closed_loop(port, queries, total, concurrency, timeout=2.0, sockets=1):
+    loop = asyncio.get_running_loop()
+    endpoints = [await loop.create_datagram_endpoint(LoadClientProtocol, remote_addr=('127.0.0.1', port))
+                 for _ in range(sockets)]
+    latencies = []
+    lost = 0
+    counter = iter(range(total))
+
+    async def worker(transport, client):
+        nonlocal lost
+        for number in counter:
+            query_id = number & 0xFFFF
+            future = loop.create_future()
+            client.pending[query_id] = future
+            packet = queries[number % len(queries)]
+            sent = time.perf_counter()
+            transport.sendto(struct.pack('!H', query_id) + packet[2:])
+            try:
+                latencies.append(await asyncio.wait_for(future, timeout) - sent)
+            except asyncio.TimeoutError:
+                client.pending.pop(query_id, None)
+                lost += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(*endpoints[number % sockets]) for number in range(concurrency)))
+    duration = time.perf_counter() - start
+    for transport, _ in endpoints:
+        transport.close()
+    return duration, latencies, lost
+
+##@brief Тело клиентского процесса нагрузочного теста
+#@param [in] arguments Кортеж аргументов run_closed_loop
+#@return Результат run_closed_loop
+def run_closed_loop_process(arguments):
+    return asyncio.run(run_closed_loop(*arguments))
+
+##@brief Процентиль списка значений
+#@param [in] values Список значений
+#@param [in] percent Процент (0..100)
+#@return Значение процентиля или 0.0 для пустого списка
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+##@brief Сравнение блокирующего цикла DNSServer и AsyncDNSServer по QPS и p99
+#@param [in] total Количество запросов в каждом замере
+#@param [in] concurrency Количество одновременно ожидающих запросов
+#@param [in] upstream_delay Задержка заглушки вышестоящего сервера в секундах
+#@param [in] forward_share Доля запросов, пересылаемых вышестоящему серверу
+def benchmark_serve(total, concurrency, upstream_delay, forward_share):
+    upstream_port, server_port = 15353, 15354
+    upstream = start_fake_upstream(upstream_port, upstream_delay)
+    forwarded = max(1, round(10 * forward_share))
+    queries = [build_query("my_site_diplom.com")] * (10 - forwarded) + \
+              [build_query(f"host{number}.example.org") for number in range(forwarded)]
+    try:
+        for mode, extra_args in SERVER_MODES.items():
+            workdir = prepare_workdir()
+            server = start_server(workdir, server_port, upstream_port, extra_args)
+            try:
+                duration, latencies, lost = asyncio.run(run_closed_loop(server_port, queries, total, concurrency))
+            finally:
+                server.terminate()
+                server.wait()
+                shutil.rmtree(workdir, ignore_errors=True)
+            print(f"{mode:9s} qps {len(latencies) / duration:9.0f}  p50 {percentile(latencies, 50) * 1e3:7.2f} ms"
+                  f"  p99 {percentile(latencies, 99) * 1e3:7.2f} ms  lost {lost}")
+    finally:
+        upstream.terminate()
+
+
+##@brief Масштабирование DNSServer по числу рабочих процессов SO_REUSEPORT
+#@param [in] total Количество запросов в каждом замере
+#@param [in] concurrency Количество одновременно ожидающих запросов на клиентский процесс
+#@param [in] worker_counts Список проверяемых чисел рабочих процессов
+#@param [in] clients Количество клиентских процессов
+def benchmark_scaling(total, concurrency, worker_counts, clients):
+    upstream_port, server_port = 15353, 15354
+    upstream = start_fake_upstream(upstream_port)
+    queries = [build_query("my_site_diplom.com"), build_query("my_site_diplom2.com")]
+    print(f"CPU cores: {os.cpu_count()}")
+    try:
+        for workers in worker_counts:
+            workdir = prepare_workdir()
+            server = start_server(workdir, server_port, upstream_port, ("--workers", str(workers)))
+            try:
+                with multiprocessing.Pool(clients) as pool:
+                    arguments = [(server_port, queries, total // clients, concurrency, 2.0, 8)] * clients
+                    results = pool.map(run_closed_loop_process, arguments)
+            finally:
+                server.terminate()
+                server.wait()
+                shutil.rmtree(workdir, ignore_errors=True)
+            duration = max(result[0] for result in results)
+            latencies = [latency for result in results for latency in result[1]]
+            lost = sum(result[2] for result in results)
+            print(f"workers {workers}  qps {len(latencies) / duration:9.0f}  p50 {percentile(latencies, 50) * 1e3:7.2f} ms"
+                  f"  p99 {percentile(latencies, 99) * 1e3:7.2f} ms  lost {lost}")
+    finally:
+        upstream.terminate()
+
+
+##@brief Переключение между вышестоящими серверами при потерях и отказах
+# Сервер получает три вышестоящих сервера: неотвечающий порт, быстрый с потерей
+# пакетов и медленный без потерь. Все запросы уникальны, поэтому каждый
+# пересылается; в конце печатаются метрики вышестоящих серверов из лога сервера.
+#@param [in] total Количество запросов в каждом замере
+#@param [in] concurrency Количество одновременно ожидающих запросов
+#@param [in] loss Доля потерь быстрого вышестоящего сервера
+#@param [in] slow_delay Задержка медленного вышестоящего сервера в секундах
+def benchmark_failover(total, concurrency, loss, slow_delay):
+    dead_port, lossy_port, slow_port, server_port = 15352, 15353, 15355, 15354
+    lossy = start_fake_upstream(lossy_port, 0.001, loss)
+    slow = start_fake_upstream(slow_port, slow_delay)
+    queries = [build_query(f"host{number}.failover.test") for number in range(total)]
+    try:
+        for mode, extra_args in SERVER_MODES.items():
+            workdir = prepare_workdir()
+            server = start_server(workdir, server_port, [dead_port, lossy_port, slow_port], extra_args)
+            try:
+                duration, latencies, lost = asyncio.run(run_closed_loop(server_port, queries, total, concurrency, 6.0))
+            finally:
+                server.send_signal(signal.SIGINT)
+                server.wait()
+                with open(os.path.join(workdir, "DNSLog.txt")) as log:
+                    upstreams = [line.strip() for line in log if "Upstreams:" in line]
+                shutil.rmtree(workdir, ignore_errors=True)
+            print(f"{mode:9s} qps {len(latencies) / duration:9.0f}  p50 {percentile(latencies, 50) * 1e3:7.2f} ms"
+                  f"  p99 {percentile(latencies, 99) * 1e3:7.2f} ms  lost {lost}")
+            for line in upstreams:
+                print(f"          {line}")
+    finally:
+        lossy.terminate()
+        slow.terminate()
+
+
+##@brief Генерация большого файла зоны для тестов масштаба
+# Каждая тысячная зона получает wildcard-запись "*.zoneN.lab".
+#@param [in] file_name Имя создаваемого файла
+#@param [in] records Количество записей
+def generate_zone_file(file_name, records):
+    with open(file_name, 'w', encoding='utf-8') as file:
+        file.write('{\n')
+        for number in range(records):
+            separator = ',\n' if number + 1 < records else '\n'
+            name = f"*.zone{number // 1000}.lab" if number % 1000 == 0 else f"host{number}.zone{number // 1000}.lab"
+            file.write(f'    "{name}": {{"TTL": 300, "IP": ["10.{number >> 16 & 255}.{number >> 8 & 255}.{number & 255}"]}}{separator}')
+        file.write('}\n')
+
+##@brief Текущий объем резидентной памяти процесса
+#@return RSS в мегабайтах
+def current_rss_mb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+##@brief Замер индекса зоны в отдельном процессе: прирост RSS, время загрузки и поиска
+#@param [in] arguments Кортеж (вид индекса, файл зоны или снимка, количество записей, количество поисков)
+#@return Словарь с результатами замера
+def measure_zone_index(arguments):
+    kind, file_name, records, lookups = arguments
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    zone = dns_zone.load_zone(file_name, kind)
+    load_seconds = time.perf_counter() - started
+    rss_after = current_rss_mb()
+    generator = random.Random(1)
+    keys = []
+    for _ in range(lookups):
+        number = generator.randrange(records)
+        if number % 1000 == 0:
+            number += 1
+        keys.append(dns_zone.encode_domain_name(f"host{number}.zone{number // 1000}.lab"))
+    wildcard_keys = [dns_zone.encode_domain_name(f"missing{number}.zone{number}.lab") for number in range(min(lookups, records // 1000))]
+    started = time.perf_counter_ns()
+    for key in keys:
+        zone.lookup(key)
+    exact_ns = (time.perf_counter_ns() - started) / len(keys)
+    started = time.perf_counter_ns()
+    for key in wildcard_keys:
+        zone.lookup(key)
+    wildcard_ns = (time.perf_counter_ns() - started) / max(1, len(wildcard_keys))
+    return {"kind": kind, "rss_mb": rss_after - rss_before, "load_s": load_seconds,
+            "exact_ns": exact_ns, "wildcard_ns": wildcard_ns}
+
+##@brief Сравнение словаря DnsZone, компактного индекса CompactZoneIndex и снимка MappedZoneSnapshot на большой зоне
+#@param [in] records Количество записей в сгенерированной зоне
+#@param [in] lookups Количество поисков
+def benchmark_zone_index(records, lookups):
+    workdir = tempfile.mkdtemp(prefix="dns_benchmark_")
+    file_name = os.path.join(workdir, "domain_dns_name_ip.json")
+    snapshot_name = os.path.join(workdir, "domain_dns_name_ip.bin")
+    try:
+        generate_zone_file(file_name, records)
+        print(f"zone: {records} records, {os.path.getsize(file_name) / 2**20:.1f} MB JSON")
+        started = time.perf_counter()
+        dns_zone.compile_zone_snapshot(file_name, snapshot_name)
+        print(f"snapshot: compiled in {time.perf_counter() - started:.2f} s, {os.path.getsize(snapshot_name) / 2**20:.1f} MB")
+        context = multiprocessing.get_context("spawn")
+        for kind in ("dict", "compact", "snapshot"):
+            source = snapshot_name if kind == "snapshot" else file_name
+            with context.Pool(1) as pool:
+                result = pool.apply(measure_zone_index, ((kind, source, records, lookups),))
+            print(f"{kind:8s} RSS +{result['rss_mb']:8.1f} MB  load {result['load_s']:6.2f} s"
+                  f"  exact {result['exact_ns']:7.0f} ns/op  wildcard {result['wildcard_ns']:7.0f} ns/op")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+##@brief Разбор доли видов запросов из командной строки
+#@param [in] value Строка вида "local=0.6,forward=0.3,nxdomain=0.1"
+#@return Словарь {вид запроса: доля}, доли нормированы к сумме 1
+def parse_query_mix(value):
+    mix = dict.fromkeys(LOAD_KINDS, 0.0)
+    for item in value.split(','):
+        kind, _, share = item.partition('=')
+        kind = kind.strip()
+        if kind not in mix:
+            raise argparse.ArgumentTypeError(f"unknown query kind '{kind}', expected one of {', '.join(LOAD_KINDS)}")
+        try:
+            mix[kind] = float(share)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid share '{share}' for '{kind}'")
+    total = sum(mix.values())
+    if total <= 0 or min(mix.values()) < 0:
+        raise argparse.ArgumentTypeError("query shares must be non-negative and not all zero")
+    return {kind: round(share / total, 6) for kind, share in mix.items()}
+
+##@brief Подготовка запросов нагрузочного теста
+# Локальные запросы выбирают случайное имя из файла зоны (кроме wildcard-записей),
+# пересылаемые запрашивают имена в forward.test, NXDOMAIN - в NXDOMAIN_ZONE.
+#@param [in] zone_file Файл зоны domain_dns_name_ip.json
+#@param [in] mix Доли видов запросов
+#@param [in] total Количество запросов
+#@param [in] names Количество разных имен для пересылаемых и NXDOMAIN-запросов (0 - все имена уникальны,
+# то есть каждый запрос проходит мимо кэша ответов)
+#@param [in] seed Начальное значение генератора случайных чисел
+#@return Кортеж (список запросов без первых двух байт ID, список видов запросов)
+def build_query_mix(zone_file, mix, total, names=0, seed=1):
+    with open(zone_file, 'r', encoding='utf-8') as file:
+        local_names = [name for name in json.load(file) if not name.startswith('*.')]
+    generator = random.Random(seed)
+    kinds = generator.choices(LOAD_KINDS, weights=[mix[kind] for kind in LOAD_KINDS], k=total)
+    if not local_names and "local" in kinds:
+        raise ValueError(f"zone file '{zone_file}' has no names for local queries")
+    local_queries = [build_query(name)[2:] for name in local_names]
+    packets = []
+    for number, kind in enumerate(kinds):
+        if kind == "local":
+            packets.append(local_queries[generator.randrange(len(local_queries))])
+        else:
+            name = number % names if names else number
+            packets.append(build_query(f"q{name}.{'forward.test' if kind == 'forward' else NXDOMAIN_ZONE}")[2:])
+    return packets, kinds
+
+##@class MixedLoadClientProtocol
+##@brief Клиент нагрузочного теста: сопоставляет ответы с запросами по ID и ведет гистограммы задержек по видам запросов
+class MixedLoadClientProtocol(asyncio.DatagramProtocol):
+ #@param [in] timeout Ответ, пришедший позже timeout секунд, считается потерянным
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.pending = {}
+        self.histograms = {kind: server_stats.LatencyHistogram() for kind in LOAD_KINDS}
+        self.rcodes = {}
+        self.late = 0
+        self.last_received = 0.0
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+ ##@brief Отправка запроса
+ #@param [in] query_id Идентификатор запроса
+ #@param [in] packet Запрос без первых двух байт ID
+ #@param [in] kind Вид запроса
+ #@param [in] sent Момент отправки по time.perf_counter (для open loop - запланированный)
+ #@param [in] future Future, завершаемый при получении ответа (для closed loop)
+    def send(self, query_id, packet, kind, sent, future=None):
+        self.pending[query_id] = (sent, kind, future)
+        self.transport.sendto(struct.pack('!H', query_id) + packet)
+
+    def datagram_received(self, data, addr):
+        received = time.perf_counter()
+        if len(data) < dns_server.DNS_HEADER_SIZE:
+            return
+        entry = self.pending.pop(struct.unpack_from('!H', data, 0)[0], None)
+        if entry is None:
+            return
+        sent, kind, future = entry
+        latency = received - sent
+        if latency > self.timeout:
+            self.late += 1
+        else:
+            self.histograms[kind].record(int(latency * 1e9))
+            rcode = RCODE_NAMES.get(data[3] & dns_server.RCODE_MASK, str(data[3] & dns_server.RCODE_MASK))
+            self.rcodes[rcode] = self.rcodes.get(rcode, 0) + 1
+            self.last_received = received
+        if future is not None and not future.done():
+            future.set_result(None)
+
+##@brief Нагрузка смесью запросов в режиме closed loop или open loop
+# В closed loop concurrency запросов постоянно ожидают ответа, следующий запрос
+# уходит после ответа или таймаута. В open loop запросы уходят с постоянной
+# частотой rate независимо от ответов сервера, а задержка отсчитывается от
+# запланированного момента отправки, поэтому отставание клиента или очередь на
+# сервере не скрывают задержку (coordinated omission).
+#@param [in] port Порт сервера
+#@param [in] packets Список запросов без первых двух байт ID
+#@param [in] kinds Список видов запросов
+#@param [in] loop_mode "closed" или "open"
+#@param [in] concurrency Количество одновременно ожидающих запросов (closed loop)
+#@param [in] rate Частота отправки запросов в секунду (open loop)
+#@param [in] timeout Таймаут ожидания ответа в секундах
+#@param [in] sockets Количество клиентских сокетов
+#@return Словарь с длительностью, гистограммами по видам запросов, кодами ответов и затраченным временем CPU клиента
+async def run_mixed_load(port, packets, kinds, loop_mode, concurrency, rate, timeout=2.0, sockets=1):
+    loop = asyncio.get_running_loop()
+    endpoints = [await loop.create_datagram_endpoint(lambda: MixedLoadClientProtocol(timeout), remote_addr=('127.0.0.1', port))
+                 for _ in range(sockets)]
+    clients = [client for _, client in endpoints]
+    total = len(packets)
+    cpu_started = time.process_time()
+    start = time.perf_counter()
+    if loop_mode == "closed":
+        counter = iter(range(total))
+
+        async def worker(client):
+            for number in counter:
+                query_id = number & 0xFFFF
+                future = loop.create_future()
+                client.send(query_id, packets[number], kinds[number], time.perf_counter(), future)
+                try:
+                    await asyncio.wait_for(future, timeout)
+                except asyncio.TimeoutError:
+                    client.pending.pop(query_id, None)
+
+        await asyncio.gather(*(worker(clients[number % sockets]) for number in range(concurrency)))
+        sent_seconds = time.perf_counter() - start
+    else:
+        interval = 1.0 / rate
+        for number in range(total):
+            scheduled = start + number * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0.001:
+                await asyncio.sleep(delay)
+            elif number % 32 == 0:
+                await asyncio.sleep(0)
+            clients[number % sockets].send(number & 0xFFFF, packets[number], kinds[number], scheduled)
+        sent_seconds = time.perf_counter() - start
+        deadline = time.perf_counter() + timeout
+        while any(client.pending for client in clients) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+    last_received = max(client.last_received for client in clients)
+    duration = max(sent_seconds, last_received - start)
+    for transport, _ in endpoints:
+        transport.close()
+    histograms = clients[0].histograms
+    rcodes = dict(clients[0].rcodes)
+    for client in clients[1:]:
+        for kind, histogram in client.histograms.items():
+            histograms[kind].merge(histogram)
+        for rcode, count in client.rcodes.items():
+            rcodes[rcode] = rcodes.get(rcode, 0) + count
+    return {"duration": duration, "sent_seconds": sent_seconds, "histograms": histograms, "rcodes": rcodes,
+            "late": sum(client.late for client in clients), "cpu_seconds": time.process_time() - cpu_started}
+
+##@brief Тело клиентского процесса нагрузочного теста
+#@param [in] arguments Кортеж аргументов run_mixed_load
+#@return Результат run_mixed_load
+def run_mixed_load_process(arguments):
+    return asyncio.run(run_mixed_load(*arguments))
+
+##@brief Процессорное время процесса и всех его потомков (рабочих процессов сервера)
+#@param [in] pid Идентификатор процесса
+#@return Сумма utime + stime в секундах (0.0, если /proc недоступен)
+def process_tree_cpu_seconds(pid):
+    ticks = os.sysconf('SC_CLK_TCK')
+    times = {}
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat:
+                fields = stat.read().rpartition(')')[2].split()
+        except OSError:
+            continue
+        parents[int(entry)] = int(fields[1])
+        times[int(entry)] = int(fields[11]) + int(fields[12])
+    tree = {pid}
+    changed = True
+    while changed:
+        children = {child for child, parent in parents.items() if parent in tree} - tree
+        changed = bool(children)
+        tree |= children
+    return sum(times.get(member, 0) for member in tree) / ticks
+
+##@brief Версия исходников для сравнения результатов между коммитами
+#@return Словарь {"commit", "dirty"} или None вне git-репозитория
+def source_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=PACKAGE_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=PACKAGE_DIR,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return {"commit": commit, "dirty": bool(status.strip())}
+
+##@brief Сводка гистограммы в миллисекундах
+#@param [in] histogram LatencyHistogram
+#@return Словарь с количеством, средним, максимумом и процентилями в миллисекундах
+def latency_summary_ms(histogram):
+    return {name: value if name == "count" else round(value / 1e6, 4)
+            for name, value in histogram.summary().items() if name != "sum"}
+
+##@brief Метрики тестируемого сервера со всех рабочих процессов
+#@param [in] workers Количество рабочих процессов
+#@return Список снимков ServerStats (None для процессов, не ответивших на запрос)
+def collect_server_stats(workers):
+    snapshots = []
+    for number in range(workers):
+        try:
+            snapshots.append(json.loads(server_stats.query_stats(server_stats.worker_stats_address(BENCHMARK_STATS_ADDRESS, number))))
+        except (OSError, ValueError):
+            snapshots.append(None)
+    return snapshots
+
+##@brief Нагрузочный тест DNS-сервера смесью запросов с записью результатов в JSON Lines
+# Для каждого режима сервера запускается dns_server.py во временном каталоге с
+# заглушкой вышестоящего сервера вместо DNS_UPSTREAMS. Результат каждого
+# режима - одна JSON-строка с параметрами теста, версией исходников, QPS,
+# процентилями задержек (всего и по видам запросов), потерями, временем CPU
+# сервера и его метриками с точки метрик.
+#@param [in] options Разобранные аргументы командной строки подкоманды load
+def benchmark_load(options):
+    upstream_port, server_port = 15353, 15354
+    upstream = start_fake_upstream(upstream_port, options.upstream_delay, options.upstream_loss)
+    total = options.queries if options.loop == "closed" else int(options.rate * options.duration)
+    revision = source_revision()
+    overrides = {"DNS_STATS_ADDRESS": BENCHMARK_STATS_ADDRESS}
+    if options.log_level:
+        overrides["LOG_LEVEL"] = options.log_level
+    try:
+        for mode in options.servers:
+            extra_args = (*SERVER_MODES[mode], "--workers", str(options.workers), *options.server_arg)
+            workdir = prepare_workdir(overrides)
+            packets, kinds = build_query_mix(os.path.join(workdir, "domain_dns_name_ip.json"), options.mix, total,
+                                             options.names, options.seed)
+            server = start_server(workdir, server_port, upstream_port, extra_args)
+            try:
+                cpu_started = process_tree_cpu_seconds(server.pid)
+                arguments = [(server_port, packets[number::options.clients], kinds[number::options.clients], options.loop,
+                              max(1, options.concurrency // options.clients), options.rate / options.clients,
+                              options.timeout, options.sockets) for number in range(options.clients)]
+                if options.clients > 1:
+                    with multiprocessing.Pool(options.clients) as pool:
+                        results = pool.map(run_mixed_load_process, arguments)
+                else:
+                    results = [run_mixed_load_process(arguments[0])]
+                server_cpu = process_tree_cpu_seconds(server.pid) - cpu_started
+                snapshots = collect_server_stats(options.workers)
+            finally:
+                server.send_signal(signal.SIGINT)
+                try:
+                    server.wait(10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+                    server.wait()
+                shutil.rmtree(workdir, ignore_errors=True)
+
+            duration = max(result["duration"] for result in results)
+            sent_seconds = max(result["sent_seconds"] for result in results)
+            overall = server_stats.LatencyHistogram()
+            by_kind = {}
+            rcodes = {}
+            for kind in LOAD_KINDS:
+                sent = kinds.count(kind)
+                if not sent:
+                    continue
+                histogram = server_stats.LatencyHistogram()
+                for result in results:
+                    histogram.merge(result["histograms"][kind])
+                overall.merge(histogram)
+                by_kind[kind] = {"sent": sent, "answered": histogram.count, "lost": sent - histogram.count,
+                                 "latency_ms": latency_summary_ms(histogram)}
+            for result in results:
+                for rcode, count in result["rcodes"].items():
+                    rcodes[rcode] = rcodes.get(rcode, 0) + count
+            lost = total - overall.count
+            record = {
+                "benchmark": "dns_load",
+                "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                "revision": revision,
+                "host": {"cpus": os.cpu_count(), "python": platform.python_version(), "platform": platform.platform()},
+                "server": {"mode": mode, "workers": options.workers, "args": list(extra_args)},
+                "load": {"loop": options.loop, "queries": total, "concurrency": options.concurrency if options.loop == "closed" else None,
+                         "rate": options.rate if options.loop == "open" else None, "clients": options.clients,
+                         "sockets": options.sockets, "mix": options.mix, "names": options.names, "timeout": options.timeout},
+                "upstream": {"delay": options.upstream_delay, "loss": options.upstream_loss},
+                "duration_s": round(duration, 3),
+                "send_rate": round(total / sent_seconds, 1) if sent_seconds else None,
+                "qps": round(overall.count / duration, 1) if duration else None,
+                "answered": overall.count,
+                "lost": lost,
+                "loss_rate": round(lost / total, 6) if total else 0.0,
+                "late": sum(result["late"] for result in results),
+                "latency_ms": latency_summary_ms(overall),
+                "by_kind": by_kind,
+                "rcodes": rcodes,
+                "server_cpu_seconds": round(server_cpu, 3),
+                "server_cpu_percent": round(100 * server_cpu / duration, 1) if duration else None,
+                "client_cpu_seconds": round(sum(result["cpu_seconds"] for result in results), 3),
+                "server_stats": snapshots
+            }
+            latency = record["latency_ms"]
+            print(f"{mode:9s} qps {record['qps'] or 0:9.0f}  p50 {latency['p50']:7.2f} ms  p99 {latency['p99']:7.2f} ms"
+                  f"  p99.9 {latency['p99.9']:7.2f} ms  lost {lost}  server CPU {record['server_cpu_percent'] or 0:5.1f}%")
+            for kind, summary in by_kind.items():
+                print(f"          {kind:9s} answered {summary['answered']:8d}  lost {summary['lost']:6d}"
+                      f"  p50 {summary['latency_ms']['p50']:7.2f} ms  p99 {summary['latency_ms']['p99']:7.2f} ms")
+            if options.loop == "open" and record["send_rate"] < options.rate * 0.95:
+                print(f"          client sent only {record['send_rate']:.0f} qps of {options.rate:.0f}; add --clients")
+            if options.output:
+                with open(options.output, 'a', encoding='utf-8') as output:
+                    output.write(json.dumps(record) + '\n')
+    finally:
+        upstream.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DNS server benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    codec_parser = commands.add_parser("codec", help="per-packet parse/build cost of PakageDns vs PakageDnsWire")
+    codec_parser.add_argument("--iterations", type=int, default=100000)
+    zone_parser = commands.add_parser("zone", help="local-zone hit cost of the domain_ip dict vs compiled DnsZone")
+    zone_parser.add_argument("--iterations", type=int, default=100000)
+    serve_parser = commands.add_parser("serve", help="queries/sec and p99 of DNSServer vs AsyncDNSServer with a local stand-in upstream")
+    serve_parser.add_argument("--queries", type=int, default=20000)
+    serve_parser.add_argument("--concurrency", type=int, default=64)
+    serve_parser.add_argument("--upstream-delay", type=float, default=0.02, help="stand-in upstream delay, seconds")
+    serve_parser.add_argument("--forward-share", type=float, default=0.5, help="share of queries forwarded upstream")
+    scaling_parser = commands.add_parser("scaling", help="DNSServer throughput with 1, 2, 4 and 8 SO_REUSEPORT workers")
+    scaling_parser.add_argument("--queries", type=int, default=40000)
+    scaling_parser.add_argument("--concurrency", type=int, default=32, help="outstanding queries per client process")
+    scaling_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    scaling_parser.add_argument("--clients", type=int, default=4, help="client processes")
+    failover_parser = commands.add_parser("failover", help="forwarding through a dead, a lossy and a slow upstream")
+    failover_parser.add_argument("--queries", type=int, default=10000)
+    failover_parser.add_argument("--concurrency", type=int, default=32)
+    failover_parser.add_argument("--loss", type=float, default=0.3, help="packet loss of the fast upstream")
+    failover_parser.add_argument("--slow-delay", type=float, default=0.02, help="delay of the lossless upstream, seconds")
+    zone_index_parser = commands.add_parser("zone-index", help="RSS, startup and lookup ns/op of DnsZone vs CompactZoneIndex vs MappedZoneSnapshot")
+    zone_index_parser.add_argument("--records", type=int, default=1000000)
+    zone_index_parser.add_argument("--lookups", type=int, default=100000)
+    load_parser = commands.add_parser("load", help="closed/open loop load with a local/forward/NXDOMAIN query mix, results as JSON Lines")
+    load_parser.add_argument("--loop", choices=("closed", "open"), default="closed",
+                             help="closed: fixed concurrency; open: fixed send rate")
+    load_parser.add_argument("--queries", type=int, default=20000, help="queries per server mode (closed loop)")
+    load_parser.add_argument("--concurrency", type=int, default=64, help="outstanding queries in total (closed loop)")
+    load_parser.add_argument("--rate", type=float, default=5000, help="queries per second in total (open loop)")
+    load_parser.add_argument("--duration", type=float, default=5, help="seconds of sending (open loop)")
+    load_parser.add_argument("--mix", type=parse_query_mix, default=parse_query_mix("local=0.6,forward=0.3,nxdomain=0.1"),
+                             help="query shares, e.g. local=0.6,forward=0.3,nxdomain=0.1")
+    load_parser.add_argument("--names", type=int, default=0,
+                             help="distinct forwarded/NXDOMAIN names (0: every name is unique, no cache hits)")
+    load_parser.add_argument("--servers", nargs="+", choices=tuple(SERVER_MODES), default=list(SERVER_MODES))
+    load_parser.add_argument("--workers", type=int, default=1, help="SO_REUSEPORT worker processes of the server")
+    load_parser.add_argument("--server-arg", action="append", default=[], help="extra dns_server.py argument (repeatable)")
+    load_parser.add_argument("--log-level", choices=("debug", "info", "warning", "error"), default=None,
+                             help="LOG_LEVEL of the server (default: from configuration.json)")
+    load_parser.add_argument("--upstream-delay", type=float, default=0.005, help="stand-in upstream delay, seconds")
+    load_parser.add_argument("--upstream-loss", type=float, default=0.0, help="stand-in upstream packet loss (0..1)")
+    load_parser.add_argument("--clients", type=int, default=1, help="client processes")
+    load_parser.add_argument("--sockets", type=int, default=1, help="client sockets per client process")
+    load_parser.add_argument("--timeout", type=float, default=2.0, help="answers later than this are counted as lost")
+    load_parser.add_argument("--seed", type=int, default=1, help="seed of the query mix")
+    load_parser.add_argument("--output", help="append one JSON line per server mode to this file")
+    args = parser.parse_args()
+    if args.command == "codec":
+        benchmark_codec(args.iterations)
+    elif args.command == "zone":
+        benchmark_zone(args.iterations)
+    elif args.command == "serve":
+        benchmark_serve(args.queries, args.concurrency, args.upstream_delay, args.forward_share)
+    elif args.command == "scaling":
+        benchmark_scaling(args.queries, args.concurrency, args.workers, args.clients)
+    elif args.command == "failover":
+        benchmark_failover(args.queries, args.concurrency, args.loss, args.slow_delay)
+    elif args.command == "zone-index":
+        benchmark_zone_index(args.records, args.lookups)
+    elif args.command == "load":
+        benchmark_load(args)
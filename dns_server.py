@@ -6,10 +6,6 @@ import socket
 #Модуль для работы с сетевыми сокетами.
 #Предоставляет классы и методы для создания и управления сетевыми соединениями.
 
-import datetime
-##@package datetime
-#Модуль для работы с датой и временем.
-
 import sys
 ##@package sys
 #Модуль для работы с системными функциями и параметрами.
@@ -30,6 +26,102 @@ import os
 ##@package os
 #Модуль для работы с операционной системой, включая доступ к файловой системе.
 
+import random
+##@package random
+#Модуль для генерации случайных чисел (идентификаторы транзитных запросов).
+
+import struct
+##@package struct
+#Модуль для разбора и сборки бинарных структур (заголовок и секции DNS-пакета).
+
+import asyncio
+##@package asyncio
+#Модуль асинхронного ввода-вывода (режим AsyncDNSServer).
+
+import argparse
+##@package argparse
+#Модуль для разбора аргументов командной строки.
+
+import time
+##@package time
+#Модуль для работы с монотонным временем (сроки жизни записей кэша).
+
+from collections import OrderedDict
+##@package collections
+#Модуль с контейнерами; OrderedDict хранит порядок LRU кэша ответов.
+
+import select
+##@package select
+#Модуль ожидания готовности нескольких сокетов (клиентский и вышестоящий).
+
+import gc
+##@package gc
+#Модуль управления сборщиком мусора (заморозка объектов зоны перед fork).
+
+import heapq
+##@package heapq
+#Модуль двоичной кучи (сроки ожидания транзитных запросов).
+
+from array import array
+##@package array
+#Модуль компактных массивов чисел (свободные идентификаторы транзитных запросов).
+
+from dns_zone import DynamicZone, ZoneFileWatcher, load_zone
+##@package dns_zone
+#Скомпилированная зона для ответов на локальные имена.
+from dns_updates import UPDATE_DATAGRAM_SIZE, decode_updates, open_update_socket
+##@package dns_updates
+#Канал событий аренд DHCP-сервера (динамические имена клиентов).
+
+from server_log import BatchLogger, LOG_DEBUG, LOG_INFO, LOG_WARNING, LOG_ERROR
+##@package server_log
+#Асинхронное пакетное логирование.
+
+from server_stats import ServerStats, start_stats_endpoint, worker_stats_address
+##@package server_stats
+#Счетчики, гистограммы задержек и точка чтения метрик.
+
+
+##@brief Формат заголовка DNS: ID, флаги, QDCOUNT, ANCOUNT, NSCOUNT, ARCOUNT
+DNS_HEADER = struct.Struct('!6H')
+##@brief Формат хвоста вопроса DNS: QTYPE, QCLASS
+DNS_QUESTION_TAIL = struct.Struct('!HH')
+##@brief Размер заголовка DNS-пакета в байтах
+DNS_HEADER_SIZE = 12
+##@brief Размер буфера приема и отправки DNS-пакетов (максимальный DNS-пакет по TCP)
+DNS_BUFFER_SIZE = 65535
+##@brief Размер UDP-ответа для клиентов без EDNS0 (RFC 1035)
+DNS_UDP_PAYLOAD = 512
+##@brief Размер UDP-пакета, который сервер объявляет в своей записи OPT
+DNS_EDNS_PAYLOAD = 1232
+##@brief Префикс длины DNS-сообщения в TCP-потоке
+DNS_TCP_LENGTH = struct.Struct('!H')
+
+##@brief Биты поля флагов DNS-заголовка
+FLAG_QR = 0x8000
+FLAG_AA = 0x0400
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+FLAG_RA = 0x0080
+OPCODE_MASK = 0x7800
+RCODE_MASK = 0x000F
+##@brief Код ответа SERVFAIL
+RCODE_SERVFAIL = 2
+##@brief Код ответа NXDOMAIN
+RCODE_NXDOMAIN = 3
+##@brief Тип ресурсной записи OPT (EDNS0)
+QTYPE_OPT = 41
+##@brief Формат начала ресурсной записи после имени: TYPE, CLASS, TTL, RDLENGTH
+DNS_RR_FIXED = struct.Struct('!HHIH')
+##@brief Запись OPT сервера: корневое имя, TYPE=OPT, CLASS=размер UDP-пакета, без опций
+DNS_OPT_RECORD = b'\x00' + DNS_RR_FIXED.pack(QTYPE_OPT, DNS_EDNS_PAYLOAD, 0, 0)
+##@brief Предел исходящего буфера TCP-соединения; клиент, не читающий ответы, отключается
+DNS_TCP_OUTBOX_LIMIT = 1 << 20
+##@brief Период пробуждения цикла сервера для проверки сроков транзитных запросов, секунды
+PENDING_TICK = 0.25
+##@brief Предел датаграмм событий DHCP, применяемых одной пачкой
+UPDATE_DRAIN_LIMIT = 256
+
 
 ##@class DNSServer
 ##@brief Инициализация сервера DNS
@@ -39,25 +131,70 @@ class DNSServer:
  #@param [in] output_file Файл для логирования работы сервера (по умолчанию "DNSLog.txt")
  #@param [in] name_configuration Имя файла конфигурации (по умолчанию "configuration.json")
  #@param [in] domain_ip Файл с маппингом доменов и IP-адресов (по умолчанию "domain_dns_name_ip.json")
-    def __init__(self, port=53, ip_address='0.0.0.0', output_file="DNSLog.txt", name_configuration="configuration.json",domain_ip="domain_dns_name_ip.json"):
+ #@param [in] upstreams Список адресов вышестоящих DNS-серверов (по умолчанию DNS_UPSTREAMS из конфигурации)
+ #@param [in] zone Готовая скомпилированная зона (по умолчанию загружается из domain_ip)
+ #@param [in] reuse_port Разрешить нескольким процессам слушать один порт (SO_REUSEPORT)
+ #@param [in] zone_index Вид индекса зоны: "dict", "compact" или "snapshot" (по умолчанию DNS_ZONE_INDEX из конфигурации)
+ #@param [in] stats_address Адрес точки метрик (по умолчанию DNS_STATS_ADDRESS из конфигурации, "" - отключена)
+ #@param [in] update_socket Unix-сокет событий аренд DHCP (по умолчанию DNS_UPDATE_SOCKET из конфигурации, "" - отключен)
+    def __init__(self, port=53, ip_address='0.0.0.0', output_file="DNSLog.txt", name_configuration="configuration.json",domain_ip="domain_dns_name_ip.json",
+                 upstreams=None, zone=None, reuse_port=False, zone_index=None, stats_address=None, update_socket=None):
         self.port = port
         self.ip_address = ip_address
         self.output_file = output_file
         self.name_domain_ip=domain_ip
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.should_stop = False 
-        self.domain_ip={}
-        self.dictionary={}
-        self.array_transit_numbers=[]
-        self.pakage_on_server_next=[]
         self.package_dns_transcript = None
+        self.receive_buffer = bytearray(DNS_BUFFER_SIZE)
+        self.send_buffer = bytearray(DNS_BUFFER_SIZE)
         self.Configuration=read_json_file(name_configuration)
+        self.logger = BatchLogger.from_configuration(output_file, self.Configuration)
+        if self.Configuration is None:
+            self.log_dns_server("Cannot read configuration file %s, using defaults", name_configuration, level=LOG_WARNING)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        if os.path.exists(self.name_domain_ip):
-            self.domain_ip=read_json_file(self.name_domain_ip)
-        else:
-            write_to_json_file(self.domain_ip, self.name_domain_ip)
+        if reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.reuse_port = reuse_port
+        self.upstream_socket = None
+        self.tcp_socket = None
+        self.tcp_connections = {}
+        self.zone_watcher = None
+        configuration = self.Configuration or {}
+        self.zone_file, self.zone_index = zone_source(configuration, self.name_domain_ip, zone_index)
+        self.zone = zone if zone is not None else load_zone(self.zone_file, self.zone_index)
+        self.dynamic_zone = DynamicZone(str(configuration.get('DNS_DYNAMIC_DOMAIN', 'lan')),
+                                        int(configuration.get('DNS_DYNAMIC_TTL', 60)))
+        self.update_path = configuration.get('DNS_UPDATE_SOCKET', '') if update_socket is None else update_socket
+        self.update_socket = None
+        self.response_cache = DnsResponseCache(max_entries=int(configuration.get('DNS_CACHE_MAX_ENTRIES', 10000)),
+                                               max_bytes=int(configuration.get('DNS_CACHE_MAX_BYTES', 8 * 1024 * 1024)),
+                                               negative_ttl=int(configuration.get('DNS_CACHE_NEGATIVE_TTL', 60)))
+        self.pending = PendingQueryTable(timeout=float(configuration.get('DNS_UPSTREAM_TIMEOUT', 2.0)))
+        if upstreams is None:
+            upstreams = [parse_address(value) for value in configuration.get('DNS_UPSTREAMS', ["8.8.8.8:53"])]
+        self.upstreams = UpstreamSelector(upstreams, timeout=self.pending.timeout)
+        self.upstream_attempts = int(configuration.get('DNS_UPSTREAM_ATTEMPTS', 2))
+        self.tcp_idle_timeout = float(configuration.get('DNS_TCP_IDLE_TIMEOUT', 10))
+        self.tcp_max_connections = int(configuration.get('DNS_TCP_MAX_CONNECTIONS', 128))
+        self.stats = ServerStats("dns")
+        self.stats_address = configuration.get('DNS_STATS_ADDRESS', '') if stats_address is None else stats_address
+        self.stats_endpoint = None
+        self.parse_time = self.stats.histogram("parse")
+        self.lookup_time = self.stats.histogram("lookup")
+        self.build_time = self.stats.histogram("build")
+        self.send_time = self.stats.histogram("send")
+        self.upstream_time = self.stats.histogram("upstream")
+        self.update_delay = self.stats.histogram("dynamic_delay")
+        self.stats.gauge("pending_forwards", lambda: len(self.pending))
+        self.stats.gauge("pending_oldest_age_seconds", lambda: round(self.pending.oldest_age(time.monotonic()), 3))
+        self.stats.gauge("cache_entries", lambda: len(self.response_cache))
+        self.stats.gauge("tcp_connections", lambda: len(self.tcp_connections))
+        self.stats.gauge("zone_records", lambda: len(self.zone))
+        self.stats.gauge("dynamic_records", lambda: len(self.dynamic_zone))
+        self.stats.gauge("dynamic_invalid", lambda: self.dynamic_zone.invalid)
+        self.stats.gauge("log_dropped", lambda: self.logger.dropped)
 
         signal.signal(signal.SIGINT, self.signal_handler)
  ##@brief Обработчик сигнала для корректного завершения работы сервера
@@ -71,68 +208,379 @@ class DNSServer:
         sys.exit(0)
     
  ##@brief Логирование сообщений сервера в файл
+ # Запись передается фоновому потоку BatchLogger и не блокирует обработку пакетов.
   #@param [in] log Текст лог-сообщения
-    def log_dns_server(self, log):
-        now = datetime.datetime.now()
-        formatted_time = now.strftime('%Y-%m-%d %H:%M:%S')
-        with open(self.output_file, 'a+') as f:
-            f.write(f"{formatted_time}: {log}\n")
- ##@brief Сохранение транзитных номеров для предотвращения повторного использования
- #@param [in] num Транзитный номер
- #@return Уникальный список транзитных номеров
-    def saving_transit_numbers(self, num):
-        self.array_transit_numbers.append(num)
-        return list(set(self.array_transit_numbers))
-
- ##@brief Генерация уникального идентификатора запроса для DNS-пакета
- #@return Уникальный 16-битный идентификатор в формате hex
-    def selection_of_a_unique_id(self):
-        while True:
-            random_number = random.randint(0, 65535)
-            hex_string = (4-len(hex(random_number)[2:]))*'0'+hex(random_number)[2:]
-            if not hex_string in self.array_transit_numbers:
-                return hex_string
+  #@param [in] args Аргументы для отложенного форматирования log % args
+  #@param [in] level Уровень сообщения (LOG_DEBUG ... LOG_ERROR)
+    def log_dns_server(self, log, *args, level=LOG_INFO):
+        self.logger.log(level, log, *args)
  # @brief Запуск DNS сервера и обработка запросов
+ # Запросы клиентов принимаются на self.socket (UDP) и tcp_socket (TCP), а обмен
+ # с вышестоящим сервером идет через отдельный сокет upstream_socket, поэтому
+ # ответы вышестоящего сервера возвращаются в тот же процесс, который переслал запрос.
     def start(self):
         self.socket.bind((self.ip_address, self.port))
+        self.upstream_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.upstream_socket.bind((self.ip_address, 0))
+        self.tcp_socket = self.open_tcp_socket()
+        self.start_zone_watcher()
+        self.stats_endpoint = start_stats_endpoint(self.stats, self.stats_address, self.log_dns_server)
         self.log_dns_server(f"The DNS server is running on {self.ip_address}:{self.port}")
+        sockets = [self.socket, self.upstream_socket, self.tcp_socket]
+        if self.update_path:
+            self.update_socket = open_update_socket(self.update_path)
+            sockets.append(self.update_socket)
         try:
             while not self.should_stop: 
-                pacage_of_client, addr = self.socket.recvfrom(1024)
-                self.log_dns_server(f"Addr:{addr}\n Data {pacage_of_client}")
-                self.package_dns_transcript = PakageDns(binascii.hexlify(pacage_of_client).decode('utf-8'))
-                self.saving_transit_numbers(self.package_dns_transcript.id)
-                if self.package_dns_transcript.flag['QR'] == '0': #запрос(0)/ ответ(1)
-                    if self.package_dns_transcript.transcript_QUERIES(self.package_dns_transcript.QUERIES) in self.domain_ip:
-                        self.package_dns_transcript.flag['QR'] = '1'
-                        self.package_dns_transcript.flag['AA'] = '1'
-                        self.package_dns_transcript.flag['RA'] = '1'
-                        array_domain = self.domain_ip[self.package_dns_transcript.transcript_QUERIES(self.package_dns_transcript.QUERIES)]
-                        self.package_dns_transcript.ANCOUNT=(4-len(hex(len(array_domain['IP']))[2:]))*'0'+hex(len(array_domain['IP']))[2:]
-                        mesage_client=self.package_dns_transcript.reassemble()+self.reassemble_ANCOUNT(array_domain)
-                        self.socket.sendto(binascii.unhexlify(mesage_client), addr)
-                    else:
-                        old_id = self.package_dns_transcript.id
-                        self.package_dns_transcript.id = self.selection_of_a_unique_id() #отправляет доп запрос на сервер 8.8.8.8
-                        self.dictionary = self.modify_dictionary(self.package_dns_transcript.id, value=old_id, addr=addr, remove=False)
-                        self.package_dns_transcript.flag['RA'] = "1"
-                        self.socket.sendto(binascii.unhexlify(self.package_dns_transcript.reassemble()), ('8.8.8.8',self.port))
-
-                else:
-                    (ip_client, port_client)=self.dictionary[self.package_dns_transcript.id]["addr"]
-                    self.package_dns_transcript.id = self.dictionary[self.package_dns_transcript.id]["id"]
-                    self.package_dns_transcript.flag["AA"] = "0"
-                    self.dictionary = self.modify_dictionary(self.package_dns_transcript.id,remove=True)
-                    self.socket.sendto(binascii.unhexlify(self.package_dns_transcript.reassemble()), (ip_client, port_client))
-                    
+                writers = [connection.socket for connection in self.tcp_connections.values() if connection.outbox]
+                readable, writable, _ = select.select(sockets + list(self.tcp_connections), writers, [], PENDING_TICK)
+                now = time.monotonic()
+                for ready_socket in readable:
+                    try:
+                        if ready_socket is self.socket:
+                            self.handle_client_packet(now)
+                        elif ready_socket is self.upstream_socket:
+                            self.handle_upstream_packet(now)
+                        elif ready_socket is self.tcp_socket:
+                            self.accept_tcp_connection(now)
+                        elif ready_socket is self.update_socket:
+                            self.receive_updates()
+                        elif ready_socket in self.tcp_connections:
+                            self.handle_tcp_data(self.tcp_connections[ready_socket], now)
+                    except (BlockingIOError, InterruptedError):
+                        pass
+                    except OSError as e:
+                        if ready_socket in self.tcp_connections:
+                            self.tcp_connections[ready_socket].closed = True
+                        self.drop_packet(e)
+                    except Exception as e:
+                        self.drop_packet(e)
+                for ready_socket in writable:
+                    if ready_socket in self.tcp_connections:
+                        self.tcp_connections[ready_socket].flush()
+                self.expire_pending(now)
+                self.close_tcp_connections(now)
 
         except OSError as e:
-            self.log_dns_server(f'Error when starting the server: {e}')
+            self.log_dns_server(f'Error when starting the server: {e}', level=LOG_ERROR)
         finally:
             self.socket.close()
+            if self.upstream_socket is not None:
+                self.upstream_socket.close()
+            if self.tcp_socket is not None:
+                self.tcp_socket.close()
+            for connection in self.tcp_connections.values():
+                connection.close()
+            self.close_update_socket()
+            if self.zone_watcher is not None:
+                self.zone_watcher.stop()
+            if self.stats_endpoint is not None:
+                self.stats_endpoint.stop()
+            self.log_dns_server(f'Response cache: {self.response_cache.stats()}')
+            self.log_dns_server(f'Pending queries: {self.pending.stats(time.monotonic())}')
+            self.log_dns_server(f'Upstreams: {self.upstreams.stats()}')
+            self.log_dns_server(f'Log: {self.logger.stats()}')
             self.log_dns_server('DNS server stopped')  
-    
- ##@brief Формирование записи ответа для ANCOUNT (Ответ)
+            self.logger.close()
+
+ ##@brief Запуск фоновой перезагрузки зоны при изменении файла domain_ip
+ # Период проверки задается параметром DNS_ZONE_RELOAD_INTERVAL (0 - отключено).
+    def start_zone_watcher(self):
+        interval = float((self.Configuration or {}).get('DNS_ZONE_RELOAD_INTERVAL', 1.0))
+        if interval > 0:
+            self.zone_watcher = ZoneFileWatcher(self.zone_file, self.replace_zone, self.log_dns_server, interval,
+                                                loader=lambda file_name: load_zone(file_name, self.zone_index))
+            self.zone_watcher.start()
+
+ ##@brief Атомарная замена зоны: запросы видят либо старую, либо новую зону целиком
+ #@param [in] zone Новая скомпилированная зона
+    def replace_zone(self, zone):
+        self.zone = zone
+
+ ##@brief Применение событий аренд DHCP, ожидающих в сокете update_socket
+ # Все ожидающие датаграммы (до UPDATE_DRAIN_LIMIT) применяются к DynamicZone
+ # одной пачкой; в гистограмме dynamic_delay - время от отправки пачки DHCP-сервером.
+    def receive_updates(self):
+        events = []
+        for _ in range(UPDATE_DRAIN_LIMIT):
+            try:
+                data = self.update_socket.recv(UPDATE_DATAGRAM_SIZE)
+            except BlockingIOError:
+                break
+            try:
+                sent_ns, batch = decode_updates(data)
+            except ValueError as e:
+                self.stats.increment("dynamic_malformed")
+                self.log_dns_server(f"Malformed DHCP update datagram: {e}", level=LOG_WARNING)
+                continue
+            self.update_delay.record(max(0, time.time_ns() - sent_ns))
+            events.extend(batch)
+        if events:
+            self.dynamic_zone.apply(events)
+            self.stats.increment("dynamic_updates", len(events))
+
+ ##@brief Закрытие сокета событий аренд DHCP и удаление его файла
+    def close_update_socket(self):
+        if self.update_socket is None:
+            return
+        self.update_socket.close()
+        self.update_socket = None
+        if os.path.exists(self.update_path):
+            os.remove(self.update_path)
+
+ ##@brief Отбрасывание пакета, обработка которого завершилась ошибкой
+ # Ошибка разбора, поиска или отправки ответа одному клиенту не должна
+ # останавливать сервер; TCP-соединение с такой ошибкой сокета закрывается
+ # в close_tcp_connections. Сервер останавливает только ошибка select, то есть
+ # отказ самих слушающих сокетов.
+ #@param [in] error Исключение
+    def drop_packet(self, error):
+        self.stats.increment("packet_error")
+        self.log_dns_server(f"Packet dropped after an error: {error!r}", level=LOG_ERROR)
+
+ ##@brief Открытие слушающего TCP-сокета на порту сервера
+ #@return Неблокирующий слушающий сокет
+    def open_tcp_socket(self):
+        tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        tcp_socket.bind((self.ip_address, self.port))
+        tcp_socket.listen(self.tcp_max_connections)
+        tcp_socket.setblocking(False)
+        return tcp_socket
+
+ ##@brief Прием TCP-соединения; сверх DNS_TCP_MAX_CONNECTIONS соединение сразу закрывается
+ #@param [in] now Текущее монотонное время
+    def accept_tcp_connection(self, now):
+        try:
+            client_socket, addr = self.tcp_socket.accept()
+        except OSError:
+            return
+        if len(self.tcp_connections) >= self.tcp_max_connections:
+            client_socket.close()
+            return
+        client_socket.setblocking(False)
+        self.tcp_connections[client_socket] = DnsTcpConnection(client_socket, addr, now)
+
+ ##@brief Чтение из TCP-соединения и обработка всех полученных целиком запросов
+ #@param [in] connection DnsTcpConnection
+ #@param [in] now Текущее монотонное время
+    def handle_tcp_data(self, connection, now):
+        for message in connection.receive(now):
+            self.handle_query(connection, memoryview(message), len(message), now)
+
+ ##@brief Закрытие TCP-соединений: закрытых клиентом, с ошибкой и простаивающих дольше DNS_TCP_IDLE_TIMEOUT
+ #@param [in] now Текущее монотонное время
+    def close_tcp_connections(self, now):
+        for connection in list(self.tcp_connections.values()):
+            if connection.closed or now - connection.last_active > self.tcp_idle_timeout:
+                connection.close()
+                del self.tcp_connections[connection.socket]
+
+ ##@brief Обработка одного пакета клиента: ответ из зоны, из кэша или пересылка
+ #@param [in] now Текущее монотонное время
+    def handle_client_packet(self, now):
+        receive_view = memoryview(self.receive_buffer)
+        length, addr = self.socket.recvfrom_into(self.receive_buffer)
+        self.handle_query(addr, receive_view, length, now)
+
+ ##@brief Обработка запроса клиента
+ #@param [in] client Адрес UDP-клиента или DnsTcpConnection
+ #@param [in] view memoryview с запросом
+ #@param [in] length Длина запроса
+ #@param [in] now Текущее монотонное время
+    def handle_query(self, client, view, length, now):
+        if self.logger.sample_packet():
+            self.log_dns_server("Addr:%s\n Data %r", client, bytes(view[:length]), level=LOG_DEBUG)
+        started = time.perf_counter_ns()
+        try:
+            self.package_dns_transcript = PakageDnsWire(view, length)
+        except ValueError as e:
+            self.stats.increment("malformed")
+            self.log_dns_server(f"Malformed DNS packet from {client}: {e}", level=LOG_WARNING)
+            return
+        self.parse_time.record(time.perf_counter_ns() - started)
+        self.stats.increment("query_udp" if isinstance(client, tuple) else "query_tcp")
+        if self.package_dns_transcript.flags & FLAG_QR: #запрос(0)/ ответ(1)
+            return
+        length_answer = self.answer_local(self.package_dns_transcript)
+        if length_answer is None:
+            length_answer = self.answer_cached(self.package_dns_transcript)
+        if length_answer is None:
+            if self.forward_query(client, self.package_dns_transcript.id, bytearray(view[:length]), now):
+                return
+            length_answer = self.answer_servfail(self.package_dns_transcript)
+        self.finish_answer(client, self.package_dns_transcript, length_answer)
+
+ ##@brief Отправка ответа клиенту по UDP или в TCP-соединение
+ #@param [in] client Адрес UDP-клиента или DnsTcpConnection
+ #@param [in] view memoryview с ответом
+    def reply(self, client, view):
+        if isinstance(client, tuple):
+            self.socket.sendto(view, client)
+        else:
+            client.send(view)
+
+ ##@brief Отправка ответа, собранного сервером в send_buffer
+ # Если запрос содержит запись OPT, в ответ добавляется OPT сервера. UDP-ответ,
+ # не помещающийся в объявленный клиентом размер (512 байт без EDNS0),
+ # заменяется усеченным ответом с флагом TC, чтобы клиент повторил запрос по TCP.
+ #@param [in] client Адрес UDP-клиента или DnsTcpConnection
+ #@param [in] request Разобранный запрос PakageDnsWire
+ #@param [in] length Длина ответа в send_buffer
+    def finish_answer(self, client, request, length):
+        payload = request.edns_payload()
+        if payload is not None:
+            length = append_opt_record(self.send_buffer, length)
+        if isinstance(client, tuple) and length > (payload or DNS_UDP_PAYLOAD):
+            length = truncate_dns_response(self.send_buffer, request, payload is not None)
+            self.stats.increment("truncated")
+        started = time.perf_counter_ns()
+        self.reply(client, memoryview(self.send_buffer)[:length])
+        self.send_time.record(time.perf_counter_ns() - started)
+
+ ##@brief Отправка клиенту ответа вышестоящего сервера
+ # UDP-ответ больше размера, объявленного клиентом, усекается с флагом TC.
+ #@param [in] client Адрес UDP-клиента или DnsTcpConnection
+ #@param [in, out] buffer bytearray с ответом
+ #@param [in] answer Разобранный ответ PakageDnsWire над buffer
+ #@param [in] query Запрос клиента
+    def relay_answer(self, client, buffer, answer, query):
+        length = answer.length
+        if isinstance(client, tuple) and length > DNS_UDP_PAYLOAD:
+            try:
+                payload = PakageDnsWire(memoryview(query)).edns_payload()
+            except ValueError:
+                payload = None
+            if length > (payload or DNS_UDP_PAYLOAD):
+                length = truncate_dns_response(buffer, answer, payload is not None)
+                self.stats.increment("truncated")
+        started = time.perf_counter_ns()
+        self.reply(client, memoryview(buffer)[:length])
+        self.send_time.record(time.perf_counter_ns() - started)
+
+ ##@brief Пересылка запроса самому быстрому доступному вышестоящему серверу
+ # Если отправка не удалась, запрос пересылается следующему серверу, пока не
+ # исчерпано DNS_UPSTREAM_ATTEMPTS попыток.
+ #@param [in] client_addr Адрес UDP-клиента или DnsTcpConnection
+ #@param [in] client_id Идентификатор запроса клиента
+ #@param [in, out] query Копия запроса (bytearray); в нее записывается идентификатор для вышестоящего сервера
+ #@param [in] now Текущее монотонное время
+ #@param [in] tried Кортеж вышестоящих серверов, которым запрос уже отправлялся
+ #@return True, если запрос отправлен
+    def forward_query(self, client_addr, client_id, query, now, tried=()):
+        flags = struct.unpack_from('!H', query, 2)[0] | FLAG_RA
+        while len(tried) < self.upstream_attempts:
+            upstream = self.upstreams.choose(now, tried)
+            if upstream is None:
+                return False
+            tried += (upstream,)
+            upstream_id = self.pending.allocate((client_addr, client_id, query, upstream, now, tried), now,
+                                                self.upstreams.attempt_timeout(upstream))
+            if upstream_id is None:
+                return False
+            patch_dns_header(query, upstream_id, flags)
+            self.stats.increment("forward" if len(tried) == 1 else "upstream_retry")
+            try:
+                self.upstream_socket.sendto(query, upstream.address)
+                return True
+            except OSError as e:
+                self.pending.release(upstream_id)
+                self.upstreams.record_failure(upstream, now)
+                self.log_dns_server(f"Error forwarding to {upstream.address}: {e}", level=LOG_WARNING)
+        return False
+
+ ##@brief Обработка ответа вышестоящего сервера: возврат клиенту и сохранение в кэш
+ #@param [in] now Текущее монотонное время
+    def handle_upstream_packet(self, now):
+        receive_view = memoryview(self.receive_buffer)
+        length, source = self.upstream_socket.recvfrom_into(self.receive_buffer)
+        try:
+            answer = PakageDnsWire(receive_view, length)
+        except ValueError as e:
+            self.log_dns_server(f"Malformed upstream answer from {source}: {e}", level=LOG_WARNING)
+            return
+        transit = self.pending.get(answer.id)
+        if transit is None or transit[3].address != source:
+            self.log_dns_server(f"Unexpected DNS answer id {answer.id} from {source}", level=LOG_WARNING)
+            return
+        if not same_question(answer, PakageDnsWire(memoryview(transit[2]))):
+            self.stats.increment("upstream_mismatch")
+            self.log_dns_server(f"DNS answer id {answer.id} from {source} does not match the question, dropped", level=LOG_WARNING)
+            return
+        self.pending.release(answer.id)
+        client_addr, client_id, query, upstream, sent_at, _ = transit
+        self.upstreams.record_success(upstream, now - sent_at)
+        self.stats.increment("upstream_reply")
+        self.upstream_time.record(int((now - sent_at) * 1e9))
+        self.response_cache.put(answer, now)
+        patch_dns_header(self.receive_buffer, client_id, answer.flags & ~FLAG_AA)
+        self.relay_answer(client_addr, self.receive_buffer, answer, query)
+
+ ##@brief Ответ на запрос из локальной зоны
+ # Имена файла зоны имеют приоритет над именами клиентов DHCP, поэтому клиент
+ # не может подменить имя из зоны, прислав его в опции Host Name.
+ #@param [in] request Разобранный запрос PakageDnsWire
+ #@return Длина ответа в send_buffer или None, если имя не принадлежит зоне или в запросе нет вопроса
+    def answer_local(self, request):
+        if not request.QDCOUNT:
+            return None
+        started = time.perf_counter_ns()
+        qname_key = request.qname_key()
+        answer = self.zone.lookup(qname_key, request.qtype)
+        if answer is None and self.dynamic_zone:
+            answer = self.dynamic_zone.lookup(qname_key, request.qtype)
+        looked_up = time.perf_counter_ns()
+        self.lookup_time.record(looked_up - started)
+        if answer is None:
+            return None
+        length = build_dns_response(self.send_buffer, request, request.flags | FLAG_QR | FLAG_AA | FLAG_RA, answer[1], answer[0])
+        self.build_time.record(time.perf_counter_ns() - looked_up)
+        self.stats.increment("local_hit")
+        return length
+
+ ##@brief Ответ SERVFAIL на запрос, который не удалось переслать или на который не ответил вышестоящий сервер
+ #@param [in] request Разобранный запрос PakageDnsWire
+ #@return Длина ответа в send_buffer
+    def answer_servfail(self, request):
+        self.stats.increment("servfail")
+        return build_dns_response(self.send_buffer, request,
+                                  (request.flags & ~RCODE_MASK) | FLAG_QR | FLAG_RA | RCODE_SERVFAIL, b'', 0)
+
+ ##@brief Завершение транзитных запросов с истекшим сроком
+ # Запрос повторяется через другой вышестоящий сервер; если попытки исчерпаны,
+ # клиенту отправляется SERVFAIL.
+ #@param [in] now Текущее монотонное время
+    def expire_pending(self, now):
+        for query_id, (client_addr, client_id, query, upstream, _, tried) in self.pending.expire(now):
+            self.upstreams.record_timeout(upstream, now)
+            self.stats.increment("upstream_timeout")
+            self.log_dns_server(f"Upstream {upstream.address} timeout for query {query_id} from {client_addr}", level=LOG_WARNING)
+            if self.forward_query(client_addr, client_id, query, now, tried):
+                continue
+            patch_dns_header(query, client_id, struct.unpack_from('!H', query, 2)[0])
+            try:
+                request = PakageDnsWire(memoryview(query))
+            except ValueError:
+                continue
+            self.finish_answer(client_addr, request, self.answer_servfail(request))
+
+ ##@brief Ответ на запрос из кэша ответов вышестоящего сервера
+ #@param [in] request Разобранный запрос PakageDnsWire
+ #@return Длина ответа в send_buffer или None при промахе кэша
+    def answer_cached(self, request):
+        length_answer = self.response_cache.get_into(self.send_buffer, request, time.monotonic())
+        if length_answer is None:
+            return None
+        self.stats.increment("cache_hit")
+        flags = struct.unpack_from('!H', self.send_buffer, 2)[0]
+        patch_dns_header(self.send_buffer, request.id, (flags & ~(FLAG_AA | FLAG_RD)) | (request.flags & FLAG_RD))
+        self.send_buffer[DNS_HEADER_SIZE:request.question_end] = request.view[DNS_HEADER_SIZE:request.question_end]
+        return length_answer
+
+ ##@brief Формирование записи ответа для ANCOUNT (Ответ) в шестнадцатеричном виде
+ # Используется устаревшим кодеком PakageDns (см. dns_benchmark.py)
  #@param [in] site_array Массив IP-адресов сайта
  #@return Строка, представляющая данные в формате ANCOUNT
     def reassemble_ANCOUNT(self,site_array):
@@ -148,29 +596,6 @@ class DNSServer:
         self.should_stop = True 
         sys.exit(0)
     
- ##@brief Добавление, обновление или удаление элемента из словаря транзитных запросов
- #@param [in] key Ключ для словаря
- #@param [in] value Значение для хранения (если необходимо добавить)
- #@param [in] addr Адрес клиента (если необходимо добавить)
- #@param [in] remove Удалить элемент из словаря (если True)
- #@return Обновленный словарь транзитных запросов
-    def modify_dictionary(self, key=None, value=None,addr=None, remove=False):
- #Если нужно добавить элемент по ключу
-        if not remove and value is not None:
-            self.dictionary[key] = {
-                                    "id":value,
-                                    "addr":addr
-        }
-
-     #Если нужно удалить элемент по ключу
-        elif remove and key in self.dictionary:
-            del self.dictionary[key]
-
-        else:
-            self.log_dns_server("Error modify_dictionary")
-
-        return self.dictionary
-    
  ##@brief Конвертация IP-адреса в шестнадцатеричный формат
  #@param [in] ip_address IP-адрес в формате строки
  #@return Строка, представляющая IP-адрес в шестнадцатеричном формате
@@ -180,7 +605,892 @@ class DNSServer:
         arr_with_zero = ['0' + item if len(item) < 2 else item for item in array_item_hex]
         return ''.join(arr_with_zero)
 
+##@class AsyncDNSServer
+##@brief DNS-сервер на asyncio
+#
+# Локальные имена обслуживаются сразу в обработчике датаграммы. Промахи
+# пересылаются вышестоящему серверу через отдельный сокет, а каждый транзитный
+# запрос ожидается как future, зарегистрированный в PendingQueryTable. Срок
+# ожидания задается самому future (asyncio.wait_for), поэтому переход к
+# следующему вышестоящему серверу происходит точно по сроку, без периодического
+# обхода таблицы, а медленный вышестоящий сервер не задерживает ответы из локальной зоны.
+class AsyncDNSServer(DNSServer):
+ #Параметры совпадают с DNSServer
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending.sweep = False
+        self.transport = None
+        self.upstream_transport = None
+        self.tcp_server = None
+        self.stop_event = None
+
+ # @brief Запуск DNS сервера и обработка запросов в цикле событий asyncio
+    def start(self):
+        try:
+            asyncio.run(self.serve())
+        except OSError as e:
+            self.log_dns_server(f'Error when starting the server: {e}', level=LOG_ERROR)
+        finally:
+            self.socket.close()
+            self.close_update_socket()
+            if self.zone_watcher is not None:
+                self.zone_watcher.stop()
+            if self.stats_endpoint is not None:
+                self.stats_endpoint.stop()
+            self.log_dns_server(f'Response cache: {self.response_cache.stats()}')
+            self.log_dns_server(f'Pending queries: {self.pending.stats(time.monotonic())}')
+            self.log_dns_server(f'Upstreams: {self.upstreams.stats()}')
+            self.log_dns_server(f'Log: {self.logger.stats()}')
+            self.log_dns_server('DNS server stopped')
+            self.logger.close()
+
+ ##@brief Корутина сервера: открытие транспортов и ожидание сигнала остановки
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        self.socket.bind((self.ip_address, self.port))
+        self.socket.setblocking(False)
+        self.start_zone_watcher()
+        self.stats_endpoint = start_stats_endpoint(self.stats, self.stats_address, self.log_dns_server)
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: DnsServerProtocol(self), sock=self.socket)
+        self.upstream_transport, _ = await loop.create_datagram_endpoint(lambda: DnsUpstreamProtocol(self),
+                                                                         local_addr=(self.ip_address, 0))
+        self.tcp_server = await asyncio.start_server(self.tcp_client, sock=self.open_tcp_socket(),
+                                                     backlog=self.tcp_max_connections)
+        if self.update_path:
+            self.update_socket = open_update_socket(self.update_path)
+            loop.add_reader(self.update_socket, self.receive_updates)
+        loop.add_signal_handler(signal.SIGINT, self.request_stop)
+        self.log_dns_server(f"The async DNS server is running on {self.ip_address}:{self.port}")
+        try:
+            await self.stop_event.wait()
+        finally:
+            if self.update_socket is not None:
+                loop.remove_reader(self.update_socket)
+            self.tcp_server.close()
+            self.upstream_transport.close()
+            self.transport.close()
+
+ ##@brief Обработчик SIGINT в цикле событий: завершение корутины serve
+    def request_stop(self):
+        self.log_dns_server("Received SIGINT, stopping DNS server gracefully.")
+        self.should_stop = True
+        self.stop_event.set()
+
+ ##@brief Обработка датаграммы клиента
+ #@param [in] data Данные пакета
+ #@param [in] addr Адрес клиента
+    def datagram_received(self, data, addr):
+        self.handle_query(addr, data)
+
+ ##@brief Обслуживание TCP-соединения: запросы с префиксом длины читаются подряд,
+ # а пересылаемые выполняются параллельно, поэтому ответы могут идти не по порядку запросов
+ #@param [in] reader asyncio.StreamReader соединения
+ #@param [in] writer asyncio.StreamWriter соединения
+    async def tcp_client(self, reader, writer):
+        if len(self.tcp_connections) >= self.tcp_max_connections:
+            writer.close()
+            return
+        self.tcp_connections[writer] = writer.get_extra_info('peername')
+        try:
+            while not self.should_stop:
+                prefix = await asyncio.wait_for(reader.readexactly(DNS_TCP_LENGTH.size), self.tcp_idle_timeout)
+                message = await asyncio.wait_for(reader.readexactly(DNS_TCP_LENGTH.unpack(prefix)[0]), self.tcp_idle_timeout)
+                try:
+                    self.handle_query(writer, message)
+                except Exception as e:
+                    self.drop_packet(e)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            del self.tcp_connections[writer]
+            writer.close()
+
+ ##@brief Обработка запроса клиента: ответ из зоны, из кэша или запуск пересылки
+ #@param [in] client Адрес UDP-клиента или asyncio.StreamWriter TCP-соединения
+ #@param [in] data Данные запроса
+    def handle_query(self, client, data):
+        if self.logger.sample_packet():
+            self.log_dns_server("Addr:%s\n Data %r", client if isinstance(client, tuple) else self.tcp_connections.get(client),
+                                bytes(data), level=LOG_DEBUG)
+        started = time.perf_counter_ns()
+        try:
+            request = PakageDnsWire(memoryview(data))
+        except ValueError as e:
+            self.stats.increment("malformed")
+            self.log_dns_server(f"Malformed DNS packet from {client}: {e}", level=LOG_WARNING)
+            return
+        self.parse_time.record(time.perf_counter_ns() - started)
+        self.stats.increment("query_udp" if isinstance(client, tuple) else "query_tcp")
+        if request.flags & FLAG_QR:
+            return
+        length_answer = self.answer_local(request)
+        if length_answer is None:
+            length_answer = self.answer_cached(request)
+        if length_answer is not None:
+            self.finish_answer(client, request, length_answer)
+        else:
+            asyncio.get_running_loop().create_task(self.forward(bytearray(data), request, client))
+
+ ##@brief Отправка ответа клиенту по UDP или в TCP-соединение с префиксом длины
+ #@param [in] client Адрес UDP-клиента или asyncio.StreamWriter TCP-соединения
+ #@param [in] view memoryview с ответом
+    def reply(self, client, view):
+        if isinstance(client, tuple):
+            self.transport.sendto(view, client)
+        elif not client.is_closing():
+            client.write(DNS_TCP_LENGTH.pack(len(view)) + view)
+
+ ##@brief Пересылка запроса вышестоящему серверу и ожидание ответа
+ #@param [in] packet Копия запроса клиента
+ #@param [in] request Разобранный запрос PakageDnsWire
+ #@param [in] addr Адрес UDP-клиента или asyncio.StreamWriter TCP-соединения
+    async def forward(self, packet, request, addr):
+        loop = asyncio.get_running_loop()
+        tried = ()
+        answer = None
+        while answer is None and len(tried) < self.upstream_attempts:
+            now = time.monotonic()
+            upstream = self.upstreams.choose(now, tried)
+            if upstream is None:
+                break
+            tried += (upstream,)
+            future = loop.create_future()
+            timeout = self.upstreams.attempt_timeout(upstream)
+            upstream_id = self.pending.allocate((future, upstream, request), now, timeout)
+            if upstream_id is None:
+                break
+            patch_dns_header(packet, upstream_id, request.flags | FLAG_RA)
+            self.stats.increment("forward" if len(tried) == 1 else "upstream_retry")
+            self.upstream_transport.sendto(packet, upstream.address)
+            try:
+                answer = await asyncio.wait_for(future, timeout)
+            except asyncio.CancelledError:
+                if not future.done():
+                    self.pending.release(upstream_id)
+                raise
+            except asyncio.TimeoutError:
+                self.pending.time_out(upstream_id)
+                self.upstreams.record_timeout(upstream, time.monotonic())
+                self.stats.increment("upstream_timeout")
+                self.log_dns_server(f"Upstream {upstream.address} timeout for {request.qname_text()} from {addr}",
+                                    level=LOG_WARNING)
+                continue
+            rtt = time.monotonic() - now
+            self.upstreams.record_success(upstream, rtt)
+            self.stats.increment("upstream_reply")
+            self.upstream_time.record(int(rtt * 1e9))
+        if answer is None:
+            self.finish_answer(addr, request, self.answer_servfail(request))
+            return
+        patch_dns_header(answer, request.id, struct.unpack_from('!H', answer, 2)[0] & ~FLAG_AA)
+        try:
+            parsed = PakageDnsWire(memoryview(answer))
+        except ValueError as e:
+            self.log_dns_server(f"Malformed upstream answer for {request.qname_text()}: {e}", level=LOG_WARNING)
+            self.reply(addr, memoryview(answer))
+            return
+        self.response_cache.put(parsed, time.monotonic())
+        self.relay_answer(addr, answer, parsed, packet)
+
+ ##@brief Обработка ответа вышестоящего сервера
+ # Ответ с чужим адресом, идентификатором или вопросом отбрасывается, и
+ # транзитный запрос продолжает ждать настоящий ответ.
+ #@param [in] data Данные пакета
+ #@param [in] addr Адрес отправителя
+    def upstream_received(self, data, addr):
+        try:
+            answer = PakageDnsWire(memoryview(data))
+        except ValueError as e:
+            self.log_dns_server(f"Malformed upstream answer from {addr}: {e}", level=LOG_WARNING)
+            return
+        transit = self.pending.get(answer.id)
+        if transit is None or transit[1].address != addr:
+            return
+        if not same_question(answer, transit[2]):
+            self.stats.increment("upstream_mismatch")
+            self.log_dns_server(f"DNS answer id {answer.id} from {addr} does not match the question, dropped", level=LOG_WARNING)
+            return
+        self.pending.release(answer.id)
+        future = transit[0]
+        if not future.done():
+            future.set_result(bytearray(data))
+
+##@class DnsResponseCache
+##@brief LRU-кэш ответов вышестоящего сервера с учетом TTL
+#
+# Ключ записи - (имя в wire-формате в нижнем регистре, QTYPE, QCLASS). Запись
+# живет минимальный TTL секции ответа; NXDOMAIN и NODATA кэшируются на
+# negative_ttl секунд. При выдаче из кэша TTL всех записей уменьшаются на время,
+# прошедшее с сохранения. При превышении max_entries или max_bytes вытесняются
+# самые давно использованные записи.
+class DnsResponseCache:
+ ##@brief Оценка накладных расходов на одну запись кэша в байтах
+    ENTRY_OVERHEAD = 200
+
+ #@param [in] max_entries Максимальное количество записей
+ #@param [in] max_bytes Максимальный суммарный размер записей в байтах
+ #@param [in] negative_ttl Время хранения NXDOMAIN/NODATA в секундах
+ #@param [in] max_ttl Верхняя граница времени хранения записи в секундах
+    def __init__(self, max_entries=10000, max_bytes=8 * 1024 * 1024, negative_ttl=60, max_ttl=86400):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.negative_ttl = negative_ttl
+        self.max_ttl = max_ttl
+        self.entries = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+ ##@brief Количество записей в кэше
+    def __len__(self):
+        return len(self.entries)
+
+ ##@brief Сохранение ответа вышестоящего сервера
+ #@param [in] answer Разобранный ответ PakageDnsWire
+ #@param [in] now Текущее монотонное время
+ #@return True, если ответ помещен в кэш
+    def put(self, answer, now):
+        if answer.QDCOUNT != 1 or answer.flags & FLAG_TC:
+            return False
+        rcode = answer.flags & RCODE_MASK
+        if rcode != 0 and rcode != RCODE_NXDOMAIN:
+            return False
+        try:
+            end, ttl_offsets, answer_ttl, arcount = scan_dns_records(answer)
+        except ValueError:
+            return False
+        if rcode == RCODE_NXDOMAIN or answer.ANCOUNT == 0:
+            ttl = self.negative_ttl
+        else:
+            ttl = min(answer_ttl, self.max_ttl)
+        if ttl <= 0:
+            return False
+        packet = bytearray(answer.view[:end])
+        struct.pack_into('!H', packet, 10, arcount)
+        key = (answer.qname_key(), answer.qtype, answer.qclass)
+        self.remove(key)
+        self.entries[key] = (now + ttl, now, bytes(packet), ttl_offsets)
+        self.size_bytes += len(packet) + self.ENTRY_OVERHEAD
+        while len(self.entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size_bytes -= len(evicted[2]) + self.ENTRY_OVERHEAD
+            self.evictions += 1
+        return True
+
+ ##@brief Выдача ответа из кэша в буфер с пересчетом TTL
+ #@param [in, out] out bytearray для ответа
+ #@param [in] request Разобранный запрос PakageDnsWire
+ #@param [in] now Текущее монотонное время
+ #@return Длина ответа в буфере или None при промахе
+    def get_into(self, out, request, now):
+        key = (request.qname_key(), request.qtype, request.qclass)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, stored_at, packet, ttl_offsets = entry
+        if now >= expires_at:
+            self.remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        elapsed = int(now - stored_at)
+        length = len(packet)
+        out[:length] = packet
+        if elapsed:
+            for offset, ttl in ttl_offsets:
+                struct.pack_into('!I', out, offset, max(ttl - elapsed, 0))
+        return length
+
+ ##@brief Удаление записи из кэша
+ #@param [in] key Ключ записи
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= len(entry[2]) + self.ENTRY_OVERHEAD
+
+ ##@brief Счетчики кэша
+ #@return Словарь со счетчиками попаданий, промахов и вытеснений
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+##@class PendingQueryTable
+##@brief Таблица транзитных запросов к вышестоящему серверу
+#
+# Свободные 16-битные идентификаторы хранятся в начале массива free_ids:
+# выделение берет случайный элемент из свободной части и меняет его местами с
+# последним свободным, возврат дописывает идентификатор в конец свободной
+# части, поэтому обе операции выполняются за O(1). Сроки ожидания хранятся в
+# двоичной куче; записи, освобожденные раньше срока, удаляются из кучи лениво.
+# При sweep = False кучу не ведет: сроки отслеживает вызывающий (time_out).
+class PendingQueryTable:
+ ##@brief Размер пространства идентификаторов DNS
+    ID_SPACE = 65536
+
+ #@param [in] timeout Срок ожидания ответа вышестоящего сервера в секундах
+    def __init__(self, timeout=2.0):
+        self.timeout = timeout
+        self.free_ids = array('H', range(self.ID_SPACE))
+        self.free_count = self.ID_SPACE
+        self.entries = {}
+        self.deadlines = []
+        self.sequence = 0
+        self.allocated = 0
+        self.timeouts = 0
+        self.exhausted = 0
+        self.sweep = True
+
+ ##@brief Количество ожидающих ответа запросов
+    def __len__(self):
+        return len(self.entries)
+
+ ##@brief Выделение случайного свободного идентификатора
+ #@param [in] value Данные транзитного запроса
+ #@param [in] now Текущее монотонное время
+ #@param [in] timeout Срок ожидания в секундах (по умолчанию self.timeout)
+ #@return Идентификатор или None, если все идентификаторы заняты
+    def allocate(self, value, now, timeout=None):
+        if not self.free_count:
+            self.exhausted += 1
+            return None
+        index = random.randrange(self.free_count)
+        last = self.free_count - 1
+        query_id = self.free_ids[index]
+        self.free_ids[index] = self.free_ids[last]
+        self.free_ids[last] = query_id
+        self.free_count = last
+        self.sequence += 1
+        deadline = now + (self.timeout if timeout is None else timeout)
+        self.entries[query_id] = (self.sequence, now, value)
+        if self.sweep:
+            heapq.heappush(self.deadlines, (deadline, self.sequence, query_id))
+        self.allocated += 1
+        return query_id
+
+ ##@brief Данные транзитного запроса без освобождения идентификатора
+ #@param [in] query_id Идентификатор
+ #@return Данные запроса или None, если идентификатор не был выделен
+    def get(self, query_id):
+        entry = self.entries.get(query_id)
+        return None if entry is None else entry[2]
+
+ ##@brief Освобождение идентификатора
+ #@param [in] query_id Идентификатор
+ #@return Данные запроса или None, если идентификатор не был выделен
+    def release(self, query_id):
+        entry = self.entries.pop(query_id, None)
+        if entry is None:
+            return None
+        self.free_ids[self.free_count] = query_id
+        self.free_count += 1
+        return entry[2]
+
+ ##@brief Освобождение идентификатора запроса, срок которого истек у вызывающего
+ #@param [in] query_id Идентификатор
+ #@return Данные запроса или None, если идентификатор уже освобожден
+    def time_out(self, query_id):
+        value = self.release(query_id)
+        if value is not None:
+            self.timeouts += 1
+        return value
+
+ ##@brief Освобождение запросов с истекшим сроком
+ #@param [in] now Текущее монотонное время
+ #@return Список пар (идентификатор, данные запроса)
+    def expire(self, now):
+        expired = []
+        deadlines = self.deadlines
+        while deadlines and deadlines[0][0] <= now:
+            _, sequence, query_id = heapq.heappop(deadlines)
+            entry = self.entries.get(query_id)
+            if entry is not None and entry[0] == sequence:
+                expired.append((query_id, self.release(query_id)))
+        self.timeouts += len(expired)
+        if len(deadlines) > 4 * len(self.entries) + 1024:
+            self.deadlines = [item for item in deadlines if self.entries.get(item[2], (None,))[0] == item[1]]
+            heapq.heapify(self.deadlines)
+        return expired
+
+ ##@brief Возраст самого старого ожидающего запроса
+ #@param [in] now Текущее монотонное время
+ #@return Возраст в секундах (0.0, если ожидающих запросов нет)
+    def oldest_age(self, now):
+        if not self.entries:
+            return 0.0
+        return now - min(started for _, started, _ in self.entries.values())
+
+ ##@brief Метрики таблицы транзитных запросов
+ #@param [in] now Текущее монотонное время
+ #@return Словарь с количеством ожидающих запросов, возрастом самого старого и счетчиками
+    def stats(self, now):
+        return {
+            "outstanding": len(self.entries),
+            "oldest_age": round(self.oldest_age(now), 3),
+            "allocated": self.allocated,
+            "timeouts": self.timeouts,
+            "exhausted": self.exhausted
+        }
+
+##@class UpstreamState
+##@brief Состояние одного вышестоящего DNS-сервера
+class UpstreamState:
+    __slots__ = ('address', 'srtt', 'rttvar', 'failures', 'down_until', 'backoff', 'probe_until',
+                 'answered', 'timeouts')
+
+ #@param [in] address Адрес (host, port)
+ #@param [in] backoff Начальная длительность исключения из выбора в секундах
+    def __init__(self, address, backoff):
+        self.address = address
+        self.srtt = None
+        self.rttvar = 0.0
+        self.failures = 0
+        self.down_until = 0.0
+        self.backoff = backoff
+        self.probe_until = 0.0
+        self.answered = 0
+        self.timeouts = 0
+
+##@class UpstreamSelector
+##@brief Выбор вышестоящего DNS-сервера по сглаженному времени ответа
+#
+# Для каждого сервера ведутся SRTT и RTTVAR (EWMA по RFC 6298); запрос уходит
+# серверу с наименьшим SRTT, серверы без замеров опрашиваются первыми. Таймаут
+# засчитывается как замер, равный сроку ожидания, поэтому медленный или теряющий
+# пакеты сервер постепенно уступает место остальным. После down_after таймаутов
+# подряд сервер исключается из выбора на backoff секунд (каждый следующий раз
+# вдвое дольше, до max_backoff), затем получает один пробный запрос.
+class UpstreamSelector:
+ ##@brief Вес нового замера в SRTT
+    ALPHA = 0.125
+ ##@brief Вес нового отклонения в RTTVAR
+    BETA = 0.25
+ ##@brief Минимальный срок ожидания одной попытки в секундах
+    MIN_TIMEOUT = 0.05
+
+ #@param [in] addresses Список адресов (host, port)
+ #@param [in] timeout Максимальный срок ожидания одной попытки в секундах
+ #@param [in] down_after Количество таймаутов подряд, после которого сервер исключается из выбора
+ #@param [in] backoff Начальная длительность исключения в секундах
+ #@param [in] max_backoff Максимальная длительность исключения в секундах
+    def __init__(self, addresses, timeout=2.0, down_after=3, backoff=1.0, max_backoff=60.0):
+        if not addresses:
+            raise ValueError("at least one upstream resolver is required")
+        self.timeout = timeout
+        self.down_after = down_after
+        self.initial_backoff = backoff
+        self.max_backoff = max_backoff
+        self.upstreams = [UpstreamState(tuple(address), backoff) for address in addresses]
+
+ ##@brief Выбор вышестоящего сервера
+ #@param [in] now Текущее монотонное время
+ #@param [in] exclude Серверы, которым запрос уже отправлялся
+ #@return UpstreamState или None, если все серверы исключены
+    def choose(self, now, exclude=()):
+        best = None
+        fallback = None
+        for upstream in self.upstreams:
+            if upstream in exclude:
+                continue
+            if upstream.down_until > now:
+                if fallback is None or upstream.down_until < fallback.down_until:
+                    fallback = upstream
+                continue
+            if upstream.failures >= self.down_after:
+                if upstream.probe_until > now:
+                    continue
+                upstream.probe_until = now + self.attempt_timeout(upstream)
+                return upstream
+            if best is None or (upstream.srtt or 0.0) < (best.srtt or 0.0):
+                best = upstream
+        return best if best is not None else fallback
+
+ ##@brief Срок ожидания ответа сервера: SRTT + 4 * RTTVAR в пределах [MIN_TIMEOUT, timeout]
+ #@param [in] upstream UpstreamState
+ #@return Срок в секундах
+    def attempt_timeout(self, upstream):
+        if upstream.srtt is None:
+            return self.timeout
+        return min(self.timeout, max(self.MIN_TIMEOUT, upstream.srtt + 4 * upstream.rttvar))
+
+ ##@brief Учет замера времени ответа
+ #@param [in] upstream UpstreamState
+ #@param [in] rtt Время ответа в секундах
+    def update_rtt(self, upstream, rtt):
+        if upstream.srtt is None:
+            upstream.srtt = rtt
+            upstream.rttvar = rtt / 2
+        else:
+            upstream.rttvar += self.BETA * (abs(upstream.srtt - rtt) - upstream.rttvar)
+            upstream.srtt += self.ALPHA * (rtt - upstream.srtt)
+
+ ##@brief Учет полученного ответа
+ #@param [in] upstream UpstreamState
+ #@param [in] rtt Время ответа в секундах
+    def record_success(self, upstream, rtt):
+        self.update_rtt(upstream, rtt)
+        upstream.answered += 1
+        upstream.failures = 0
+        upstream.down_until = 0.0
+        upstream.backoff = self.initial_backoff
+        upstream.probe_until = 0.0
+
+ ##@brief Учет запроса, оставшегося без ответа
+ #@param [in] upstream UpstreamState
+ #@param [in] now Текущее монотонное время
+    def record_timeout(self, upstream, now):
+        self.update_rtt(upstream, self.attempt_timeout(upstream))
+        upstream.timeouts += 1
+        self.record_failure(upstream, now)
+
+ ##@brief Учет отказа сервера; после down_after отказов подряд сервер исключается из выбора
+ # Отказы запросов, отправленных до исключения, срок исключения не продлевают.
+ #@param [in] upstream UpstreamState
+ #@param [in] now Текущее монотонное время
+    def record_failure(self, upstream, now):
+        upstream.failures += 1
+        upstream.probe_until = 0.0
+        if upstream.failures >= self.down_after and upstream.down_until <= now:
+            upstream.down_until = now + upstream.backoff
+            upstream.backoff = min(upstream.backoff * 2, self.max_backoff)
+
+ ##@brief Метрики вышестоящих серверов
+ #@return Список словарей с адресом, SRTT в миллисекундах, состоянием и счетчиками
+    def stats(self):
+        now = time.monotonic()
+        return [{
+            "address": f"{upstream.address[0]}:{upstream.address[1]}",
+            "srtt_ms": None if upstream.srtt is None else round(upstream.srtt * 1000, 2),
+            "down": upstream.down_until > now,
+            "answered": upstream.answered,
+            "timeouts": upstream.timeouts
+        } for upstream in self.upstreams]
+
+##@class DnsTcpConnection
+##@brief TCP-соединение клиента блокирующего DNSServer
+#
+# Сообщения в потоке предваряются двухбайтной длиной (RFC 1035, 4.2.2). Клиент
+# может отправлять несколько запросов подряд, не дожидаясь ответов; ответы
+# копятся в outbox и отправляются по мере готовности сокета к записи.
+class DnsTcpConnection:
+    __slots__ = ('socket', 'address', 'inbox', 'outbox', 'last_active', 'closed')
+
+ #@param [in] client_socket Неблокирующий сокет соединения
+ #@param [in] address Адрес клиента
+ #@param [in] now Текущее монотонное время
+    def __init__(self, client_socket, address, now):
+        self.socket = client_socket
+        self.address = address
+        self.inbox = bytearray()
+        self.outbox = bytearray()
+        self.last_active = now
+        self.closed = False
+
+    def __repr__(self):
+        return f"tcp:{self.address}"
+
+ ##@brief Чтение данных из сокета
+ #@param [in] now Текущее монотонное время
+ #@return Список запросов, полученных целиком
+    def receive(self, now):
+        try:
+            data = self.socket.recv(DNS_BUFFER_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return []
+        except OSError:
+            data = b''
+        if not data:
+            self.closed = True
+            return []
+        self.last_active = now
+        self.inbox += data
+        messages = []
+        offset = 0
+        while len(self.inbox) - offset >= DNS_TCP_LENGTH.size:
+            end = offset + DNS_TCP_LENGTH.size + DNS_TCP_LENGTH.unpack_from(self.inbox, offset)[0]
+            if end > len(self.inbox):
+                break
+            messages.append(bytes(self.inbox[offset + DNS_TCP_LENGTH.size:end]))
+            offset = end
+        del self.inbox[:offset]
+        return messages
+
+ ##@brief Постановка ответа в очередь отправки
+ #@param [in] view Ответ
+    def send(self, view):
+        if self.closed:
+            return
+        self.outbox += DNS_TCP_LENGTH.pack(len(view))
+        self.outbox += view
+        if len(self.outbox) > DNS_TCP_OUTBOX_LIMIT:
+            self.closed = True
+            return
+        self.flush()
+
+ ##@brief Отправка накопленных ответов, сколько примет сокет
+    def flush(self):
+        try:
+            sent = self.socket.send(self.outbox)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self.closed = True
+            return
+        del self.outbox[:sent]
+
+ ##@brief Закрытие соединения
+    def close(self):
+        self.closed = True
+        self.socket.close()
+
+##@class DnsServerProtocol
+##@brief Протокол asyncio для сокета, принимающего запросы клиентов
+class DnsServerProtocol(asyncio.DatagramProtocol):
+ #@param [in] server Экземпляр AsyncDNSServer
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        try:
+            self.server.datagram_received(data, addr)
+        except Exception as e:
+            self.server.drop_packet(e)
+
+    def error_received(self, exc):
+        self.server.log_dns_server(f"Socket error: {exc}", level=LOG_WARNING)
+
+##@class DnsUpstreamProtocol
+##@brief Протокол asyncio для сокета обмена с вышестоящим сервером
+class DnsUpstreamProtocol(asyncio.DatagramProtocol):
+ #@param [in] server Экземпляр AsyncDNSServer
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        try:
+            self.server.upstream_received(data, addr)
+        except Exception as e:
+            self.server.drop_packet(e)
+
+    def error_received(self, exc):
+        self.server.log_dns_server(f"Upstream socket error: {exc}", level=LOG_WARNING)
+
+##@class PakageDnsWire
+##@brief Разбор DNS-пакета напрямую из буфера приема без промежуточных строк
+#
+# Заголовок, флаги и секция вопроса читаются через struct и битовые операции
+# из memoryview над буфером приема. Сам пакет не копируется: объект хранит
+# только смещения секций и значения полей заголовка.
+class PakageDnsWire:
+    __slots__ = ('view', 'length', 'id', 'flags', 'QDCOUNT', 'ANCOUNT', 'NSCOUNT', 'ARCOUNT',
+                 'qname_end', 'qtype', 'qclass', 'question_end')
+
+ ##@brief Инициализация разбора DNS-пакета
+ #@param [in] view memoryview (или bytes) с данными пакета
+ #@param [in] length Длина пакета в буфере (по умолчанию весь буфер)
+ #@exception ValueError Пакет короче заголовка или секция вопроса повреждена
+    def __init__(self, view, length=None):
+        if length is None:
+            length = len(view)
+        if length < DNS_HEADER_SIZE:
+            raise ValueError("DNS packet is shorter than the header")
+        self.view = view
+        self.length = length
+        (self.id, self.flags, self.QDCOUNT, self.ANCOUNT,
+         self.NSCOUNT, self.ARCOUNT) = DNS_HEADER.unpack_from(view, 0)
+        offset = DNS_HEADER_SIZE
+        if self.QDCOUNT:
+            while True:
+                if offset >= length:
+                    raise ValueError("QNAME runs past the end of the packet")
+                label = view[offset]
+                if label == 0:
+                    offset += 1
+                    break
+                if label & 0xC0:
+                    raise ValueError("compressed QNAME in the question section")
+                offset += label + 1
+            if offset + DNS_QUESTION_TAIL.size > length:
+                raise ValueError("question section is truncated")
+            self.qname_end = offset
+            self.qtype, self.qclass = DNS_QUESTION_TAIL.unpack_from(view, offset)
+            self.question_end = offset + DNS_QUESTION_TAIL.size
+        else:
+            self.qname_end = offset
+            self.qtype = self.qclass = 0
+            self.question_end = offset
+
+ ##@brief Имя из секции вопроса в wire-формате
+ #@return Байтовая строка с метками имени, включая завершающий ноль
+    def qname_wire(self):
+        return bytes(self.view[DNS_HEADER_SIZE:self.qname_end])
+
+ ##@brief Ключ поиска в зоне: имя из секции вопроса в wire-формате в нижнем регистре
+ #@return Байтовая строка с метками имени, включая завершающий ноль
+    def qname_key(self):
+        return bytes(self.view[DNS_HEADER_SIZE:self.qname_end]).lower()
+
+ ##@brief Имя из секции вопроса в виде строки
+ #@return Доменное имя, например "my_site_diplom.com"
+    def qname_text(self):
+        labels = []
+        offset = DNS_HEADER_SIZE
+        end = self.qname_end - 1
+        while offset < end:
+            label = self.view[offset]
+            labels.append(bytes(self.view[offset + 1:offset + 1 + label]).decode('ascii', 'replace'))
+            offset += label + 1
+        return '.'.join(labels)
+
+ ##@brief Размер UDP-ответа, объявленный клиентом в записи OPT (EDNS0)
+ #@return Размер в байтах (не меньше 512) или None, если в запросе нет записи OPT
+    def edns_payload(self):
+        if not self.ARCOUNT:
+            return None
+        view = self.view
+        length = self.length
+        offset = self.question_end
+        try:
+            for _ in range(self.ANCOUNT + self.NSCOUNT + self.ARCOUNT):
+                offset = skip_dns_name(view, offset, length)
+                if offset + DNS_RR_FIXED.size > length:
+                    return None
+                rtype, payload, _, rdlength = DNS_RR_FIXED.unpack_from(view, offset)
+                if rtype == QTYPE_OPT:
+                    return max(DNS_UDP_PAYLOAD, payload)
+                offset += DNS_RR_FIXED.size + rdlength
+        except ValueError:
+            return None
+        return None
+
+ ##@brief Код операции (Opcode) из поля флагов
+    @property
+    def opcode(self):
+        return (self.flags & OPCODE_MASK) >> 11
+
+ ##@brief Код ответа (RCODE) из поля флагов
+    @property
+    def rcode(self):
+        return self.flags & RCODE_MASK
+
+##@brief Сборка ответа в заранее выделенный буфер
+# В буфер записываются заголовок, секция вопроса из запроса и готовые ресурсные записи.
+#@param [in, out] out bytearray для ответа (достаточного размера)
+#@param [in] request Разобранный запрос PakageDnsWire
+#@param [in] flags Поле флагов ответа
+#@param [in] answers Ресурсные записи секции ответа в wire-формате
+#@param [in] ancount Количество ресурсных записей в answers
+#@return Длина ответа в буфере
+def build_dns_response(out, request, flags, answers, ancount):
+    question_end = request.question_end
+    DNS_HEADER.pack_into(out, 0, request.id, flags, 1 if request.QDCOUNT else 0, ancount, 0, 0)
+    out[DNS_HEADER_SIZE:question_end] = request.view[DNS_HEADER_SIZE:question_end]
+    end = question_end + len(answers)
+    out[question_end:end] = answers
+    return end
+
+##@brief Добавление записи OPT сервера в конец ответа
+#@param [in, out] buffer bytearray с ответом
+#@param [in] length Длина ответа в буфере
+#@return Новая длина ответа
+def append_opt_record(buffer, length):
+    end = length + len(DNS_OPT_RECORD)
+    buffer[length:end] = DNS_OPT_RECORD
+    struct.pack_into('!H', buffer, 10, struct.unpack_from('!H', buffer, 10)[0] + 1)
+    return end
+
+##@brief Усечение ответа до заголовка и секции вопроса с установкой флага TC
+#@param [in, out] buffer bytearray с ответом
+#@param [in] packet Разобранный запрос или ответ PakageDnsWire с той же секцией вопроса
+#@param [in] edns Добавить ли запись OPT сервера
+#@return Длина усеченного ответа
+def truncate_dns_response(buffer, packet, edns):
+    flags = struct.unpack_from('!H', buffer, 2)[0] | FLAG_TC
+    struct.pack_into('!5H', buffer, 2, flags, 1 if packet.QDCOUNT else 0, 0, 0, 0)
+    if edns:
+        return append_opt_record(buffer, packet.question_end)
+    return packet.question_end
+
+##@brief Пропуск доменного имени (с учетом сжатия) в ресурсной записи
+#@param [in] view Данные пакета
+#@param [in] offset Смещение начала имени
+#@param [in] length Длина пакета
+#@return Смещение первого байта после имени
+#@exception ValueError Имя выходит за границы пакета
+def skip_dns_name(view, offset, length):
+    while offset < length:
+        label = view[offset]
+        if label == 0:
+            return offset + 1
+        if label & 0xC0 == 0xC0:
+            return offset + 2
+        if label & 0xC0:
+            raise ValueError("unsupported label type")
+        offset += label + 1
+    raise ValueError("name runs past the end of the packet")
+
+##@brief Обход ресурсных записей ответа после секции вопроса
+# Запись OPT (EDNS0) относится к конкретному обмену и отбрасывается, если стоит последней.
+#@param [in] packet Разобранный ответ PakageDnsWire
+#@return Кортеж (конец данных без OPT, [(смещение TTL, TTL)], минимальный TTL секции ответа, ARCOUNT без OPT)
+#@exception ValueError Ответ поврежден или OPT стоит не последней записью
+def scan_dns_records(packet):
+    view = packet.view
+    length = packet.length
+    offset = packet.question_end
+    ttl_offsets = []
+    answer_ttl = None
+    arcount = packet.ARCOUNT
+    total = packet.ANCOUNT + packet.NSCOUNT + packet.ARCOUNT
+    for number in range(total):
+        start = offset
+        offset = skip_dns_name(view, offset, length)
+        if offset + DNS_RR_FIXED.size > length:
+            raise ValueError("resource record is truncated")
+        rtype, _, ttl, rdlength = DNS_RR_FIXED.unpack_from(view, offset)
+        if rtype == QTYPE_OPT:
+            if number != total - 1:
+                raise ValueError("OPT record is not the last record")
+            return start, ttl_offsets, answer_ttl or 0, arcount - 1
+        ttl_offsets.append((offset + 4, ttl))
+        if number < packet.ANCOUNT:
+            answer_ttl = ttl if answer_ttl is None else min(answer_ttl, ttl)
+        offset += DNS_RR_FIXED.size + rdlength
+        if offset > length:
+            raise ValueError("RDATA runs past the end of the packet")
+    return offset, ttl_offsets, answer_ttl or 0, arcount
+
+##@brief Проверка, что ответ повторяет вопрос запроса: имя (без учета регистра), QTYPE и QCLASS
+# Идентификатор из 16 бит легко подобрать, поэтому ответ с чужим вопросом не
+# кэшируется и не пересылается клиенту.
+#@param [in] answer Разобранный ответ PakageDnsWire
+#@param [in] query Разобранный запрос PakageDnsWire
+#@return True, если секции вопроса совпадают
+def same_question(answer, query):
+    return (answer.QDCOUNT == query.QDCOUNT and answer.qtype == query.qtype and answer.qclass == query.qclass
+            and answer.qname_key() == query.qname_key())
+
+##@brief Замена идентификатора и флагов в заголовке пакета на месте
+#@param [in, out] buffer bytearray с пакетом
+#@param [in] packet_id Новый идентификатор
+#@param [in] flags Новое поле флагов
+def patch_dns_header(buffer, packet_id, flags):
+    struct.pack_into('!HH', buffer, 0, packet_id, flags & 0xFFFF)
+
 ##@class PakageDns
+##@brief Устаревший кодек DNS-пакета на шестнадцатеричных строках
+# Сервер использует PakageDnsWire, класс оставлен для сравнения в dns_benchmark.py.
 class PakageDns:
  ##@brief Инициализация DNS-пакета, разбирает его заголовок и основную часть
  #@param [in] package Данные DNS-запроса в шестнадцатеричном виде
@@ -248,16 +1558,13 @@ class PakageDns:
 ##@brief Чтение данных из JSON файла
 #@param [in] file_name Имя файла
 #@return Данные из файла или None в случае ошибки
+# (ошибку записывает в лог вызывающий: у функции нет экземпляра сервера)
 def read_json_file(file_name):
     try:
         with open(file_name, 'r', encoding='utf-8') as file:
             data = json.load(file)
         return data
-    except FileNotFoundError:
-        DNSServer.log_dns_server(f"File '{file_name}' no")
-        return None
-    except json.JSONDecodeError:
-        DNSServer.log_dns_server(f"Error JSON file'{file_name}'.")
+    except (OSError, ValueError):
         return None
 ##@brief Запись данных в JSON файл
 #@param [in] data Данные для записи
@@ -273,6 +1580,93 @@ def write_to_json_file(data, file_path):
         return False
 
 
+##@brief Запуск нескольких процессов DNS-сервера на одном порту (SO_REUSEPORT)
+# Зона компилируется один раз в родительском процессе и достается рабочим
+# процессам через fork (copy-on-write); объекты зоны замораживаются gc.freeze(),
+# чтобы сборщик мусора не копировал их страницы. Каждый рабочий процесс
+# пересылает промахи через собственный сокет, поэтому ответы вышестоящего
+# сервера возвращаются в процесс, отправивший запрос. Точка метрик рабочего
+# процесса N слушает DNS_STATS_ADDRESS со сдвигом N (см. worker_stats_address).
+# Имена клиентов DHCP (DNS_UPDATE_SOCKET) в этом режиме не регистрируются:
+# событие из Unix-сокета получил бы только один из процессов.
+#@param [in] workers Количество рабочих процессов
+#@param [in] server_class Класс сервера (DNSServer или AsyncDNSServer)
+#@param [in] domain_ip Файл с маппингом доменов и IP-адресов
+#@param [in] zone_index Вид индекса зоны (по умолчанию DNS_ZONE_INDEX из конфигурации)
+#@param [in] server_kwargs Остальные параметры конструктора сервера
+def run_workers(workers, server_class=None, domain_ip="domain_dns_name_ip.json", zone_index=None, **server_kwargs):
+    server_class = server_class or DNSServer
+    configuration = read_json_file(server_kwargs.get('name_configuration', "configuration.json")) or {}
+    zone_file, zone_index = zone_source(configuration, domain_ip, zone_index)
+    zone = load_zone(zone_file, zone_index)
+    gc.freeze()
+    children = []
+    for number in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                server_class(domain_ip=domain_ip, zone=zone, reuse_port=True, zone_index=zone_index,
+                             stats_address=worker_stats_address(configuration.get('DNS_STATS_ADDRESS', ''), number),
+                             update_socket='', **server_kwargs).start()
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    def stop_workers(sig, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGINT)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop_workers)
+    signal.signal(signal.SIGTERM, stop_workers)
+    for pid in children:
+        os.waitpid(pid, 0)
+
+##@brief Выбор файла и вида индекса зоны
+#
+# Для индекса "snapshot" зона читается из двоичного снимка DNS_ZONE_SNAPSHOT
+# (см. dns_zone.compile_zone_snapshot), иначе из JSON-файла domain_ip, который
+# создается пустым при отсутствии.
+#@param [in] configuration Словарь конфигурации
+#@param [in] domain_ip Файл с маппингом доменов и IP-адресов
+#@param [in] zone_index Вид индекса зоны (по умолчанию DNS_ZONE_INDEX из конфигурации)
+#@return Кортеж (файл зоны, вид индекса)
+def zone_source(configuration, domain_ip, zone_index=None):
+    zone_index = zone_index or configuration.get('DNS_ZONE_INDEX', 'dict')
+    if zone_index == "snapshot":
+        return configuration.get('DNS_ZONE_SNAPSHOT', "domain_dns_name_ip.bin"), zone_index
+    if not os.path.exists(domain_ip):
+        write_to_json_file({}, domain_ip)
+    return domain_ip, zone_index
+
+##@brief Разбор адреса вида "host:port"
+#@param [in] value Строка адреса
+#@return Кортеж (host, port)
+def parse_address(value):
+    host, _, port = value.rpartition(':')
+    if not host:
+        return (port, 53)
+    return (host, int(port))
+
+
 if __name__ == "__main__":
-    server_default = DNSServer(name_configuration="configuration.json")
-    server_default.start()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="DNS server")
+    parser.add_argument("--port", type=int, default=53)
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run the asyncio server (AsyncDNSServer)")
+    parser.add_argument("--upstream", dest="upstreams", type=parse_address, action="append", default=None,
+                        help="upstream resolver as host[:port]; repeat for several (default DNS_UPSTREAMS)")
+    parser.add_argument("--workers", type=int, default=1, help="number of SO_REUSEPORT worker processes")
+    parser.add_argument("--zone-index", choices=("dict", "compact", "snapshot"), default=None,
+                        help="zone index: pre-encoded dict, compact sorted index for very large zones "
+                             "or mmap'ed binary snapshot (see 'python3 dns_zone.py compile')")
+    args = parser.parse_args()
+    server_class = AsyncDNSServer if args.use_async else DNSServer
+    if args.workers > 1:
+        run_workers(args.workers, server_class, zone_index=args.zone_index, port=args.port,
+                    name_configuration="configuration.json", upstreams=args.upstreams)
+    else:
+        server_default = server_class(port=args.port, name_configuration="configuration.json", upstreams=args.upstreams,
+                                      zone_index=args.zone_index)
+        server_default.start()
\ No newline at end of file
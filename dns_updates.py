@@ -0,0 +1,177 @@
+##@file dns_updates.py
+##@brief Канал динамической регистрации имен клиентов DHCP в зоне DNS-сервера.
+#
+# DHCP-сервер публикует события аренд (адрес выдан клиенту с именем из опции
+# 12 Host Name, адрес освобожден) датаграммами в Unix-сокет DNS_UPDATE_SOCKET,
+# который слушает DNS-сервер. События одного адреса внутри пачки схлопываются:
+# отправляется только последнее состояние. Датаграмма - заголовок UPDATE_HEADER
+# и записи UPDATE_RECORD, за каждой из которых следует имя узла (длина 0 -
+# адрес освобожден). Отправка не блокирует сервер: если DNS-сервер не запущен
+# или его очередь переполнена, события отбрасываются и учитываются в dropped.
+
+import os
+##@package os
+#Модуль для работы с файловой системой (файл Unix-сокета).
+
+import socket
+##@package socket
+#Модуль для работы с сетевыми сокетами (Unix-сокет датаграмм).
+
+import struct
+##@package struct
+#Модуль для сборки бинарных структур (записи событий).
+
+import time
+##@package time
+#Модуль для отметки времени отправки пачки (задержка применения событий).
+
+
+##@brief Заголовок датаграммы событий: версия формата, время отправки в наносекундах Unix
+UPDATE_HEADER = struct.Struct('!BQ')
+##@brief Версия формата датаграммы событий
+UPDATE_VERSION = 1
+##@brief Запись события: адрес IPv4, длина имени узла (0 - адрес освобожден)
+UPDATE_RECORD = struct.Struct('!4sB')
+##@brief Предельный размер датаграммы событий; большие пачки делятся на несколько датаграмм
+UPDATE_DATAGRAM_SIZE = 8192
+##@brief Допустимые символы метки имени узла (RFC 952, RFC 1123)
+HOSTNAME_CHARS = frozenset(b'abcdefghijklmnopqrstuvwxyz0123456789-')
+
+
+##@brief Имя узла из опции 12 Host Name
+# Берется первая метка (клиент может прислать полное имя), в нижнем регистре,
+# без завершающих нулевых байтов.
+#@param [in] value Значение опции 12 (bytes) или None
+#@return Метка имени узла (bytes) или None, если опции нет или имя недопустимо
+def hostname_label(value):
+    if not value:
+        return None
+    label = value.rstrip(b'\x00').split(b'.', 1)[0].lower()
+    if not 0 < len(label) < 64 or label[0] == 0x2D or label[-1] == 0x2D or not HOSTNAME_CHARS.issuperset(label):
+        return None
+    return label
+
+##@brief Кодирование событий в датаграммы
+#@param [in] events Словарь адрес (целое число) -> метка имени узла (bytes) или None (адрес освобожден)
+#@param [in] sent_ns Время отправки в наносекундах Unix (по умолчанию текущее)
+#@return Список датаграмм (bytes), каждая не длиннее UPDATE_DATAGRAM_SIZE
+def encode_updates(events, sent_ns=None):
+    header = UPDATE_HEADER.pack(UPDATE_VERSION, time.time_ns() if sent_ns is None else sent_ns)
+    datagrams = []
+    datagram = bytearray(header)
+    for address, label in events.items():
+        label = label or b''
+        if len(datagram) + UPDATE_RECORD.size + len(label) > UPDATE_DATAGRAM_SIZE:
+            datagrams.append(bytes(datagram))
+            datagram = bytearray(header)
+        datagram += UPDATE_RECORD.pack(address.to_bytes(4, 'big'), len(label))
+        datagram += label
+    if len(datagram) > len(header):
+        datagrams.append(bytes(datagram))
+    return datagrams
+
+##@brief Разбор датаграммы событий
+#@param [in] data Датаграмма (bytes)
+#@return Кортеж (время отправки в наносекундах Unix, список пар (адрес в 4 байтах, метка имени или None))
+#@exception ValueError Датаграмма повреждена или имеет неизвестную версию
+def decode_updates(data):
+    if len(data) < UPDATE_HEADER.size:
+        raise ValueError("update datagram is shorter than the header")
+    version, sent_ns = UPDATE_HEADER.unpack_from(data, 0)
+    if version != UPDATE_VERSION:
+        raise ValueError(f"unknown update datagram version {version}")
+    events = []
+    offset = UPDATE_HEADER.size
+    while offset < len(data):
+        if offset + UPDATE_RECORD.size > len(data):
+            raise ValueError("update record is truncated")
+        address, length = UPDATE_RECORD.unpack_from(data, offset)
+        offset += UPDATE_RECORD.size
+        if offset + length > len(data):
+            raise ValueError("host name runs past the end of the datagram")
+        events.append((address, bytes(data[offset:offset + length]) if length else None))
+        offset += length
+    return sent_ns, events
+
+##@brief Открытие Unix-сокета приема событий на стороне DNS-сервера
+# Файл сокета, оставшийся от прошлого запуска, удаляется.
+#@param [in] path Путь к Unix-сокету
+#@return Неблокирующий привязанный сокет
+def open_update_socket(path):
+    if os.path.exists(path):
+        os.remove(path)
+    update_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    update_socket.bind(path)
+    update_socket.setblocking(False)
+    return update_socket
+
+
+##@class DnsUpdatePublisher
+##@brief Отправитель событий аренд DHCP-сервера в Unix-сокет DNS-сервера
+# События накапливаются до сохранения аренд пачки и отправляются вместе с
+# ним (см. DHCPServer.commit_leases), поэтому к моменту отправки ACK имя уже
+# передано DNS-серверу.
+class DnsUpdatePublisher:
+ ##@brief Инициализация отправителя
+ #@param [in] path Путь к Unix-сокету DNS-сервера (пустая строка - публикация отключена)
+    def __init__(self, path):
+        self.path = path
+        self.pending = {}
+        self.sent = 0
+        self.dropped = 0
+        self.socket = None
+        if path:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.socket.setblocking(False)
+
+ ##@brief Количество событий, ожидающих отправки
+    def __len__(self):
+        return len(self.pending)
+
+ ##@brief Событие "адрес выдан клиенту"; без допустимого имени узла событие не публикуется
+ #@param [in] address Адрес (целое число)
+ #@param [in] hostname Значение опции 12 Host Name (bytes) или None
+    def add(self, address, hostname):
+        if self.socket is None:
+            return
+        label = hostname_label(hostname)
+        if label is not None:
+            self.pending[address] = label
+
+ ##@brief Событие "адрес освобожден" (освобождение, отклонение, окончание аренды)
+ #@param [in] address Адрес (целое число)
+    def remove(self, address):
+        if self.socket is not None:
+            self.pending[address] = None
+
+ ##@brief Отделение накопленных событий для отправки
+ #@return Словарь адрес -> метка имени узла или None
+    def detach(self):
+        events, self.pending = self.pending, {}
+        return events
+
+ ##@brief Отправка событий без ожидания; при ошибке события отбрасываются
+ #@param [in] events Словарь событий (результат detach)
+ #@return Количество отправленных событий
+    def send(self, events):
+        if not events:
+            return 0
+        try:
+            for datagram in encode_updates(events):
+                self.socket.sendto(datagram, self.path)
+        except OSError:
+            self.dropped += len(events)
+            return 0
+        self.sent += len(events)
+        return len(events)
+
+ ##@brief Отправка всех накопленных событий
+ #@return Количество отправленных событий
+    def flush(self):
+        return self.send(self.detach())
+
+ ##@brief Закрытие сокета отправителя
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
@@ -0,0 +1,660 @@
+##@file dns_zone.py
+##@brief Этот файл содержит скомпилированную зону DNS-сервера для ответов на локальные имена.
+#
+# Зона из domain_dns_name_ip.json компилируется при загрузке в словарь, ключом
+# которого являются байты имени в wire-формате (в нижнем регистре), а значением -
+# количество записей ANCOUNT и готовые ресурсные записи секции ответа.
+# Для очень больших зон есть компактный индекс CompactZoneIndex: отсортированный
+# массив упакованных имен с обратным порядком меток и IPv4-адресами по 4 байта.
+# Для мгновенного запуска зону можно заранее скомпилировать в двоичный снимок
+# (python3 dns_zone.py compile domain_dns_name_ip.json domain_dns_name_ip.bin),
+# который MappedZoneSnapshot отображает в память через mmap.
+# Имена клиентов DHCP хранятся отдельно от файла зоны в DynamicZone и
+# обновляются событиями аренд (см. dns_updates.py).
+
+import socket
+##@package socket
+#Модуль для работы с сетевыми сокетами (преобразование IPv4-адресов в байты).
+
+import json
+##@package json
+#Модуль для работы с JSON-файлами.
+
+import struct
+##@package struct
+#Модуль для сборки бинарных структур (ресурсные записи DNS).
+
+import sys
+##@package sys
+#Модуль для работы с системными функциями и параметрами (порядок байтов платформы).
+
+import os
+##@package os
+#Модуль для работы с файловой системой (время изменения файла зоны).
+
+import threading
+##@package threading
+#Модуль потоков (фоновое отслеживание изменений файла зоны).
+
+import time
+##@package time
+#Модуль для измерения длительности перезагрузки зоны.
+
+from array import array
+##@package array
+#Модуль компактных массивов чисел (смещения и TTL компактного индекса зоны).
+
+from bisect import bisect_right
+##@package bisect
+#Модуль двоичного поиска по отсортированным спискам (выборка ключей компактного индекса).
+
+import mmap
+##@package mmap
+#Модуль отображения файлов в память (двоичный снимок зоны).
+
+import zlib
+##@package zlib
+#Модуль со стандартной функцией crc32 (хеш-индекс снимка зоны).
+
+import argparse
+##@package argparse
+#Модуль для разбора аргументов командной строки (компилятор снимка зоны).
+
+
+##@brief Формат ресурсной записи A со ссылкой на имя из вопроса: NAME(C00C), TYPE, CLASS, TTL, RDLENGTH
+DNS_A_RECORD = struct.Struct('!HHHIH')
+##@brief Тип записи A
+QTYPE_A = 1
+##@brief Тип запроса ANY
+QTYPE_ANY = 255
+##@brief Метка wildcard-записи ("*.example.com")
+WILDCARD_LABEL = b'*'
+##@brief Размер блока чтения файла зоны при потоковом разборе
+ZONE_READ_CHUNK = 1 << 20
+##@brief Шаг выборки ключей компактного индекса (каждый N-й ключ хранится отдельным объектом)
+INDEX_SAMPLE_STEP = 32
+##@brief Заголовок снимка зоны: сигнатура, версия, флаги, число корзин, число записей
+SNAPSHOT_HEADER = struct.Struct('!4sHHII')
+##@brief Сигнатура файла снимка зоны
+SNAPSHOT_MAGIC = b'DNSZ'
+##@brief Версия формата снимка зоны
+SNAPSHOT_VERSION = 1
+##@brief Флаг снимка: в зоне есть wildcard-записи
+SNAPSHOT_HAS_WILDCARDS = 0x0001
+##@brief Корзина хеш-индекса снимка: смещение записи (0 - пустая корзина)
+SNAPSHOT_BUCKET = struct.Struct('!I')
+##@brief Заголовок записи снимка после имени: ANCOUNT, длина ресурсных записей
+SNAPSHOT_RECORD = struct.Struct('!HH')
+
+
+##@brief Кодирование доменного имени в wire-формат
+#@param [in] domain Доменное имя, например "my_site_diplom.com"
+#@return Байтовая строка с метками имени в нижнем регистре и завершающим нулем
+#@exception ValueError Имя содержит пустую метку или метку длиннее 63 байт
+def encode_domain_name(domain):
+    wire = bytearray()
+    for label in domain.rstrip('.').lower().split('.'):
+        label = label.encode('ascii')
+        if not 0 < len(label) < 64:
+            raise ValueError(f"invalid label in domain name '{domain}'")
+        wire.append(len(label))
+        wire += label
+    wire.append(0)
+    if len(wire) > 255:
+        raise ValueError(f"domain name '{domain}' is longer than 255 bytes")
+    return bytes(wire)
+
+##@brief Формирование ресурсных записей A для секции ответа
+#@param [in] site_array Запись домена из domain_dns_name_ip.json ({"TTL":..., "IP":[...]})
+#@return Байтовая строка с ресурсными записями в формате DNS
+#@exception ValueError TTL или IP-адрес записи некорректны
+def encode_a_records(site_array):
+    try:
+        ttl = int(site_array["TTL"])
+        if not 0 <= ttl < 2**31:
+            raise ValueError(f"TTL {ttl} is out of range")
+        return b''.join(DNS_A_RECORD.pack(0xC00C, 1, 1, ttl, 4) + socket.inet_aton(ip) for ip in site_array["IP"])
+    except (KeyError, TypeError, OSError) as e:
+        raise ValueError(f"invalid zone record {site_array!r}: {e}") from e
+
+##@brief Метки имени из wire-формата
+#@param [in] wire Имя в wire-формате
+#@return Список меток (bytes) в порядке следования в имени; для пустого и корневого имени - пустой список
+def wire_labels(wire):
+    labels = []
+    offset = 0
+    while offset < len(wire) and wire[offset]:
+        length = wire[offset]
+        labels.append(wire[offset + 1:offset + 1 + length])
+        offset += length + 1
+    return labels
+
+##@brief Кандидаты wildcard-записей для имени, от самого точного к общему
+# Для a.b.example.com это *.b.example.com, *.example.com, *.com.
+#@param [in] labels Метки имени
+#@return Генератор списков меток с WILDCARD_LABEL вместо первых меток
+def wildcard_candidates(labels):
+    for start in range(1, len(labels)):
+        yield [WILDCARD_LABEL] + labels[start:]
+
+##@brief Потоковый разбор файла зоны без построения словаря всех записей
+# Файл читается блоками по ZONE_READ_CHUNK, поэтому память разбора не зависит
+# от количества записей.
+#@param [in] file_name Имя файла зоны
+#@param [in] chunk_size Размер блока чтения
+#@return Генератор пар (домен, запись {"TTL":..., "IP":[...]})
+#@exception ValueError Файл не является JSON-объектом записей
+def iter_zone_file(file_name, chunk_size=ZONE_READ_CHUNK):
+    decoder = json.JSONDecoder()
+    with open(file_name, 'r', encoding='utf-8') as file:
+        state = {"buffer": '', "position": 0, "eof": False}
+
+        def fill():
+            chunk = file.read(chunk_size)
+            if not chunk:
+                state["eof"] = True
+                return False
+            state["buffer"] = state["buffer"][state["position"]:] + chunk
+            state["position"] = 0
+            return True
+
+        def next_char():
+            while True:
+                buffer, position = state["buffer"], state["position"]
+                while position < len(buffer) and buffer[position] in ' \t\r\n':
+                    position += 1
+                state["position"] = position
+                if position < len(buffer):
+                    return buffer[position]
+                if not fill():
+                    return ''
+
+        def expect(chars):
+            char = next_char()
+            if not char or char not in chars:
+                raise ValueError(f"Error JSON file '{file_name}': expected one of {chars!r}")
+            state["position"] += 1
+            return char
+
+        def decode():
+            next_char()
+            while True:
+                try:
+                    value, state["position"] = decoder.raw_decode(state["buffer"], state["position"])
+                    return value
+                except json.JSONDecodeError as e:
+                    if not fill():
+                        raise ValueError(f"Error JSON file '{file_name}': {e}") from e
+
+        expect('{')
+        if next_char() == '}':
+            state["position"] += 1
+        else:
+            while True:
+                domain = decode()
+                if not isinstance(domain, str):
+                    raise ValueError(f"Error JSON file '{file_name}': domain names must be strings")
+                expect(':')
+                yield domain, decode()
+                if expect(',}') == '}':
+                    break
+        if next_char():
+            raise ValueError(f"Error JSON file '{file_name}': extra data after the zone object")
+
+
+##@class DnsZone
+##@brief Скомпилированная зона: wire-имя -> (ANCOUNT, ресурсные записи)
+# Имена вида "*.example.com" работают как wildcard-записи: они отвечают на
+# любое имя внутри example.com, для которого нет более точной записи.
+class DnsZone:
+    __slots__ = ('records', 'has_wildcards')
+
+ ##@brief Инициализация зоны из готового словаря
+ #@param [in] records Словарь {wire-имя: (ancount, answers)}
+    def __init__(self, records):
+        self.records = records
+        self.has_wildcards = any(key[:2] == b'\x01' + WILDCARD_LABEL for key in records)
+
+ ##@brief Компиляция зоны из словаря формата domain_dns_name_ip.json
+ #@param [in] domain_ip Словарь {домен: {"TTL":..., "IP":[...]}}
+ #@return Объект DnsZone
+ #@exception ValueError Файл зоны имеет неверную структуру
+    @classmethod
+    def from_domain_ip(cls, domain_ip):
+        if not isinstance(domain_ip, dict):
+            raise ValueError("zone must be a JSON object of domain records")
+        records = {}
+        for domain, site_array in domain_ip.items():
+            answers = encode_a_records(site_array)
+            records[encode_domain_name(domain)] = (len(site_array["IP"]), answers)
+        return cls(records)
+
+ ##@brief Загрузка и компиляция зоны из JSON-файла
+ #@param [in] file_name Имя файла зоны
+ #@return Объект DnsZone
+ #@exception ValueError Файл зоны поврежден
+ #@exception OSError Файл зоны не удалось прочитать
+    @classmethod
+    def load(cls, file_name):
+        with open(file_name, 'r', encoding='utf-8') as file:
+            try:
+                domain_ip = json.load(file)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Error JSON file '{file_name}': {e}") from e
+        return cls.from_domain_ip(domain_ip)
+
+ ##@brief Количество доменов в зоне
+    def __len__(self):
+        return len(self.records)
+
+ ##@brief Поиск готового ответа по имени из вопроса
+ #@param [in] qname_key Имя в wire-формате в нижнем регистре
+ #@param [in] qtype Тип запроса
+ #@return Кортеж (ancount, answers) или None, если имя не принадлежит зоне
+    def lookup(self, qname_key, qtype=QTYPE_A):
+        entry = self.records.get(qname_key)
+        if entry is None and self.has_wildcards:
+            for labels in wildcard_candidates(wire_labels(qname_key)):
+                entry = self.records.get(b''.join(bytes([len(label)]) + label for label in labels) + b'\x00')
+                if entry is not None:
+                    break
+        if entry is None or qtype == QTYPE_A or qtype == QTYPE_ANY:
+            return entry
+        return (0, b'')  #Имя есть в зоне, но записей запрошенного типа нет (NODATA)
+
+
+##@class DynamicZone
+##@brief Зона имен клиентов DHCP, обновляемая событиями аренд без перезаписи файлов
+# Имя узла дополняется доменом DNS_DYNAMIC_DOMAIN. Адрес принадлежит одному
+# имени, у имени может быть несколько адресов (клиенты с одинаковым именем).
+# События пачки схлопываются по адресу, а ответ каждого измененного имени
+# собирается заново один раз на пачку.
+class DynamicZone:
+    __slots__ = ('suffix', 'ttl', 'records', 'names', 'addresses', 'applied', 'invalid')
+
+ ##@brief Инициализация пустой зоны
+ #@param [in] domain Домен имен клиентов, например "lan" (пустая строка - имена без домена)
+ #@param [in] ttl TTL записей A в секундах
+ #@exception ValueError Домен или TTL недопустимы
+    def __init__(self, domain='', ttl=60):
+        if not 0 <= ttl < 2**31:
+            raise ValueError(f"TTL {ttl} is out of range")
+        self.suffix = encode_domain_name(domain) if domain.strip('.') else b'\x00'
+        self.ttl = ttl
+        self.records = {}
+        self.names = {}
+        self.addresses = {}
+        self.applied = 0
+        self.invalid = 0
+
+ ##@brief Количество имен в зоне
+    def __len__(self):
+        return len(self.records)
+
+ ##@brief Применение пачки событий аренд
+ #@param [in] events Пары (адрес в 4 байтах, метка имени узла или None - адрес освобожден) в порядке поступления
+ #@return Количество измененных имен
+    def apply(self, events):
+        changed = set()
+        for address, label in dict(events).items():
+            previous = self.addresses.pop(address, None)
+            if previous is not None:
+                self.names[previous].remove(address)
+                changed.add(previous)
+            if label is None:
+                continue
+            if not 0 < len(label) < 64 or len(label) + 1 + len(self.suffix) > 255:
+                self.invalid += 1
+                continue
+            key = bytes((len(label),)) + label.lower() + self.suffix
+            self.addresses[address] = key
+            self.names.setdefault(key, []).append(address)
+            changed.add(key)
+        for key in changed:
+            addresses = self.names.get(key)
+            if addresses:
+                self.records[key] = (len(addresses), b''.join(DNS_A_RECORD.pack(0xC00C, 1, 1, self.ttl, 4) + address
+                                                              for address in addresses))
+            else:
+                self.names.pop(key, None)
+                self.records.pop(key, None)
+        self.applied += len(changed)
+        return len(changed)
+
+ ##@brief Поиск готового ответа по имени из вопроса
+ #@param [in] qname_key Имя в wire-формате в нижнем регистре
+ #@param [in] qtype Тип запроса
+ #@return Кортеж (ancount, answers) или None, если имени нет в зоне
+    def lookup(self, qname_key, qtype=QTYPE_A):
+        entry = self.records.get(qname_key)
+        if entry is None or qtype == QTYPE_A or qtype == QTYPE_ANY:
+            return entry
+        return (0, b'')
+
+##@class CompactZoneIndex
+##@brief Компактный индекс большой зоны с точным и wildcard-поиском
+#
+# Имена хранятся как ключи с обратным порядком меток ("com\0example\0www") в
+# одном отсортированном блоке байтов keys со смещениями key_offsets, поэтому
+# поддомены одной зоны лежат рядом. IPv4-адреса всех записей упакованы по 4 байта
+# в блок ips со смещениями ip_offsets, TTL - в массиве ttls. Каждый
+# INDEX_SAMPLE_STEP-й ключ дополнительно хранится в списке samples: bisect по
+# нему выбирает блок, внутри которого выполняется двоичный поиск по keys.
+# Ресурсные записи ответа собираются при поиске.
+class CompactZoneIndex:
+    __slots__ = ('keys', 'key_offsets', 'ttls', 'ips', 'ip_offsets', 'samples', 'has_wildcards')
+
+ ##@brief Построение индекса из пар (домен, запись)
+ # При повторе имени действует последняя запись, как при json.load.
+ #@param [in] records Итерируемый набор пар (домен, {"TTL":..., "IP":[...]})
+ #@return Объект CompactZoneIndex
+ #@exception ValueError Запись зоны некорректна
+    @classmethod
+    def from_records(cls, records):
+        keys = []
+        ttls = array('I')
+        ips = bytearray()
+        ip_offsets = array('I', [0])
+        for domain, site_array in records:
+            keys.append(b'\x00'.join(reversed(wire_labels(encode_domain_name(domain)))))
+            try:
+                ttl = int(site_array["TTL"])
+                packed = b''.join(socket.inet_aton(ip) for ip in site_array["IP"])
+            except (KeyError, TypeError, OSError) as e:
+                raise ValueError(f"invalid zone record {site_array!r}: {e}") from e
+            if not 0 <= ttl < 2**31:
+                raise ValueError(f"TTL {ttl} is out of range")
+            ttls.append(ttl)
+            ips += packed
+            ip_offsets.append(len(ips))
+
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        index = object.__new__(cls)
+        sorted_keys = bytearray()
+        index.key_offsets = array('I', [0])
+        index.ttls = array('I')
+        sorted_ips = bytearray()
+        index.ip_offsets = array('I', [0])
+        for position, number in enumerate(order):
+            if position + 1 < len(order) and keys[order[position + 1]] == keys[number]:
+                continue  #Повтор имени: остается последняя запись
+            sorted_keys += keys[number]
+            index.key_offsets.append(len(sorted_keys))
+            index.ttls.append(ttls[number])
+            sorted_ips += ips[ip_offsets[number]:ip_offsets[number + 1]]
+            index.ip_offsets.append(len(sorted_ips))
+        index.keys = bytes(sorted_keys)
+        index.ips = bytes(sorted_ips)
+        offsets = index.key_offsets
+        index.samples = [index.keys[offsets[number]:offsets[number + 1]]
+                         for number in range(0, len(index.ttls), INDEX_SAMPLE_STEP)]
+        index.has_wildcards = any(key == WILDCARD_LABEL or key.endswith(b'\x00' + WILDCARD_LABEL) for key in keys)
+        return index
+
+ ##@brief Загрузка индекса из JSON-файла зоны потоковым разбором
+ #@param [in] file_name Имя файла зоны
+ #@return Объект CompactZoneIndex
+ #@exception ValueError Файл зоны поврежден
+ #@exception OSError Файл зоны не удалось прочитать
+    @classmethod
+    def load(cls, file_name):
+        return cls.from_records(iter_zone_file(file_name))
+
+ ##@brief Количество доменов в индексе
+    def __len__(self):
+        return len(self.ttls)
+
+ ##@brief Двоичный поиск ключа
+ #@param [in] key Ключ с обратным порядком меток
+ #@return Номер записи или -1
+    def find(self, key):
+        keys = self.keys
+        offsets = self.key_offsets
+        block = bisect_right(self.samples, key) - 1
+        if block < 0:
+            return -1
+        low = block * INDEX_SAMPLE_STEP
+        high = min(low + INDEX_SAMPLE_STEP, len(self.ttls))
+        while low < high:
+            middle = (low + high) // 2
+            if keys[offsets[middle]:offsets[middle + 1]] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.ttls) and keys[offsets[low]:offsets[low + 1]] == key:
+            return low
+        return -1
+
+ ##@brief Поиск ответа по имени из вопроса
+ #@param [in] qname_key Имя в wire-формате в нижнем регистре
+ #@param [in] qtype Тип запроса
+ #@return Кортеж (ancount, answers) или None, если имя не принадлежит зоне
+    def lookup(self, qname_key, qtype=QTYPE_A):
+        labels = wire_labels(qname_key)
+        number = self.find(b'\x00'.join(reversed(labels)))
+        if number < 0 and self.has_wildcards:
+            for candidate in wildcard_candidates(labels):
+                number = self.find(b'\x00'.join(reversed(candidate)))
+                if number >= 0:
+                    break
+        if number < 0:
+            return None
+        if qtype != QTYPE_A and qtype != QTYPE_ANY:
+            return (0, b'')
+        header = DNS_A_RECORD.pack(0xC00C, 1, 1, self.ttls[number], 4)
+        ips = self.ips
+        start, end = self.ip_offsets[number], self.ip_offsets[number + 1]
+        return ((end - start) // 4, b''.join(header + ips[offset:offset + 4] for offset in range(start, end, 4)))
+
+
+##@brief Компиляция JSON-файла зоны в двоичный снимок
+#
+# Формат снимка (все числа в сетевом порядке байтов):
+# - заголовок SNAPSHOT_HEADER: "DNSZ", версия, флаги, число корзин (степень двойки), число записей;
+# - хеш-индекс: массив корзин SNAPSHOT_BUCKET со смещениями записей, открытая адресация
+#   с линейным пробированием по crc32 имени;
+# - записи: длина имени (1 байт), имя в wire-формате в нижнем регистре, ANCOUNT,
+#   длина и готовые ресурсные записи секции ответа.
+# Файл записывается во временный файл и атомарно заменяет прежний снимок.
+#@param [in] json_file Файл зоны domain_dns_name_ip.json
+#@param [in] snapshot_file Файл снимка
+#@return Количество записей в снимке
+#@exception ValueError Файл зоны поврежден
+def compile_zone_snapshot(json_file, snapshot_file):
+    entries = {}
+    for domain, site_array in iter_zone_file(json_file):
+        answers = encode_a_records(site_array)
+        if len(answers) > 0xFFFF:
+            raise ValueError(f"too many addresses for '{domain}'")
+        entries[encode_domain_name(domain)] = (len(site_array["IP"]), answers)
+    bucket_count = 1
+    while bucket_count < 2 * len(entries):
+        bucket_count *= 2
+    buckets = array('I', bytes(4 * bucket_count))
+    data = bytearray()
+    data_start = SNAPSHOT_HEADER.size + SNAPSHOT_BUCKET.size * bucket_count
+    flags = 0
+    for key, (ancount, answers) in entries.items():
+        if key[:2] == b'\x01' + WILDCARD_LABEL:
+            flags |= SNAPSHOT_HAS_WILDCARDS
+        bucket = zlib.crc32(key) & (bucket_count - 1)
+        while buckets[bucket]:
+            bucket = (bucket + 1) & (bucket_count - 1)
+        buckets[bucket] = data_start + len(data)
+        data.append(len(key))
+        data += key
+        data += SNAPSHOT_RECORD.pack(ancount, len(answers))
+        data += answers
+    if data_start + len(data) > 0xFFFFFFFF:
+        raise ValueError("zone is too large for a snapshot")
+    if sys.byteorder == 'little':
+        buckets.byteswap()
+    temporary_file = f"{snapshot_file}.tmp{os.getpid()}"
+    with open(temporary_file, 'wb') as file:
+        file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, flags, bucket_count, len(entries)))
+        file.write(buckets.tobytes())
+        file.write(data)
+    os.replace(temporary_file, snapshot_file)
+    return len(entries)
+
+
+##@class MappedZoneSnapshot
+##@brief Зона, отвечающая прямо из отображенного в память двоичного снимка
+#
+# При открытии читается только заголовок, поэтому время запуска не зависит от
+# размера зоны, а несколько процессов сервера разделяют одни и те же страницы
+# кэша файловой системы. Ответ возвращается как memoryview на данные снимка.
+class MappedZoneSnapshot:
+    __slots__ = ('map', 'view', 'flags', 'bucket_count', 'record_count', 'data_start')
+
+ #@param [in] file_name Файл снимка
+ #@exception ValueError Файл не является снимком зоны поддерживаемой версии
+ #@exception OSError Файл снимка не удалось открыть
+    def __init__(self, file_name):
+        with open(file_name, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < SNAPSHOT_HEADER.size:
+            raise ValueError(f"'{file_name}' is not a zone snapshot")
+        magic, version, self.flags, self.bucket_count, self.record_count = SNAPSHOT_HEADER.unpack_from(self.map, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"'{file_name}' is not a version {SNAPSHOT_VERSION} zone snapshot")
+        if not self.bucket_count or self.bucket_count & (self.bucket_count - 1):
+            raise ValueError(f"zone snapshot '{file_name}' has {self.bucket_count} buckets, not a power of two")
+        self.data_start = SNAPSHOT_HEADER.size + SNAPSHOT_BUCKET.size * self.bucket_count
+        if len(self.map) < self.data_start:
+            raise ValueError(f"zone snapshot '{file_name}' is truncated")
+        self.view = memoryview(self.map)
+
+ ##@brief Количество доменов в снимке
+    def __len__(self):
+        return self.record_count
+
+ ##@brief Поиск записи в хеш-индексе
+ # Пробирование ограничено числом корзин, а смещения записей проверяются по
+ # размеру файла: поврежденный или заполненный целиком снимок не зацикливает
+ # поиск и не приводит к чтению за концом отображения.
+ #@param [in] key Имя в wire-формате в нижнем регистре
+ #@return Смещение записи или 0
+    def find(self, key):
+        snapshot = self.map
+        mask = self.bucket_count - 1
+        bucket = zlib.crc32(key) & mask
+        for _ in range(self.bucket_count):
+            offset = SNAPSHOT_BUCKET.unpack_from(snapshot, SNAPSHOT_HEADER.size + SNAPSHOT_BUCKET.size * bucket)[0]
+            if not offset:
+                return 0
+            end = offset + 1 + len(key)
+            if offset >= self.data_start and end + SNAPSHOT_RECORD.size <= len(snapshot) and \
+                    snapshot[offset] == len(key) and snapshot[offset + 1:end] == key:
+                return offset
+            bucket = (bucket + 1) & mask
+        return 0
+
+ ##@brief Поиск ответа по имени из вопроса
+ #@param [in] qname_key Имя в wire-формате в нижнем регистре
+ #@param [in] qtype Тип запроса
+ #@return Кортеж (ancount, answers) или None, если имя не принадлежит зоне
+    def lookup(self, qname_key, qtype=QTYPE_A):
+        offset = self.find(qname_key)
+        if not offset and self.flags & SNAPSHOT_HAS_WILDCARDS:
+            for labels in wildcard_candidates(wire_labels(qname_key)):
+                offset = self.find(b''.join(bytes([len(label)]) + label for label in labels) + b'\x00')
+                if offset:
+                    break
+        if not offset:
+            return None
+        if qtype != QTYPE_A and qtype != QTYPE_ANY:
+            return (0, b'')
+        start = offset + 1 + self.map[offset] + SNAPSHOT_RECORD.size
+        ancount, length = SNAPSHOT_RECORD.unpack_from(self.map, start - SNAPSHOT_RECORD.size)
+        return (ancount, self.view[start:start + length])
+
+
+##@brief Загрузчики зоны по виду индекса (параметр DNS_ZONE_INDEX)
+ZONE_INDEXES = {
+    "dict": DnsZone.load,
+    "compact": CompactZoneIndex.load,
+    "snapshot": MappedZoneSnapshot
+}
+
+##@brief Загрузка зоны из JSON-файла в выбранный вид индекса
+#@param [in] file_name Имя файла зоны
+#@param [in] index Вид индекса: "dict" (готовые ответы), "compact" (для очень больших зон)
+# или "snapshot" (file_name - двоичный снимок, см. compile_zone_snapshot)
+#@return Объект зоны с методом lookup(qname_key, qtype)
+#@exception ValueError Файл зоны поврежден или вид индекса неизвестен
+def load_zone(file_name, index="dict"):
+    if index not in ZONE_INDEXES:
+        raise ValueError(f"unknown zone index '{index}'")
+    return ZONE_INDEXES[index](file_name)
+
+
+##@class ZoneFileWatcher
+##@brief Фоновое отслеживание файла зоны и перезагрузка без остановки сервера
+#
+# Поток периодически сравнивает время изменения, размер и inode файла зоны.
+# При изменении новая зона строится целиком в фоне и передается в on_reload,
+# который заменяет ссылку на зону одним присваиванием: запросы видят либо
+# старую, либо новую зону. Поврежденный файл отклоняется, старая зона остается.
+class ZoneFileWatcher(threading.Thread):
+ #@param [in] file_name Файл зоны
+ #@param [in] on_reload Функция, получающая новую зону
+ #@param [in] log Функция логирования
+ #@param [in] interval Период проверки файла в секундах
+ #@param [in] loader Функция загрузки зоны из файла (по умолчанию DnsZone.load)
+    def __init__(self, file_name, on_reload, log, interval=1.0, loader=None):
+        super().__init__(name="zone-watcher", daemon=True)
+        self.file_name = file_name
+        self.on_reload = on_reload
+        self.log = log
+        self.interval = interval
+        self.loader = loader or DnsZone.load
+        self.stop_event = threading.Event()
+        self.signature = self.file_signature()
+
+ ##@brief Подпись файла для обнаружения изменений
+ #@return Кортеж (mtime, размер, inode) или None, если файл недоступен
+    def file_signature(self):
+        try:
+            stat = os.stat(self.file_name)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.check()
+
+ ##@brief Проверка файла и перезагрузка зоны при изменении
+ #@return True, если зона была заменена
+    def check(self):
+        signature = self.file_signature()
+        if signature is None or signature == self.signature:
+            return False
+        self.signature = signature
+        started = time.perf_counter()
+        try:
+            zone = self.loader(self.file_name)
+        except (OSError, ValueError) as e:
+            self.log(f"Zone reload of '{self.file_name}' rejected, keeping the previous zone: {e}")
+            return False
+        self.on_reload(zone)
+        self.log(f"Zone reloaded from '{self.file_name}': {len(zone)} records in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return True
+
+ ##@brief Остановка потока
+    def stop(self):
+        self.stop_event.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DNS zone tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compile_parser = commands.add_parser("compile", help="compile a JSON zone into a binary snapshot for mmap")
+    compile_parser.add_argument("json_file", nargs="?", default="domain_dns_name_ip.json")
+    compile_parser.add_argument("snapshot_file", nargs="?", default="domain_dns_name_ip.bin")
+    args = parser.parse_args()
+    if args.command == "compile":
+        started = time.perf_counter()
+        records = compile_zone_snapshot(args.json_file, args.snapshot_file)
+        print(f"{args.snapshot_file}: {records} records in {time.perf_counter() - started:.2f} s")
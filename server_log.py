@@ -0,0 +1,214 @@
+##@file server_log.py
+##@brief Асинхронное пакетное логирование для DHCP- и DNS-серверов.
+#
+# Серверы не пишут в файл на пути обработки пакета: запись помещается в
+# ограниченную очередь, а фоновый поток забирает накопленные записи и пишет их
+# в файл одной операцией. Если очередь заполнена, запись отбрасывается и
+# учитывается в счетчике dropped, поэтому логирование никогда не блокирует
+# обработку пакетов. Форматирование сообщения и времени выполняется в фоновом
+# потоке. Поддерживаются фильтрация по уровню, выборочное логирование пакетов
+# и ротация файла по размеру.
+
+import datetime
+##@package datetime
+#Модуль для работы с датой и временем.
+
+import os
+##@package os
+#Модуль для работы с файловой системой (ротация файлов лога).
+
+import threading
+##@package threading
+#Модуль для фонового потока записи лога.
+
+import time
+##@package time
+#Модуль для получения времени создания записи.
+
+from collections import deque
+##@package collections
+#Модуль с очередью deque (потокобезопасные append/popleft).
+
+
+##@brief Уровни записей лога
+LOG_DEBUG = 10
+LOG_INFO = 20
+LOG_WARNING = 30
+LOG_ERROR = 40
+##@brief Уровни лога по именам в configuration.json (LOG_LEVEL)
+LOG_LEVELS = {"debug": LOG_DEBUG, "info": LOG_INFO, "warning": LOG_WARNING, "error": LOG_ERROR}
+
+
+##@class BatchLogger
+##@brief Лог с ограниченной очередью и фоновой пакетной записью в файл
+class BatchLogger:
+ #@param [in] file_name Файл лога
+ #@param [in] level Минимальный уровень записываемых сообщений
+ #@param [in] packet_sample Логировать каждый N-й пакет (0 - не логировать пакеты)
+ #@param [in] queue_size Максимальное количество записей, ожидающих записи в файл
+ #@param [in] batch_size Количество записей, при котором фоновый поток будится досрочно
+ #@param [in] flush_interval Максимальная задержка записи в файл в секундах
+ #@param [in] max_bytes Размер файла, после которого он ротируется (0 - без ротации)
+ #@param [in] backups Количество хранимых старых файлов (file.1 ... file.N)
+    def __init__(self, file_name, level=LOG_INFO, packet_sample=100, queue_size=10000, batch_size=256,
+                 flush_interval=0.5, max_bytes=10 * 1024 * 1024, backups=3):
+        self.file_name = file_name
+        self.level = level
+        self.packet_sample = packet_sample
+        self.packet_counter = 0
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.records = deque()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.file = None
+        self.written = 0
+        self.dropped = 0
+        self.reported_dropped = 0
+        self.rotations = 0
+        self.second = None
+        self.second_text = ''
+        self.thread = threading.Thread(target=self.run, name=f"log:{file_name}", daemon=True)
+        self.thread.start()
+
+ ##@brief Создание лога по параметрам LOG_* из configuration.json
+ # По умолчанию уровень info: пакеты не логируются; при уровне debug - каждый сотый.
+ #@param [in] file_name Файл лога
+ #@param [in] configuration Словарь конфигурации (может быть None)
+ #@return Экземпляр BatchLogger
+    @classmethod
+    def from_configuration(cls, file_name, configuration):
+        configuration = configuration or {}
+        return cls(file_name,
+                   level=LOG_LEVELS.get(str(configuration.get('LOG_LEVEL', 'info')).lower(), LOG_INFO),
+                   packet_sample=int(configuration.get('LOG_PACKET_SAMPLE', 100)),
+                   queue_size=int(configuration.get('LOG_QUEUE_SIZE', 10000)),
+                   max_bytes=int(configuration.get('LOG_MAX_BYTES', 10 * 1024 * 1024)),
+                   backups=int(configuration.get('LOG_BACKUPS', 3)))
+
+ ##@brief Постановка записи в очередь
+ # Если переданы args, сообщение форматируется как message % args в фоновом
+ # потоке; аргументы должны быть неизменяемыми (например, bytes, а не memoryview).
+ #@param [in] level Уровень записи
+ #@param [in] message Текст сообщения
+ #@param [in] args Аргументы для отложенного форматирования
+ #@return True, если запись принята в очередь
+    def log(self, level, message, *args):
+        if level < self.level:
+            return False
+        record = (time.time(), message, args)
+        if self.closed:
+            self.write_records([record])
+            return True
+        if len(self.records) >= self.queue_size:
+            self.dropped += 1
+            return False
+        self.records.append(record)
+        if len(self.records) >= self.batch_size:
+            self.wakeup.set()
+        return True
+
+ ##@brief Нужно ли логировать очередной пакет (уровень debug и выборка LOG_PACKET_SAMPLE)
+ #@return True для каждого packet_sample-го пакета
+    def sample_packet(self):
+        if self.level > LOG_DEBUG or self.packet_sample <= 0:
+            return False
+        self.packet_counter += 1
+        if self.packet_counter < self.packet_sample:
+            return False
+        self.packet_counter = 0
+        return True
+
+ ##@brief Тело фонового потока: запись накопленных записей пачками
+    def run(self):
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.drain()
+        self.drain()
+
+ ##@brief Запись всех записей из очереди
+    def drain(self):
+        records = []
+        while self.records:
+            records.append(self.records.popleft())
+        if self.dropped != self.reported_dropped:
+            records.append((time.time(), "%d log records dropped: log queue is full", (self.dropped - self.reported_dropped,)))
+            self.reported_dropped = self.dropped
+        if records:
+            self.write_records(records)
+
+ ##@brief Форматирование и запись пачки записей одним вызовом write
+ #@param [in] records Список записей (время, сообщение, аргументы)
+    def write_records(self, records):
+        lines = []
+        for created, message, args in records:
+            second = int(created)
+            if second != self.second:
+                self.second = second
+                self.second_text = datetime.datetime.fromtimestamp(second).strftime('%Y-%m-%d %H:%M:%S')
+            if args:
+                try:
+                    message = message % args
+                except (TypeError, ValueError):
+                    message = f"{message} {args!r}"
+            lines.append(f"{self.second_text}: {message}\n")
+        try:
+            self.open_file()
+            self.file.write(''.join(lines))
+            self.file.flush()
+            self.written += len(lines)
+            if self.max_bytes and self.file.tell() >= self.max_bytes:
+                self.rotate()
+        except OSError:
+            self.dropped += len(lines)
+
+ ##@brief Открытие файла лога; файл переоткрывается, если его ротировал другой процесс
+    def open_file(self):
+        if self.file is not None:
+            try:
+                if os.stat(self.file_name).st_ino == os.fstat(self.file.fileno()).st_ino:
+                    return
+            except FileNotFoundError:
+                pass
+            self.file.close()
+        self.file = open(self.file_name, 'a+')
+
+ ##@brief Ротация: file -> file.1 -> ... -> file.N (самый старый файл удаляется)
+    def rotate(self):
+        self.file.close()
+        self.file = None
+        if self.backups > 0:
+            for number in range(self.backups - 1, 0, -1):
+                source = f"{self.file_name}.{number}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.file_name}.{number + 1}")
+            os.replace(self.file_name, f"{self.file_name}.1")
+        else:
+            os.remove(self.file_name)
+        self.rotations += 1
+
+ ##@brief Остановка фонового потока с записью оставшихся записей
+ # После закрытия записи пишутся в файл сразу в вызывающем потоке.
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        self.thread.join()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+ ##@brief Метрики лога
+ #@return Словарь с длиной очереди и счетчиками записанных, отброшенных записей и ротаций
+    def stats(self):
+        return {
+            "queued": len(self.records),
+            "written": self.written,
+            "dropped": self.dropped,
+            "rotations": self.rotations
+        }
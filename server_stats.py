@@ -0,0 +1,319 @@
+##@file server_stats.py
+##@brief Счетчики, гистограммы задержек и локальная точка чтения метрик серверов.
+#
+# Серверы считают события в ServerStats и замеряют этапы обработки пакета в
+# LatencyHistogram. StatsEndpoint отвечает на датаграмму, присланную на
+# локальный UDP-адрес или Unix-сокет: запрос "json" (или пустой) возвращает
+# метрики в JSON, запрос "prometheus" - в текстовом формате Prometheus.
+#
+# Запрос метрик: python3 server_stats.py 127.0.0.1:5380 [json|prometheus]
+
+import argparse
+##@package argparse
+#Модуль для разбора аргументов командной строки (клиент точки метрик).
+
+import json
+##@package json
+#Модуль для сериализации метрик в JSON.
+
+import os
+##@package os
+#Модуль для работы с файловой системой (Unix-сокеты).
+
+import socket
+##@package socket
+#Модуль для работы с сетевыми сокетами.
+
+import tempfile
+##@package tempfile
+#Модуль для адреса ответа клиента Unix-сокета.
+
+import threading
+##@package threading
+#Модуль для фонового потока точки метрик.
+
+import time
+##@package time
+#Модуль для замеров времени.
+
+
+##@brief Число подинтервалов на каждую степень двойки (точность гистограммы около 6%)
+HISTOGRAM_SUB_BUCKETS = 16
+##@brief Количество корзин гистограммы (значения до 2**40 нс, около 18 минут)
+HISTOGRAM_BUCKETS = HISTOGRAM_SUB_BUCKETS * 38
+##@brief Процентили, выдаваемые в метриках
+HISTOGRAM_PERCENTILES = (50, 90, 99, 99.9)
+##@brief Максимальный размер запроса и ответа точки метрик
+STATS_DATAGRAM_SIZE = 65507
+
+
+##@class LatencyHistogram
+##@brief Гистограмма задержек в наносекундах с логарифмически-линейными корзинами (в духе HdrHistogram)
+#
+# Значения меньше HISTOGRAM_SUB_BUCKETS хранятся точно, остальные попадают в
+# одну из HISTOGRAM_SUB_BUCKETS корзин своей степени двойки. Запись - это
+# вычисление индекса по bit_length и увеличение счетчика в списке.
+class LatencyHistogram:
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+ ##@brief Учет одного замера
+ #@param [in] value Задержка в наносекундах
+    def record(self, value):
+        if value < HISTOGRAM_SUB_BUCKETS:
+            index = value if value > 0 else 0
+        else:
+            shift = value.bit_length() - 5
+            index = HISTOGRAM_SUB_BUCKETS * (shift + 1) + (value >> shift) - HISTOGRAM_SUB_BUCKETS
+            if index >= HISTOGRAM_BUCKETS:
+                index = HISTOGRAM_BUCKETS - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+ ##@brief Добавление замеров другой гистограммы (например, из другого процесса)
+ #@param [in] other LatencyHistogram
+    def merge(self, other):
+        counts = self.counts
+        for index, bucket in enumerate(other.counts):
+            if bucket:
+                counts[index] += bucket
+        self.count += other.count
+        self.total += other.total
+        if other.max > self.max:
+            self.max = other.max
+
+ ##@brief Середина диапазона значений корзины
+ #@param [in] index Индекс корзины
+ #@return Значение в наносекундах
+    @staticmethod
+    def bucket_value(index):
+        if index < HISTOGRAM_SUB_BUCKETS:
+            return index
+        shift = index // HISTOGRAM_SUB_BUCKETS - 1
+        lower = (HISTOGRAM_SUB_BUCKETS + index % HISTOGRAM_SUB_BUCKETS) << shift
+        return lower + (1 << shift) // 2
+
+ ##@brief Сводка гистограммы
+ #@return Словарь с количеством, суммой, средним, максимумом и процентилями в наносекундах
+    def summary(self):
+        counts = list(self.counts)
+        count = sum(counts)
+        result = {"count": count, "sum": self.total, "mean": round(self.total / count) if count else 0, "max": self.max}
+        targets = [(percent, count * percent / 100) for percent in HISTOGRAM_PERCENTILES]
+        seen = 0
+        position = 0
+        for index, bucket in enumerate(counts):
+            if not bucket:
+                continue
+            seen += bucket
+            while position < len(targets) and seen >= targets[position][1]:
+                result[f"p{targets[position][0]:g}"] = min(self.bucket_value(index), self.max)
+                position += 1
+        for percent, _ in targets[position:]:
+            result[f"p{percent:g}"] = 0
+        return result
+
+
+##@class ServerStats
+##@brief Набор метрик сервера: счетчики, гистограммы задержек этапов и показатели-функции
+class ServerStats:
+ #@param [in] prefix Префикс имен метрик Prometheus ("dns" или "dhcp")
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+ ##@brief Увеличение счетчика
+ #@param [in] name Имя счетчика
+ #@param [in] value Приращение
+    def increment(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+ ##@brief Гистограмма этапа обработки (создается при первом обращении)
+ #@param [in] name Имя этапа
+ #@return LatencyHistogram
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        return histogram
+
+ ##@brief Регистрация показателя, значение которого вычисляется при чтении метрик
+ #@param [in] name Имя показателя
+ #@param [in] function Функция без аргументов, возвращающая число
+    def gauge(self, name, function):
+        self.gauges[name] = function
+
+ ##@brief Снимок всех метрик
+ #@return Словарь {"uptime", "counters", "gauges", "latency_ns"}
+    def snapshot(self):
+        gauges = {}
+        for name, function in list(self.gauges.items()):
+            try:
+                gauges[name] = function()
+            except Exception:
+                gauges[name] = None
+        return {
+            "uptime": round(time.time() - self.started, 3),
+            "counters": dict(self.counters),
+            "gauges": gauges,
+            "latency_ns": {name: histogram.summary() for name, histogram in list(self.histograms.items())}
+        }
+
+ ##@brief Метрики в текстовом формате Prometheus
+ # Гистограммы выдаются как summary с квантилями в секундах.
+ #@return Строка
+    def prometheus(self):
+        snapshot = self.snapshot()
+        prefix = self.prefix
+        lines = [f"# TYPE {prefix}_uptime_seconds gauge", f"{prefix}_uptime_seconds {snapshot['uptime']}",
+                 f"# TYPE {prefix}_events_total counter"]
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f'{prefix}_events_total{{event="{name}"}} {value}')
+        for name, value in sorted(snapshot["gauges"].items()):
+            if value is not None:
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {value}")
+        lines.append(f"# TYPE {prefix}_stage_latency_seconds summary")
+        for name, summary in sorted(snapshot["latency_ns"].items()):
+            for percent in HISTOGRAM_PERCENTILES:
+                lines.append(f'{prefix}_stage_latency_seconds{{stage="{name}",quantile="{percent / 100:g}"}} '
+                             f'{summary[f"p{percent:g}"] / 1e9:.9f}')
+            lines.append(f'{prefix}_stage_latency_seconds_sum{{stage="{name}"}} {summary["sum"] / 1e9:.9f}')
+            lines.append(f'{prefix}_stage_latency_seconds_count{{stage="{name}"}} {summary["count"]}')
+        return '\n'.join(lines) + '\n'
+
+ ##@brief Ответ на запрос точки метрик
+ #@param [in] request Текст запроса ("json", "prometheus" или пустой)
+ #@return Ответ в байтах
+    def render(self, request):
+        if request.strip().lower() in ("prometheus", "metrics"):
+            return self.prometheus().encode('utf-8')
+        return json.dumps(self.snapshot()).encode('utf-8')
+
+
+##@brief Разбор адреса точки метрик
+#@param [in] value "host:port" для UDP или путь к Unix-сокету (начинается с "/" или ".")
+#@return Кортеж (семейство адресов, адрес)
+def parse_stats_address(value):
+    if value.startswith(('/', '.')):
+        return socket.AF_UNIX, value
+    host, _, port = value.rpartition(':')
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+##@brief Адрес точки метрик рабочего процесса: к UDP-порту прибавляется номер, к пути - суффикс
+#@param [in] value Адрес из конфигурации
+#@param [in] number Номер рабочего процесса (0 - адрес без изменений)
+#@return Адрес в виде строки
+def worker_stats_address(value, number):
+    if not value or not number:
+        return value
+    family, address = parse_stats_address(value)
+    if family == socket.AF_UNIX:
+        return f"{value}.{number}"
+    return f"{address[0]}:{address[1] + number}"
+
+
+##@class StatsEndpoint
+##@brief Фоновый поток, отвечающий метриками на датаграммы
+class StatsEndpoint(threading.Thread):
+ #@param [in] stats ServerStats
+ #@param [in] address Адрес точки метрик ("host:port" или путь к Unix-сокету)
+ #@param [in] log Функция логирования
+    def __init__(self, stats, address, log):
+        super().__init__(name="stats-endpoint", daemon=True)
+        self.stats = stats
+        self.address = address
+        self.log = log
+        self.stop_event = threading.Event()
+        family, self.bind_address = parse_stats_address(address)
+        self.socket = socket.socket(family, socket.SOCK_DGRAM)
+        if family == socket.AF_UNIX and os.path.exists(self.bind_address):
+            os.remove(self.bind_address)
+        self.socket.bind(self.bind_address)
+        self.socket.settimeout(0.5)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                request, addr = self.socket.recvfrom(STATS_DATAGRAM_SIZE)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if not addr:
+                continue
+            try:
+                self.socket.sendto(self.stats.render(request.decode('utf-8', 'replace'))[:STATS_DATAGRAM_SIZE], addr)
+            except OSError as e:
+                self.log(f"Stats reply to {addr} failed: {e}")
+
+ ##@brief Остановка потока и закрытие сокета
+    def stop(self):
+        self.stop_event.set()
+        self.join(1.0)
+        self.socket.close()
+        if self.socket.family == socket.AF_UNIX and os.path.exists(self.bind_address):
+            os.remove(self.bind_address)
+
+
+##@brief Запуск точки метрик, если адрес задан
+#@param [in] stats ServerStats
+#@param [in] address Адрес точки метрик (пустая строка или None - отключено)
+#@param [in] log Функция логирования
+#@return Запущенный StatsEndpoint или None
+def start_stats_endpoint(stats, address, log):
+    if not address:
+        return None
+    try:
+        endpoint = StatsEndpoint(stats, address, log)
+    except OSError as e:
+        log(f"Stats endpoint {address} is not available: {e}")
+        return None
+    endpoint.start()
+    log(f"Stats endpoint is listening on {address}")
+    return endpoint
+
+##@brief Запрос метрик у точки метрик
+#@param [in] address Адрес точки метрик
+#@param [in] request "json" или "prometheus"
+#@param [in] timeout Таймаут ожидания ответа в секундах
+#@return Ответ в виде строки
+def query_stats(address, request="json", timeout=1.0):
+    family, target = parse_stats_address(address)
+    client = socket.socket(family, socket.SOCK_DGRAM)
+    client_path = None
+    try:
+        if family == socket.AF_UNIX:
+            client_path = os.path.join(tempfile.gettempdir(), f"stats-client-{os.getpid()}.sock")
+            if os.path.exists(client_path):
+                os.remove(client_path)
+            client.bind(client_path)
+        client.settimeout(timeout)
+        client.sendto(request.encode('utf-8'), target)
+        return client.recv(STATS_DATAGRAM_SIZE).decode('utf-8')
+    finally:
+        client.close()
+        if client_path is not None and os.path.exists(client_path):
+            os.remove(client_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read DHCP/DNS server metrics")
+    parser.add_argument("address", help="stats endpoint: host:port or Unix socket path")
+    parser.add_argument("format", nargs="?", choices=("json", "prometheus"), default="json")
+    args = parser.parse_args()
+    reply = query_stats(args.address, args.format)
+    if args.format == "json":
+        reply = json.dumps(json.loads(reply), indent=4)
+    print(reply)